@@ -0,0 +1,141 @@
+# backfill.py
+# Rebuilds the catalog from the database channel history, resuming from the last checkpoint.
+# Run from a shell, it only writes to Mongo: a bot that is already running keeps its in-memory search index
+# and cached results, so the new videos aren't searchable until it restarts. Prefer /backfill in the bot.
+# Usage: python backfill.py [--reset] [--user] [--batch-size N] [--concurrency N]
+import argparse
+import asyncio
+import time
+from collections import deque
+from database import run_db, save_videos, get_checkpoint, save_checkpoint
+from ingestion import build_video_doc
+from catalog import apply_catalog_change
+from utils import logger
+from config import BACKFILL_BATCH_SIZE, BACKFILL_CONCURRENCY, BACKFILL_EMPTY_CHUNKS
+
+CHECKPOINT_NAME = "database_channel_backfill"
+FETCH_CHUNK = 100
+
+
+async def iter_channel_chunks(client, channel, min_id, concurrency):
+    # Yields lists of messages in id order
+    if not await client.is_bot():
+        chunk = []
+        async for message in client.iter_messages(channel, min_id=min_id, reverse=True):
+            chunk.append(message)
+            if len(chunk) >= FETCH_CHUNK:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+        return
+    # Bots can't read channel history, only fetch by id; scan ahead until a long run of empty ids
+    next_id = min_id + 1
+    empty = 0
+    while empty < BACKFILL_EMPTY_CHUNKS:
+        starts = [next_id + i * FETCH_CHUNK for i in range(concurrency)]
+        results = await asyncio.gather(*(
+            client.get_messages(channel, ids=list(range(start, start + FETCH_CHUNK))) for start in starts
+        ))
+        for start, messages in zip(starts, results):
+            messages = [message for message in messages if message is not None]
+            empty = 0 if messages else empty + 1
+            if empty >= BACKFILL_EMPTY_CHUNKS:
+                # Indistinguishable from a deleted range this long; the checkpoint stays at the last message seen
+                logger.info(
+                    "Backfill scan stopped after %s empty ids (%s-%s); raise BACKFILL_EMPTY_CHUNKS if a longer range "
+                    "was deleted", BACKFILL_EMPTY_CHUNKS * FETCH_CHUNK,
+                    start + FETCH_CHUNK * (1 - BACKFILL_EMPTY_CHUNKS), start + FETCH_CHUNK - 1
+                )
+                return
+            yield messages
+        next_id += concurrency * FETCH_CHUNK
+
+
+async def backfill(client, channel, videos_collection, checkpoints_collection, batch_size=BACKFILL_BATCH_SIZE,
+                   concurrency=BACKFILL_CONCURRENCY, reset=False):
+    start_id = 0 if reset else await run_db(get_checkpoint, checkpoints_collection, CHECKPOINT_NAME)
+    logger.info("Backfill starting after message %s (batch %s, concurrency %s)", start_id, batch_size, concurrency)
+    started = time.perf_counter()
+    stats = {"scanned": 0, "videos": 0, "last_id": start_id}
+    pending = deque()
+
+    async def write(docs, last_id):
+        if docs:
+            await run_db(save_videos, videos_collection, docs)
+        return docs, last_id
+
+    async def settle_oldest():
+        # Batches are settled in order, so the checkpoint never passes an unwritten batch
+        docs, last_id = await pending.popleft()
+        if docs:
+            apply_catalog_change(added=docs, reset=True)
+        stats["videos"] += len(docs)
+        stats["last_id"] = last_id
+        elapsed = time.perf_counter() - started
+        await run_db(save_checkpoint, checkpoints_collection, CHECKPOINT_NAME, last_id, videos=stats["videos"])
+        logger.info("Backfill: %s videos, %s messages scanned, up to %s (%.0f msg/s)",
+                    stats["videos"], stats["scanned"], last_id, stats["scanned"] / elapsed)
+
+    batch = []
+    last_id = start_id
+    async for messages in iter_channel_chunks(client, channel, start_id, concurrency):
+        if not messages:
+            continue
+        # Checkpoint the last message actually seen, never the end of an empty id range still to be filled
+        last_id = messages[-1].id
+        stats["scanned"] += len(messages)
+        batch.extend(doc for doc in map(build_video_doc, messages) if doc)
+        if len(batch) >= batch_size:
+            pending.append(asyncio.ensure_future(write(batch, last_id)))
+            batch = []
+            while len(pending) >= concurrency:
+                await settle_oldest()
+    pending.append(asyncio.ensure_future(write(batch, last_id)))
+    while pending:
+        await settle_oldest()
+
+    stats["elapsed"] = time.perf_counter() - started
+    stats["rate"] = stats["scanned"] / stats["elapsed"] if stats["elapsed"] else 0.0
+    logger.info("Backfill finished: %s videos from %s messages in %.1fs", stats["videos"], stats["scanned"], stats["elapsed"])
+    return stats
+
+
+async def main():
+    from telethon import TelegramClient
+    from database import get_videos_collection, get_checkpoints_collection, close_client
+    from config import API_ID, API_HASH, BOT_TOKEN, DATABASE_CHANNEL_ID, MONGO_URI
+    from logs import setup_logging, stop_logging
+
+    parser = argparse.ArgumentParser(description="Backfill the video catalog from the database channel (a running bot needs a restart to see the result)")
+    parser.add_argument("--reset", action="store_true", help="ignore the checkpoint and reindex from the first message")
+    parser.add_argument("--user", action="store_true", help="log in as a user to stream history with iter_messages")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY)
+    args = parser.parse_args()
+
+    # The bot configures logging in bot.py; run standalone, nothing would print INFO progress otherwise
+    setup_logging()
+    try:
+        client = TelegramClient("backfill_session", API_ID, API_HASH)
+        await (client.start() if args.user else client.start(bot_token=BOT_TOKEN))
+        try:
+            await backfill(
+                client,
+                DATABASE_CHANNEL_ID,
+                get_videos_collection(MONGO_URI),
+                get_checkpoints_collection(MONGO_URI),
+                batch_size=args.batch_size,
+                concurrency=args.concurrency,
+                reset=args.reset
+            )
+        finally:
+            await client.disconnect()
+            close_client()
+        logger.warning("Restart the bot to make these videos searchable, or run /backfill from the bot next time")
+    finally:
+        stop_logging()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,42 @@
+# benchmarks/bench_classifier.py
+# Compares the old per-post caption classification (regex lists, two searches per quality pattern)
+# with the precompiled classifier used by ingestion, and checks they agree on every caption.
+# Usage: python -m benchmarks.bench_classifier [caption_count]
+import random
+import re
+import sys
+import time
+from ingestion import classify_caption
+from benchmarks.bench_search_index import synthetic_caption
+
+
+def legacy_classify(caption):
+    series_patterns = [r'E\d+', r'S\d+', r'S\d+E\d+']
+    category = "series" if any(re.search(pattern, caption, re.IGNORECASE) for pattern in series_patterns) else "movie"
+    quality_patterns = [r'2160[Pp]', r'1080[Pp]', r'720[Pp]', r'480[Pp]']
+    quality = next((re.search(pattern, caption, re.IGNORECASE).group().lower() for pattern in quality_patterns if re.search(pattern, caption, re.IGNORECASE)), "unknown")
+    return category, quality
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = random.Random(42)
+    captions = [synthetic_caption(rng, i) for i in range(count)]
+    # A few shapes the synthetic titles don't cover: no quality, several qualities, lowercase markers
+    captions += ["Inception 2010 Hindi.mkv", "Dark s01e01 720P 1080p Dual.mkv", "Jawan 480p 2160P HDR.mkv", ""]
+
+    timings = {}
+    for name, classify in (("legacy", legacy_classify), ("compiled", classify_caption)):
+        started = time.perf_counter()
+        results = [classify(caption) for caption in captions]
+        timings[name] = (time.perf_counter() - started, results)
+
+    legacy_time, legacy_results = timings["legacy"]
+    compiled_time, compiled_results = timings["compiled"]
+    assert legacy_results == compiled_results, "classifiers disagree"
+    print(f"{len(captions)} captions: legacy={legacy_time * 1e6 / len(captions):.2f}us/caption "
+          f"compiled={compiled_time * 1e6 / len(captions):.2f}us/caption speedup={legacy_time / compiled_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/bench_deep_link_burst.py
+# Fires a burst of identical /start <deep link> events at the real /start handler through a fake
+# Telegram client, with mongomock as the catalog and a local stub TMDB server, and reports how many
+# Mongo searches and TMDB lookups actually ran. tests/test_deep_link_burst.py runs the same burst.
+# Usage: python -m benchmarks.bench_deep_link_burst [events]
+from benchmarks.fakes import FakeClient, FakeEvent, tmdb_stub
+import asyncio
+import sys
+import time
+import mongomock
+from handlers.user import register_user_handlers
+from handlers.common import search_flight
+from search_cache import search_cache
+from search_index import search_index, caption_tokens, rank_features
+from tmdb import tmdb_client
+from utils import generate_deep_link
+
+
+async def run_burst(burst):
+    # Returns the counts for this burst alone; the single-flight counters are process-wide
+    db = mongomock.MongoClient().db
+    videos, users = db.videos, db.users
+    docs = []
+    for i in range(1, 2001):
+        caption = f"Mirzapur S{i % 3 + 1:02d}E{i % 10 + 1:02d} {['1080p', '720p'][i % 2]} Hindi #{i}.mkv"
+        docs.append({"_id": i, "caption": caption, "file_size": "1.00 GB", "category": "series",
+                     "quality": ["1080p", "720p"][i % 2], "tokens": caption_tokens(caption), "rank": rank_features(caption)})
+    videos.insert_many(docs)
+    users.insert_many([{"_id": user_id, "privacy_policy_accepted": True} for user_id in range(burst)])
+    search_index.load(videos)
+    search_cache.invalidate_all()
+
+    client = FakeClient()
+    register_user_handlers(client, videos, users)
+    start_handler = client.handler("start_handler")
+    encoded = generate_deep_link("bot", "Mirzapur s01").split("start=")[1]
+    events_ = [FakeEvent(user_id, text=f"/start {encoded}") for user_id in range(burst)]
+
+    searches, shared_searches = search_flight.executed, search_flight.shared
+    lookups, shared_lookups = tmdb_client.flight.executed, tmdb_client.flight.shared
+    tmdb_requests = []
+    runner = await tmdb_stub(tmdb_requests)
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(start_handler(event) for event in events_))
+        elapsed = time.perf_counter() - started
+    finally:
+        await tmdb_client.close()
+        await runner.cleanup()
+    return {
+        "answered": sum(1 for event in events_ if event.replies),
+        "elapsed": elapsed,
+        "searches": search_flight.executed - searches,
+        "shared_searches": search_flight.shared - shared_searches,
+        "lookups": tmdb_client.flight.executed - lookups,
+        "shared_lookups": tmdb_client.flight.shared - shared_lookups,
+        "http_requests": len(tmdb_requests)
+    }
+
+
+async def main():
+    burst = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    stats = await run_burst(burst)
+    print(f"{burst} deep-link events answered={stats['answered']} in {stats['elapsed']:.2f}s")
+    print(f"mongo searches executed={stats['searches']} shared={stats['shared_searches']}")
+    print(f"tmdb lookups executed={stats['lookups']} shared={stats['shared_lookups']} http requests={stats['http_requests']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
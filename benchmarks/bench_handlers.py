@@ -0,0 +1,183 @@
+# benchmarks/bench_handlers.py
+# Drives the real message and callback handlers through a fake Telegram client against a seeded catalog
+# (mongomock, or a local mongod with --mongo-uri) and a stub TMDB server. Reports p50/p95/p99 latency and
+# throughput for search, paging, filter and quality toggles and file selection, and saves the run as JSON.
+# --logging sync writes every record from the event loop (the old basicConfig setup), --logging queue uses the
+# bot's listener thread and sampling; redirect stderr to a file when comparing them.
+# Usage: python -m benchmarks.bench_handlers [--videos N] [--ops N] [--concurrency N] [--mongo-uri URI]
+#                                            [--output results.json] [--compare baseline.json] [--threshold 0.1]
+#                                            [--logging off|sync|queue]
+from benchmarks.fakes import (
+    FakeClient, FakeEvent, get_collections, seed_catalog, seed_users, tmdb_stub, summarize
+)
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from handlers.common import register_common_handlers
+from handlers.user import register_user_handlers
+from search_index import search_index
+from tmdb import tmdb_client
+from sender import sender
+from ingestion import ingest_pipeline
+from logs import setup_logging, stop_logging, TEXT_FORMAT
+from benchmarks.bench_search_index import QUERIES
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+SESSION_POOL = 50
+# Scenario name -> callback data prefix taken from a search reply's buttons
+CALLBACK_SCENARIOS = {"page": "page:", "filter": "filter:", "quality": "quality:", "select": "select:"}
+
+
+async def run_scenario(handler, events_, concurrency, warmup):
+    for event in events_[:warmup]:
+        await handler(event)
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(event):
+        async with semaphore:
+            started = time.perf_counter()
+            await handler(event)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(event) for event in events_[warmup:]))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def collect_callbacks(search, user_ids, rng):
+    # Real search sessions whose buttons feed the callback scenarios
+    pool = {prefix: [] for prefix in CALLBACK_SCENARIOS.values()}
+    hit_queries = [query for query in QUERIES if "no match" not in query]
+    for i in range(SESSION_POOL):
+        event = FakeEvent(rng.choice(user_ids), text=rng.choice(hit_queries))
+        await search(event)
+        for data in event.button_data():
+            for prefix in pool:
+                if data.startswith(prefix):
+                    pool[prefix].append((event.sender_id, data))
+    return pool
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["scenarios"]
+    regressions = []
+    print(f"\ncompared with {baseline_path}:")
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        deltas = {key: current[key] / before[key] - 1 for key in ("p50_ms", "p95_ms", "p99_ms", "throughput") if before[key]}
+        print(f"{name:8} " + " ".join(f"{key}={delta:+.1%}" for key, delta in deltas.items()))
+        # Latency going up or throughput going down beyond the threshold counts as a regression
+        if deltas.get("p95_ms", 0) > threshold or deltas.get("throughput", 0) < -threshold:
+            regressions.append(name)
+    return regressions
+
+
+def configure_logging(mode):
+    if mode == "sync":
+        logging.basicConfig(level=logging.INFO, format=TEXT_FORMAT)
+    elif mode == "queue":
+        setup_logging()
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot's handlers end to end")
+    parser.add_argument("--videos", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--ops", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--mongo-uri")
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--logging", choices=("off", "sync", "queue"), default="off")
+    args = parser.parse_args()
+    configure_logging(args.logging)
+
+    rng = random.Random(1)
+    videos, users = get_collections(args.mongo_uri)
+    started = time.perf_counter()
+    seed_catalog(videos, args.videos)
+    user_ids = list(range(1, args.users + 1))
+    seed_users(users, user_ids)
+    search_index.load(videos)
+    print(f"seeded {args.videos} videos and {args.users} users in {time.perf_counter() - started:.1f}s")
+
+    client = FakeClient()
+    register_common_handlers(client, -100, 0, videos, users)
+    register_user_handlers(client, videos, users)
+    search = client.handler("message_handler")
+    callback = client.handler("callback_handler")
+
+    tmdb_requests = []
+    runner = await tmdb_stub(tmdb_requests)
+    results = {}
+    try:
+        total = args.ops + args.warmup
+        search_events = [FakeEvent(rng.choice(user_ids), text=rng.choice(QUERIES)) for _ in range(total)]
+        results["search"] = await run_scenario(search, search_events, args.concurrency, args.warmup)
+
+        pool = await collect_callbacks(search, user_ids, rng)
+        for name, prefix in CALLBACK_SCENARIOS.items():
+            if not pool[prefix]:
+                print(f"{name}: no {prefix} buttons in the sampled results, skipped")
+                continue
+            events_ = [FakeEvent(user_id, data=data) for user_id, data in (rng.choice(pool[prefix]) for _ in range(total))]
+            results[name] = await run_scenario(callback, events_, args.concurrency, args.warmup)
+    finally:
+        await ingest_pipeline.close()
+        await sender.close()
+        await tmdb_client.close()
+        await runner.cleanup()
+        stop_logging()
+
+    for name, stats in results.items():
+        print(f"{name:8} p50={stats['p50_ms']:7.2f}ms p95={stats['p95_ms']:7.2f}ms p99={stats['p99_ms']:7.2f}ms "
+              f"mean={stats['mean_ms']:7.2f}ms throughput={stats['throughput']:8.1f} ops/s")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench_handlers-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "meta": {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "revision": git_revision(),
+                "videos": args.videos,
+                "users": args.users,
+                "ops": args.ops,
+                "concurrency": args.concurrency,
+                "mongo": "mongod" if args.mongo_uri else "mongomock",
+                "logging": args.logging,
+                "tmdb_requests": len(tmdb_requests)
+            },
+            "scenarios": results
+        }, f, indent=2)
+    print(f"saved {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"regressions beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
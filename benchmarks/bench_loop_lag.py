@@ -0,0 +1,81 @@
+# benchmarks/bench_loop_lag.py
+# Runs concurrent searches against a local mongod and measures event-loop lag,
+# once calling pymongo directly on the loop and once through database.run_db.
+# Usage: MONGO_URI=mongodb://localhost:27017 python -m benchmarks.bench_loop_lag [concurrency] [videos]
+import asyncio
+import random
+import statistics
+import sys
+import time
+from config import MONGO_URI
+from database import get_db, run_db, search_videos, close_client
+from search_index import search_index, caption_tokens, build_search_filter
+from utils import normalize_query
+from benchmarks.bench_search_index import synthetic_caption, QUERIES
+
+TICK = 0.005
+
+
+async def measure_lag(stop, samples):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        samples.append((time.perf_counter() - started - TICK) * 1000)
+
+
+def seed(collection, count):
+    rng = random.Random(7)
+    collection.drop()
+    docs = []
+    for i in range(1, count + 1):
+        caption = synthetic_caption(rng, i)
+        docs.append({
+            "_id": i, "caption": caption, "file_size": "1.00 GB", "category": "series" if "E" in caption else "movie",
+            "quality": next((q for q in ["2160p", "1080p", "720p", "480p"] if q in caption), "unknown"),
+            "tokens": caption_tokens(caption)
+        })
+        if len(docs) == 5000:
+            collection.insert_many(docs)
+            docs = []
+    if docs:
+        collection.insert_many(docs)
+
+
+async def run(collection, concurrency, offload):
+    async def one_search(i):
+        search_filter = build_search_filter(normalize_query(QUERIES[i % len(QUERIES)]))
+        if offload:
+            await run_db(search_videos, collection, search_filter)
+        else:
+            search_videos(collection, search_filter)
+
+    stop = asyncio.Event()
+    samples = []
+    ticker = asyncio.create_task(measure_lag(stop, samples))
+    started = time.perf_counter()
+    await asyncio.gather(*(one_search(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    samples.sort()
+    label = "run_db" if offload else "blocking"
+    print(f"{label:9} searches={concurrency} wall={elapsed:.2f}s lag p50={statistics.median(samples):.1f}ms "
+          f"p99={samples[int(len(samples) * 0.99) - 1]:.1f}ms max={samples[-1]:.1f}ms")
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    collection = get_db(MONGO_URI)["bench_videos"]
+    seed(collection, count)
+    search_index.load(collection)
+    try:
+        asyncio.run(run(collection, concurrency, offload=False))
+        asyncio.run(run(collection, concurrency, offload=True))
+    finally:
+        collection.drop()
+        close_client()
+
+
+if __name__ == "__main__":
+    main()
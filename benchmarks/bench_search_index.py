@@ -0,0 +1,73 @@
+# benchmarks/bench_search_index.py
+# Compares the old full regex scan over every caption with the token index + regex verification,
+# then times the trigram "did you mean" fallback on misspelled queries.
+# Usage: python -m benchmarks.bench_search_index [caption_count]
+import random
+import re
+import sys
+import time
+from search_index import SearchIndex, caption_tokens, build_regex_pattern
+from utils import normalize_query
+
+TITLES = [
+    "Mirzapur", "Panchayat", "Bhaiyya Ji", "Inception", "Sacred Games", "Kota Factory", "The Family Man",
+    "Paatal Lok", "Stree", "Jawan", "Pathaan", "Animal", "Dunki", "Fighter", "Aspirants", "Gullak",
+    "Breaking Bad", "Dark", "Money Heist", "Squid Game", "Spider-Man", "Interstellar", "Dangal", "Pushpa"
+]
+QUALITIES = ["2160p", "1080p", "720p", "480p"]
+LANGUAGES = ["Hindi", "English", "Tamil", "Telugu", "Dual Audio"]
+QUERIES = ["mirzapur s01", "panchayat season 2 episode 3", "family man 1080p", "inception", "spider-man",
+           "kota factory s02e04", "animal hindi", "squid", "zzz no match", "dark s03e08 720p"]
+TYPOS = ["mirzapor s01", "panchyat", "intersteller", "squidd game", "famly man 1080p", "spyder-man", "pushpaa hindi"]
+
+
+def synthetic_caption(rng, i):
+    title = rng.choice(TITLES)
+    if rng.random() < 0.6:
+        episode = f"S{rng.randint(1, 5):02d}E{rng.randint(1, 12):02d}"
+    else:
+        episode = str(rng.randint(1990, 2024))
+    return f"{title} {episode} {rng.choice(QUALITIES)} {rng.choice(LANGUAGES)} WEB-DL x264 #{i}.mkv"
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = random.Random(42)
+    captions = {i: synthetic_caption(rng, i) for i in range(1, count + 1)}
+
+    started = time.perf_counter()
+    index = SearchIndex()
+    for video_id, caption in captions.items():
+        index.add(video_id, caption_tokens(caption))
+    print(f"indexed {count} captions, {len(index.postings)} tokens in {time.perf_counter() - started:.1f}s")
+
+    for query in QUERIES:
+        clean_query = normalize_query(query)
+        regex = re.compile(build_regex_pattern(clean_query), re.IGNORECASE)
+
+        started = time.perf_counter()
+        scanned = [video_id for video_id, caption in captions.items() if regex.search(caption)]
+        scan_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        candidates = index.candidates(clean_query)
+        if candidates is None:
+            candidates = captions.keys()
+        indexed = sorted(video_id for video_id in candidates if regex.search(captions[video_id]))
+        index_ms = (time.perf_counter() - started) * 1000
+
+        assert indexed == scanned, f"index results differ from regex scan for {query!r}"
+        print(f"{query!r:40} hits={len(scanned):7d} scan={scan_ms:8.1f}ms index={index_ms:8.1f}ms "
+              f"speedup={scan_ms / max(index_ms, 0.001):6.1f}x")
+
+    trigram_bytes = sum(posting.itemsize * len(posting) for posting in index.trigrams.values())
+    print(f"\nfuzzy: {len(index.vocabulary)} words, {len(index.trigrams)} trigrams, "
+          f"{trigram_bytes / 1024 / 1024:.1f} MiB of postings")
+    for query in TYPOS:
+        started = time.perf_counter()
+        suggestions = index.did_you_mean(normalize_query(query))
+        print(f"{query!r:40} {(time.perf_counter() - started) * 1000:6.2f}ms -> {suggestions}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# benchmarks/bench_workers.py
+# Sends the same stream of search messages through the worker front end with 1, 2, 4 ... worker processes
+# and reports latency and throughput for each, to show how the handlers scale with WORKER_PROCESSES.
+# Workers are forked after seeding, so each one starts with its own copy of the mongomock catalog
+# (or connects to a real mongod with --mongo-uri). Scaling is bounded by the cores on the machine.
+# Usage: python -m benchmarks.bench_workers [--workers 1,2,4] [--videos N] [--ops N] [--concurrency N] [--mongo-uri URI]
+from benchmarks.fakes import FakeClient, FakeEvent, get_collections, seed_catalog, seed_users, tmdb_stub
+import argparse
+import asyncio
+import functools
+import os
+import random
+from telethon.tl import types
+from workers import WorkerPool
+from sender import sender
+from tmdb import tmdb_client
+from benchmarks.bench_search_index import QUERIES
+from benchmarks.bench_handlers import run_scenario
+
+
+def search_event(user_id, message_id, text):
+    # The front end forwards the raw message, so the fake event carries a real TL message
+    event = FakeEvent(user_id, text=text)
+    event.message = types.Message(id=message_id, peer_id=types.PeerUser(user_id), date=None, message=text)
+    return event
+
+
+def worker_collections(mongo_uri, videos, users):
+    # Runs in each worker: a fresh client for a real mongod, the inherited in-memory catalog otherwise
+    if mongo_uri:
+        from pymongo import MongoClient
+        db = MongoClient(mongo_uri).bot_benchmark
+        return db.videos, db.users
+    return videos, users
+
+
+async def run(pools, user_ids, args):
+    rng = random.Random(1)
+    tmdb_requests = []
+    runner = await tmdb_stub(tmdb_requests)
+    results = {}
+    try:
+        for count, pool in pools.items():
+            client = FakeClient()
+            pool.register(client)
+            forward = client.handler("forward_message")
+            total = args.ops + args.warmup
+            events_ = [search_event(rng.choice(user_ids), i, rng.choice(QUERIES)) for i in range(1, total + 1)]
+            results[count] = await run_scenario(forward, events_, args.concurrency, args.warmup)
+            await pool.close()
+    finally:
+        await sender.close()
+        await tmdb_client.close()
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark handler throughput against the number of worker processes")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--videos", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--ops", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--mongo-uri")
+    args = parser.parse_args()
+
+    videos, users = get_collections(args.mongo_uri)
+    seed_catalog(videos, args.videos)
+    user_ids = list(range(1, args.users + 1))
+    seed_users(users, user_ids)
+    print(f"seeded {args.videos} videos and {args.users} users; {os.cpu_count()} CPUs")
+
+    # Every pool is forked up front, before this process starts its event loop
+    pools = {}
+    for count in map(int, args.workers.split(",")):
+        pools[count] = WorkerPool(count, -100, 0, args.mongo_uri, open_collections=functools.partial(worker_collections, args.mongo_uri, videos, users))
+        pools[count].start()
+
+    results = asyncio.run(run(pools, user_ids, args))
+    baseline = results[min(results)]["throughput"]
+    for count, stats in results.items():
+        print(f"{count:2} workers p50={stats['p50_ms']:7.2f}ms p95={stats['p95_ms']:7.2f}ms p99={stats['p99_ms']:7.2f}ms "
+              f"throughput={stats['throughput']:8.1f} ops/s ({stats['throughput'] / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
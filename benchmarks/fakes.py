@@ -0,0 +1,179 @@
+# benchmarks/fakes.py
+# Shared stand-ins for the handler benchmarks: a fake Telethon client and events, a seeded catalog
+# and a stub TMDB server. Import this before any bot module so the environment defaults below apply.
+import os
+
+# Benchmarks measure the bot's own work, so the send scheduler's Telegram pacing is lifted
+# and TMDB points at the local stub unless the caller says otherwise
+os.environ.setdefault("SEND_GLOBAL_RATE", "1000000")
+os.environ.setdefault("SEND_PER_CHAT_INTERVAL", "0")
+os.environ.setdefault("TMDB_BASE_URL", "http://127.0.0.1:8765/3")
+
+import asyncio
+import functools
+import itertools
+import random
+import statistics
+from types import SimpleNamespace
+from aiohttp import web
+from ingestion import classify_caption
+from search_index import caption_tokens, rank_features
+from benchmarks.bench_search_index import synthetic_caption
+
+TMDB_PORT = 8765
+
+
+class FakeClient:
+    def __init__(self):
+        self.handlers = []
+        self.sent = []
+
+    def on(self, event_builder):
+        def decorator(func):
+            self.handlers.append((event_builder, func))
+            return func
+        return decorator
+
+    def handler(self, name):
+        return next(func for _, func in self.handlers if func.__name__ == name)
+
+    async def is_bot(self):
+        return True
+
+    async def send_message(self, chat_id, *args, **kwargs):
+        self.sent.append(chat_id)
+        return FakeSentMessage(chat_id)
+
+    async def get_messages(self, chat, ids=None, **kwargs):
+        return [None] * len(ids) if isinstance(ids, list) else None
+
+
+# Message ids for sent messages and for the messages callback events are attached to
+_message_ids = itertools.count(1)
+
+
+class FakeSentMessage:
+    def __init__(self, chat_id):
+        self.id = next(_message_ids)
+        self.chat_id = chat_id
+
+    async def delete(self):
+        pass
+
+
+class FakeEvent:
+    def __init__(self, sender_id, text=None, data=None):
+        self.sender_id = sender_id
+        self.chat_id = sender_id
+        self.is_private = True
+        self.photo = None
+        self.message = SimpleNamespace(text=text, media=None)
+        self.data = data.encode() if data is not None else None
+        self.message_id = next(_message_ids)
+        self.replies = []
+
+    async def reply(self, message, **kwargs):
+        self.replies.append((message, kwargs.get("buttons")))
+        return FakeSentMessage(self.chat_id)
+
+    async def edit(self, message, **kwargs):
+        self.replies.append((message, kwargs.get("buttons")))
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def delete(self):
+        pass
+
+    def button_data(self):
+        # Callback data of every inline button in the last reply or edit
+        if not self.replies or not self.replies[-1][1]:
+            return []
+        rows = self.replies[-1][1]
+        rows = rows if isinstance(rows[0], list) else [rows]
+        return [button_data(button) for row in rows for button in row]
+
+
+def button_data(button):
+    data = getattr(button, "data", None) or getattr(getattr(button, "type", None), "data", b"")
+    return data.decode()
+
+
+def _copy_projection(find):
+    # mongomock pops and restores _id in the caller's projection dict, which races when the Mongo
+    # executor threads share a module-level projection; pymongo never mutates it
+    @functools.wraps(find)
+    def wrapper(self, filter=None, projection=None, *args, **kwargs):
+        return find(self, filter, dict(projection) if isinstance(projection, dict) else projection, *args, **kwargs)
+    wrapper.copies_projection = True
+    return wrapper
+
+
+def get_collections(mongo_uri=None):
+    # A real mongod when given a URI, otherwise mongomock in memory
+    if mongo_uri:
+        from pymongo import MongoClient
+        db = MongoClient(mongo_uri).bot_benchmark
+    else:
+        import mongomock
+        if not hasattr(mongomock.Collection.find, "copies_projection"):
+            mongomock.Collection.find = _copy_projection(mongomock.Collection.find)
+        db = mongomock.MongoClient().bot_benchmark
+    db.videos.drop()
+    db.users.drop()
+    return db.videos, db.users
+
+
+def seed_catalog(videos, count, seed=42, batch=5000):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(1, count + 1):
+        caption = synthetic_caption(rng, i)
+        category, quality = classify_caption(caption)
+        docs.append({
+            "_id": i, "caption": caption, "file_size": "1.00 GB", "category": category, "quality": quality,
+            "tokens": caption_tokens(caption), "rank": rank_features(caption),
+            "media": {"kind": "document", "id": i, "access_hash": i, "file_reference": b"ref", "text": caption}
+        })
+        if len(docs) >= batch:
+            videos.insert_many(docs)
+            docs = []
+    if docs:
+        videos.insert_many(docs)
+
+
+def seed_users(users, user_ids, paid=True):
+    from datetime import datetime, timedelta
+    profile = {"privacy_policy_accepted": True}
+    if paid:
+        profile.update(is_paid=True, plan_description="30-Day Plan", expiry_date=datetime.now() + timedelta(days=30))
+    users.insert_many([{"_id": user_id, **profile} for user_id in user_ids])
+
+
+async def tmdb_stub(request_log, delay=0.05, port=TMDB_PORT):
+    async def handle(request):
+        request_log.append(request.path)
+        await asyncio.sleep(delay)
+        if request.path.endswith("/search/multi"):
+            return web.json_response({"results": [{"media_type": "tv", "id": 1, "name": "Mirzapur", "first_air_date": "2018-11-16"}]})
+        return web.json_response({"number_of_seasons": 3, "genres": [{"name": "Crime"}]})
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+def summarize(latencies, elapsed):
+    # Milliseconds; quantiles(n=100) gives the 1st..99th percentile cut points
+    cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "ops": len(latencies),
+        "p50_ms": cuts[49] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "p99_ms": cuts[98] * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0
+    }
@@ -1,17 +1,24 @@
 import os
 import asyncio
-from telethon import TelegramClient, events
+from telethon import TelegramClient
 from dotenv import load_dotenv
-from database import get_videos_collection, get_users_collection
-from handlers.admin import register_admin_handlers
-from handlers.user import register_user_handlers
-from handlers.common import register_common_handlers
-from config import API_ID, API_HASH, BOT_TOKEN, DATABASE_CHANNEL_ID, ADMIN_ID, MONGO_URI
+from database import get_videos_collection, get_users_collection, get_tmdb_cache_collection, get_checkouts_collection, close_client
+from search_index import search_index
+from tmdb import tmdb_client
+from expiry import SubscriptionSweeper
+from checkout import CheckoutSweeper
+from sender import sender
+from ingestion import ingest_pipeline
+from metrics import metrics_handler, monitor_loop_lag, register_gauge
+from workers import WorkerPool
+from handlers import register_handlers
+from handlers.common import register_ingest_handler
+from handlers.admin import register_stats_handler
+from logs import setup_logging, stop_logging
+from config import API_ID, API_HASH, BOT_TOKEN, DATABASE_CHANNEL_ID, ADMIN_ID, MONGO_URI, TMDB_PERSISTENT_CACHE, WORKER_PROCESSES
 import logging
 from aiohttp import web
 
-# Logging configuration
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -28,9 +35,20 @@ required_vars = {
 }
 for var_name, var_value in required_vars.items():
     if not var_value:
-        logger.error(f"Required environment variable '{var_name}' is not set. Exiting.")
+        logger.error("Required environment variable '%s' is not set. Exiting.", var_name)
         raise ValueError(f"Required environment variable '{var_name}' is not set.")
 
+# Worker processes are forked here, before this process starts any thread (the logging listener included)
+# or opens its Telegram session or Mongo pool
+worker_pool = WorkerPool(WORKER_PROCESSES, DATABASE_CHANNEL_ID, ADMIN_ID, MONGO_URI) if WORKER_PROCESSES > 0 else None
+if worker_pool:
+    worker_pool.start()
+
+# Logging configuration; records are formatted and written on a listener thread
+setup_logging()
+if worker_pool:
+    logger.info("Started %s worker processes", WORKER_PROCESSES)
+
 # Initialize Telethon client
 client = TelegramClient("session_name", API_ID, API_HASH)
 
@@ -38,29 +56,53 @@ client = TelegramClient("session_name", API_ID, API_HASH)
 videos_collection = get_videos_collection(MONGO_URI)
 users_collection = get_users_collection(MONGO_URI)
 
-# Register all handlers
-register_common_handlers(client, DATABASE_CHANNEL_ID, ADMIN_ID, videos_collection, users_collection)
-register_admin_handlers(client, DATABASE_CHANNEL_ID, ADMIN_ID, MONGO_URI, videos_collection, users_collection)
-register_user_handlers(client, videos_collection, users_collection)
+# Build the in-memory caption token index
+search_index.load(videos_collection)
+
+# Persist TMDB lookups across restarts
+if TMDB_PERSISTENT_CACHE:
+    tmdb_client.use_store(get_tmdb_cache_collection(MONGO_URI))
 
-# Optional: Add /ping command to check bot is alive
-@client.on(events.NewMessage(pattern="/ping"))
-async def ping_handler(event):
-    await event.reply("I'm alive! ✅")
+# Expires subscriptions and sends reminders in the background
+subscription_sweeper = SubscriptionSweeper(client, users_collection)
+# Times out payment checkouts that never got a screenshot
+checkout_sweeper = CheckoutSweeper(client, get_checkouts_collection(MONGO_URI))
+
+# Register all handlers; with workers this process only ingests the database channel and forwards the rest
+if worker_pool:
+    register_ingest_handler(client, DATABASE_CHANNEL_ID, videos_collection)
+    # Answered here, ahead of the forwarding, from this process's stats and what the workers report
+    register_stats_handler(client, ADMIN_ID)
+    worker_pool.register(client)
+else:
+    register_handlers(client, DATABASE_CHANNEL_ID, ADMIN_ID, MONGO_URI, videos_collection, users_collection)
 
 # Health check endpoint for Koyeb
 async def health_check(request):
     return web.Response(text="OK")
 
 app = web.Application()
-app.add_routes([web.get("/", health_check)])
+app.add_routes([web.get("/", health_check), web.get("/metrics", metrics_handler)])
+
+register_gauge("bot_send_queue_depth", "Messages waiting in the send scheduler", lambda: sender.depth())
+register_gauge("bot_ingest_queue_depth", "Videos waiting to be written", lambda: ingest_pipeline.stats()["queued"])
+register_gauge("bot_search_index_videos", "Videos in the in-memory search index", lambda: len(search_index))
+if worker_pool:
+    register_gauge("bot_worker_pending_updates", "Updates being handled by each worker process", worker_pool.pending_counts, "worker")
+register_gauge("bot_tmdb_lookups", "TMDB lookup outcomes", lambda: {key: tmdb_client.stats()[key] for key in ("fetches", "store_hits", "shared")}, "outcome")
 
 # Start Telegram bot
 async def start_bot():
     try:
         await client.start(bot_token=BOT_TOKEN)
         logger.info("✅ Bot started successfully.")
+        sweeper_task = asyncio.create_task(subscription_sweeper.run())
+        checkout_task = asyncio.create_task(checkout_sweeper.run())
+        lag_task = asyncio.create_task(monitor_loop_lag())
         await client.run_until_disconnected()
+        sweeper_task.cancel()
+        checkout_task.cancel()
+        lag_task.cancel()
     except Exception as e:
         logger.exception("❌ Bot crashed unexpectedly!")
 
@@ -77,7 +119,14 @@ async def start_web_server():
 
 # Main entry point
 async def main():
-    await asyncio.gather(start_bot(), start_web_server())
+    try:
+        await asyncio.gather(start_bot(), start_web_server())
+    finally:
+        await ingest_pipeline.close()
+        if worker_pool:
+            await worker_pool.close()
+        await sender.close()
+        await tmdb_client.close()
 
 if __name__ == "__main__":
     logger.info("🚀 Starting bot and web server...")
@@ -86,3 +135,7 @@ if __name__ == "__main__":
         loop.run_until_complete(main())
     except Exception as e:
         logger.exception("❌ Main loop crashed!")
+    finally:
+        close_client()
+        logger.info("MongoDB client closed.")
+        stop_logging()
@@ -0,0 +1,35 @@
+# catalog.py
+from search_index import search_index
+from search_cache import search_cache
+from media import media_cache
+
+# Called after every local catalog change; worker processes use it to replay the change elsewhere
+_listeners = []
+
+
+def on_catalog_change(listener):
+    _listeners.append(listener)
+
+
+def apply_catalog_change(added=(), removed=(), reset=False, publish=True):
+    # added holds docs with at least _id, tokens and caption; removed holds video ids.
+    # reset drops every cached search, for bulk rewrites like the backfill.
+    # Only re-ingested ids can sit in a cached result; new videos are covered by their captions
+    reingested = [doc["_id"] for doc in added if doc["_id"] in search_index.doc_tokens]
+    for doc in added:
+        search_index.add(doc["_id"], doc["tokens"])
+    for video_id in removed:
+        search_index.remove(video_id)
+        media_cache.forget(video_id)
+    if reset:
+        search_cache.invalidate_all()
+    else:
+        ids = reingested + list(removed)
+        if ids:
+            search_cache.invalidate_ids(ids)
+        if added:
+            search_cache.invalidate_docs(added)
+    if publish and (added or removed or reset):
+        change = ([{key: doc[key] for key in ("_id", "tokens", "caption")} for doc in added], list(removed), reset)
+        for listener in _listeners:
+            listener(*change)
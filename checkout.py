@@ -0,0 +1,148 @@
+# checkout.py
+import asyncio
+import secrets
+from datetime import datetime, timedelta
+from telethon import Button
+from database import (
+    run_db, ensure_checkout_indexes, get_checkout_users, find_user_checkout, create_checkout, advance_checkout,
+    delete_checkout, expire_checkouts
+)
+from utils import logger
+from sender import sender, delete_messages, BULK
+from config import (
+    PAYMENT_SCREENSHOT_TIMEOUT, PAYMENT_TIMEOUT_MESSAGE, CHECKOUT_RETENTION, CHECKOUT_SWEEP_INTERVAL,
+    CHECKOUT_SWEEP_BATCH_SIZE
+)
+
+# Checkout states
+AWAITING_SCREENSHOT = "awaiting_screenshot"
+PENDING_REVIEW = "pending_review"
+CONFIRMED = "confirmed"
+REJECTED = "rejected"
+EXPIRED = "expired"
+
+
+def _expires_at(now):
+    return now + timedelta(seconds=CHECKOUT_RETENTION)
+
+
+class CheckoutStore:
+    def __init__(self, clock=datetime.utcnow):
+        self.collection = None
+        self.clock = clock
+        # Users with a checkout awaiting its screenshot, so other private messages skip the Mongo lookup.
+        # Only a hint for this process: entries can go stale (timed out elsewhere) and are dropped on the
+        # next miss, and a user rerouted from another worker is missing until a photo finds their checkout
+        self.awaiting = set()
+
+    def use(self, collection):
+        # Blocking, at startup: checkouts opened before a restart keep accepting screenshots
+        self.collection = collection
+        self.awaiting = set(get_checkout_users(collection, AWAITING_SCREENSHOT))
+
+    async def open(self, user_id, days, amount, checkout_id, payment_message):
+        now = self.clock()
+        checkout = {
+            "_id": checkout_id,
+            "user_id": user_id,
+            "days": days,
+            "amount": amount,
+            "state": AWAITING_SCREENSHOT,
+            "payment_message": {"chat_id": payment_message.chat_id, "id": payment_message.id},
+            "created_at": now,
+            "deadline": now + timedelta(seconds=PAYMENT_SCREENSHOT_TIMEOUT),
+            "expires_at": _expires_at(now)
+        }
+        superseded = await run_db(create_checkout, self.collection, checkout, AWAITING_SCREENSHOT, EXPIRED, _expires_at(now))
+        self.awaiting.add(user_id)
+        return superseded
+
+    async def awaiting_screenshot(self, user_id, photo=False):
+        # A photo may be the screenshot, so it always checks Mongo; other messages trust the set
+        if user_id not in self.awaiting and not photo:
+            return None
+        checkout = await run_db(find_user_checkout, self.collection, user_id, AWAITING_SCREENSHOT)
+        if checkout is None:
+            self.awaiting.discard(user_id)
+        else:
+            self.awaiting.add(user_id)
+        return checkout
+
+    async def advance(self, checkout_id, from_state, to_state, **fields):
+        checkout = await run_db(advance_checkout, self.collection, checkout_id, from_state, to_state, _expires_at(self.clock()), **fields)
+        if checkout is not None and from_state == AWAITING_SCREENSHOT:
+            self.awaiting.discard(checkout["user_id"])
+        return checkout
+
+    async def cancel(self, checkout_id, user_id):
+        checkout = await run_db(delete_checkout, self.collection, checkout_id, user_id, AWAITING_SCREENSHOT)
+        if checkout is not None:
+            self.awaiting.discard(user_id)
+        return checkout
+
+
+def new_checkout_id():
+    # Same shape as search session ids: short, url-safe and free of ':' for callback data
+    return secrets.token_urlsafe(6)
+
+
+async def delete_payment_message(client, checkout):
+    message = checkout["payment_message"]
+    await delete_messages(client, message["chat_id"], [message["id"]])
+
+
+class CheckoutSweeper:
+    # One task times out every checkout, instead of a coroutine parked per user
+    def __init__(self, client, checkouts_collection, clock=datetime.utcnow, interval=CHECKOUT_SWEEP_INTERVAL,
+                 batch_size=CHECKOUT_SWEEP_BATCH_SIZE):
+        self.client = client
+        self.checkouts_collection = checkouts_collection
+        self.clock = clock
+        self.interval = interval
+        self.batch_size = batch_size
+        self.expired = 0
+
+    async def run(self):
+        await run_db(ensure_checkout_indexes, self.checkouts_collection)
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Checkout sweep failed")
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self):
+        now = self.clock()
+        total = 0
+        while True:
+            batch = await run_db(
+                expire_checkouts, self.checkouts_collection, AWAITING_SCREENSHOT, EXPIRED, now, _expires_at(now), self.batch_size
+            )
+            for checkout in batch:
+                await self._queue_timeout(checkout)
+            total += len(batch)
+            if len(batch) < self.batch_size:
+                break
+        if total:
+            logger.info("Checkout sweep: %s timed out", total)
+        self.expired += total
+        return total
+
+    async def _queue_timeout(self, checkout):
+        # Queued like the subscription notices: a blocked user can't stall the rest of the batch
+        user_id = checkout["user_id"]
+        message = checkout["payment_message"]
+        checkouts.awaiting.discard(user_id)
+        await sender.submit(message["chat_id"], self.client.delete_messages, message["chat_id"], [message["id"]], priority=BULK)
+        await sender.submit(
+            user_id,
+            self.client.send_message,
+            user_id,
+            PAYMENT_TIMEOUT_MESSAGE,
+            buttons=[Button.inline("♻️Send Again♻️", data=f"plan:{checkout['days']}:{checkout['amount']}")],
+            parse_mode='html',
+            priority=BULK
+        )
+
+
+checkouts = CheckoutStore()
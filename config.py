@@ -24,6 +24,14 @@ MONGO_URI = get_env_var("MONGO_URI")
 BOT_USERNAME = get_env_var("BOT_USERNAME")
 MAIN_CHANNEL_ID = get_env_var("MAIN_CHANNEL_ID", int)
 TMDB_API_KEY = get_env_var("TMDB_API_KEY")
+TMDB_BASE_URL = get_env_var("TMDB_BASE_URL", str, "https://api.themoviedb.org/3")
+TMDB_REQUEST_TIMEOUT = get_env_var("TMDB_REQUEST_TIMEOUT", float, 5.0)
+TMDB_MAX_CONNECTIONS = get_env_var("TMDB_MAX_CONNECTIONS", int, 20)
+TMDB_CACHE_SIZE = get_env_var("TMDB_CACHE_SIZE", int, 5000)
+TMDB_CACHE_TTL = get_env_var("TMDB_CACHE_TTL", int, 6 * 60 * 60)
+TMDB_NEGATIVE_CACHE_TTL = get_env_var("TMDB_NEGATIVE_CACHE_TTL", int, 10 * 60)
+TMDB_PERSISTENT_CACHE = get_env_var("TMDB_PERSISTENT_CACHE", int, 1)
+TMDB_STORE_TTL = get_env_var("TMDB_STORE_TTL", int, 7 * 24 * 60 * 60)
 PAYMENT_ID = get_env_var("PAYMENT_ID")
 QR_PHOTO_ID = get_env_var("QR_PHOTO_ID", int)
 
@@ -31,6 +39,95 @@ QR_PHOTO_ID = get_env_var("QR_PHOTO_ID", int)
 DATABASE_NAME = "great"
 COLLECTION_NAME = "search"
 USERS_COLLECTION_NAME = "users"
+TMDB_CACHE_COLLECTION_NAME = "tmdb_cache"
+CHECKPOINTS_COLLECTION_NAME = "checkpoints"
+CHECKOUTS_COLLECTION_NAME = "checkouts"
+
+# User profile cache (privacy and subscription checks)
+USER_CACHE_SIZE = get_env_var("USER_CACHE_SIZE", int, 100000)
+USER_CACHE_TTL = get_env_var("USER_CACHE_TTL", int, 30 * 60)
+
+# Telegram media references for file delivery
+MEDIA_CACHE_SIZE = get_env_var("MEDIA_CACHE_SIZE", int, 20000)
+MEDIA_CACHE_TTL = get_env_var("MEDIA_CACHE_TTL", int, 6 * 60 * 60)
+
+# Outbound send scheduler (Telegram allows roughly 30 messages/s overall and about one per chat per second)
+SEND_GLOBAL_RATE = get_env_var("SEND_GLOBAL_RATE", float, 25)
+SEND_PER_CHAT_INTERVAL = get_env_var("SEND_PER_CHAT_INTERVAL", float, 0.35)
+SEND_WORKERS = get_env_var("SEND_WORKERS", int, 8)
+SEND_MAX_RETRIES = get_env_var("SEND_MAX_RETRIES", int, 3)
+SEND_MAX_FLOOD_WAIT = get_env_var("SEND_MAX_FLOOD_WAIT", int, 300)
+SEND_BULK_PENDING = get_env_var("SEND_BULK_PENDING", int, 500)
+
+# Metrics
+LOOP_LAG_INTERVAL = get_env_var("LOOP_LAG_INTERVAL", float, 0.5)
+# How often worker processes send their metrics and cache stats to the bot process (seconds)
+METRICS_PUSH_INTERVAL = get_env_var("METRICS_PUSH_INTERVAL", float, 10)
+
+# Logging; LOG_SAMPLE_RATE is the share of per-update records (handled, callback, privacy check) kept
+LOG_LEVEL = get_env_var("LOG_LEVEL", str, "INFO")
+LOG_FORMAT = get_env_var("LOG_FORMAT", str, "json")
+LOG_SAMPLE_RATE = get_env_var("LOG_SAMPLE_RATE", float, 0.01)
+
+# Live ingestion batching
+INGEST_BATCH_SIZE = get_env_var("INGEST_BATCH_SIZE", int, 500)
+INGEST_FLUSH_INTERVAL = get_env_var("INGEST_FLUSH_INTERVAL", float, 1.0)
+INGEST_QUEUE_SIZE = get_env_var("INGEST_QUEUE_SIZE", int, 5000)
+
+# Database channel backfill
+BACKFILL_BATCH_SIZE = get_env_var("BACKFILL_BATCH_SIZE", int, 2000)
+BACKFILL_CONCURRENCY = get_env_var("BACKFILL_CONCURRENCY", int, 4)
+BACKFILL_EMPTY_CHUNKS = get_env_var("BACKFILL_EMPTY_CHUNKS", int, 5)
+
+# Worker processes behind the Telegram front end (0 runs every handler in the bot process)
+WORKER_PROCESSES = get_env_var("WORKER_PROCESSES", int, 0)
+
+# Search result cache
+SEARCH_CACHE_SIZE = get_env_var("SEARCH_CACHE_SIZE", int, 2000)
+SEARCH_CACHE_TTL = get_env_var("SEARCH_CACHE_TTL", int, 15 * 60)
+# Only the newest this many matches of a search are ranked; older ones page in _id order after them
+SEARCH_RANK_LIMIT = get_env_var("SEARCH_RANK_LIMIT", int, 500)
+
+# Typo-tolerant fallback for searches without hits (budget in seconds)
+FUZZY_SUGGESTIONS = get_env_var("FUZZY_SUGGESTIONS", int, 3)
+FUZZY_MIN_SIMILARITY = get_env_var("FUZZY_MIN_SIMILARITY", float, 0.3)
+FUZZY_SEARCH_BUDGET = get_env_var("FUZZY_SEARCH_BUDGET", float, 0.05)
+# Past this many candidate videos the _id $in list costs more to build and send than it saves
+SEARCH_INDEX_MAX_CANDIDATES = get_env_var("SEARCH_INDEX_MAX_CANDIDATES", int, 5000)
+
+# Search sessions behind the result buttons
+SEARCH_SESSION_SIZE = get_env_var("SEARCH_SESSION_SIZE", int, 20000)
+SEARCH_SESSION_TTL = get_env_var("SEARCH_SESSION_TTL", int, 6 * 60 * 60)
+
+# Rendered result headers per TMDB entry, and the last output shown on each result message
+RENDER_HEADER_CACHE_SIZE = get_env_var("RENDER_HEADER_CACHE_SIZE", int, 5000)
+RENDERED_MESSAGE_CACHE_SIZE = get_env_var("RENDERED_MESSAGE_CACHE_SIZE", int, 20000)
+
+# Pending conversation steps (privacy acceptance, channel post)
+CONVERSATION_STATE_SIZE = get_env_var("CONVERSATION_STATE_SIZE", int, 50000)
+CONVERSATION_STATE_TTL = get_env_var("CONVERSATION_STATE_TTL", int, 24 * 60 * 60)
+
+# Payment checkouts; finished ones stay in Mongo for CHECKOUT_RETENTION seconds after their last change
+PAYMENT_SCREENSHOT_TIMEOUT = get_env_var("PAYMENT_SCREENSHOT_TIMEOUT", int, 300)
+CHECKOUT_RETENTION = get_env_var("CHECKOUT_RETENTION", int, 30 * 24 * 60 * 60)
+CHECKOUT_SWEEP_INTERVAL = get_env_var("CHECKOUT_SWEEP_INTERVAL", int, 15)
+CHECKOUT_SWEEP_BATCH_SIZE = get_env_var("CHECKOUT_SWEEP_BATCH_SIZE", int, 500)
+
+# Background subscription expiry sweep
+SUBSCRIPTION_SWEEP_INTERVAL = get_env_var("SUBSCRIPTION_SWEEP_INTERVAL", int, 60)
+SUBSCRIPTION_SWEEP_BATCH_SIZE = get_env_var("SUBSCRIPTION_SWEEP_BATCH_SIZE", int, 500)
+SUBSCRIPTION_REMINDER_WINDOW = get_env_var("SUBSCRIPTION_REMINDER_WINDOW", int, 24 * 60 * 60)
+
+# MongoDB connection pool (one client per process)
+MONGO_MAX_POOL_SIZE = get_env_var("MONGO_MAX_POOL_SIZE", int, 50)
+MONGO_MIN_POOL_SIZE = get_env_var("MONGO_MIN_POOL_SIZE", int, 5)
+MONGO_MAX_IDLE_TIME_MS = get_env_var("MONGO_MAX_IDLE_TIME_MS", int, 300000)
+MONGO_CONNECT_TIMEOUT_MS = get_env_var("MONGO_CONNECT_TIMEOUT_MS", int, 5000)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = get_env_var("MONGO_SERVER_SELECTION_TIMEOUT_MS", int, 10000)
+MONGO_SOCKET_TIMEOUT_MS = get_env_var("MONGO_SOCKET_TIMEOUT_MS", int, 30000)
+MONGO_READ_PREFERENCE = get_env_var("MONGO_READ_PREFERENCE", str, "primary")
+MONGO_WRITE_CONCERN = get_env_var("MONGO_WRITE_CONCERN", str, "1")
+MONGO_EXECUTOR_WORKERS = get_env_var("MONGO_EXECUTOR_WORKERS", int, 16)
 
 # Message templates (All customizable messages moved here)
 START_MESSAGE = (
@@ -42,6 +139,7 @@ START_MESSAGE = (
     "Let’s get started – what do you want to watch today? 😊"
 )
 NO_RESULTS_MESSAGE = "✖️ No results found for <b>{query}</b>.\n 🤫Our database is updated daily, so you may try again later or check your spelling."
+DID_YOU_MEAN_MESSAGE = "✖️ No results found for <b>{query}</b>.\n🤔 Did you mean:"
 
 EMOJI_TYPE = "🎬"
 EMOJI_RELEASE = "📅"
@@ -56,8 +154,18 @@ EMOJI_PLATFORMS = "📡"
 POST_CONTENT_PROMPT_MESSAGE = "📬 Please send the post content you want to share in the main channel."
 
 FALLBACK_SEARCH_RESULT_MESSAGE = "🔍 Search Result For <b>{query}</b>"
+SEARCH_EXPIRED_MESSAGE = "⌛ This search has expired. Please send the movie or series name again."
 DELETE_CONFIRMATION = "Deleted {count} video(s) from the database and channel."
 CLOSED_MESSAGE = "Closed 🔒"
+STATS_MESSAGE = "📊 <b>Cache statistics</b>\n\n{lines}"
+CACHE_STATS_LINE = "<b>{name}</b>: {size}/{maxsize} entries, hit rate {hit_rate:.0%} ({hits} hits, {misses} misses, {evictions} evicted, {expirations} expired)"
+BACKFILL_STARTED_MESSAGE = "🔄 Backfill started{mode}. I'll report back when it's done."
+BACKFILL_RUNNING_MESSAGE = "⏳ A backfill is already running."
+BACKFILL_DONE_MESSAGE = "✅ Backfill finished: <b>{videos}</b> videos from {scanned} messages in {elapsed:.0f}s ({rate:.0f} msg/s), up to message {last_id}."
+BACKFILL_FAILED_MESSAGE = "❌ Backfill failed: {error}"
+INGEST_STATS_LINE = "<b>Ingestion</b>: {queued} queued, {videos} videos in {batches} batches, {failed} failed"
+SEND_STATS_LINE = "<b>Sender</b>: {depth} queued, {sent} sent, {failed} failed, {flood_waits} flood waits ({retries} retried), wait avg {avg_wait:.2f}s max {max_wait:.2f}s"
+TMDB_STATS_LINE = "<b>TMDB</b>: {fetches} API lookups, {store_hits} served from the Mongo cache, {shared} joined an in-flight lookup"
 PRIVACY_POLICY_MESSAGE = (
     "📜 Before using this bot, please read and accept our Privacy Policy.\n\n"
     "👉https://bit.ly/3Rd7pMi\n\n"
@@ -84,6 +192,7 @@ PAYMENT_REJECTED_MESSAGE = "❌ Payment rejected by admin. Please try again or c
 PAYMENT_ADMIN_CONFIRMED_MESSAGE = "Payment confirmed for User ID: <code>{user_id}</code> - ₹{amount} for {days} days."
 PAYMENT_ADMIN_REJECTED_MESSAGE = "Payment rejected for User ID: <code>{user_id}</code>."
 PAYMENT_ADMIN_ONLY_MESSAGE = "Only the admin can confirm or reject payments."
+PAYMENT_ALREADY_HANDLED_MESSAGE = "This payment has already been handled."
 PAYMENT_ADMIN_REQUEST_MESSAGE = (
 "📩 <b>Payment Verification Request</b>\n\n"
 "🆔 <b>User ID:</b> <code>{user_id}</code>\n"
@@ -103,6 +212,7 @@ BUTTON_PAGE_INFO = "📄 {page}/{total}"
 BUTTON_MOVIES = "Movies"
 BUTTON_SERIES = "Series"
 BUTTON_CLOSE = "✖️CLOSE✖️"
+BUTTON_DID_YOU_MEAN = "🔍 {query}"
 BUTTON_TICK = " ☑️"
 BUTTON_YES = "Yes"
 BUTTON_NO = "No"
@@ -117,6 +227,8 @@ SUBSCRIPTION_INACTIVE_MESSAGE = "⚠️ Your subscription is not active. Please
 
 SUBSCRIPTION_EXPIRED_MESSAGE = "⏳ Your subscription expired on {expiry_date}. Recharge now to keep enjoying your favorite movies! 🎬"
 
+SUBSCRIPTION_REMINDER_MESSAGE = "⏰ Your <b>{plan_description}</b> expires on {expiry_date}. Recharge now so your movies don't stop! 🎬"
+
 PLAN_DETAILS_MESSAGE = (
     "📢 <b>Choose a Subscription Plan:</b>\n\n"
     "💳 Select an option below to recharge and unlock unlimited access!"
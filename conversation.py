@@ -0,0 +1,26 @@
+# conversation.py
+from cache import TTLCache
+from config import CONVERSATION_STATE_SIZE, CONVERSATION_STATE_TTL
+
+# Conversation states
+AWAITING_PRIVACY = "awaiting_privacy"
+AWAITING_POST = "awaiting_post"
+
+
+class ConversationStates:
+    def __init__(self, maxsize=CONVERSATION_STATE_SIZE, ttl=CONVERSATION_STATE_TTL):
+        # One dict lookup per (user_id, state) replaces a live event handler per pending user;
+        # abandoned flows expire instead of piling up
+        self.states = TTLCache("conversations", maxsize, ttl)
+
+    def set(self, user_id, state, ttl=None, **data):
+        self.states.set((user_id, state), data, ttl)
+
+    def get(self, user_id, state):
+        return self.states.get((user_id, state))
+
+    def pop(self, user_id, state):
+        return self.states.pop((user_id, state))
+
+
+conversations = ConversationStates()
@@ -1,11 +1,61 @@
 # database.py
-from pymongo import MongoClient
-from config import DATABASE_NAME, COLLECTION_NAME, USERS_COLLECTION_NAME
+import asyncio
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+from pymongo import MongoClient, UpdateOne, ReturnDocument
+from config import (
+    DATABASE_NAME, COLLECTION_NAME, USERS_COLLECTION_NAME, TMDB_CACHE_COLLECTION_NAME, CHECKPOINTS_COLLECTION_NAME,
+    CHECKOUTS_COLLECTION_NAME, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS, MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS, MONGO_READ_PREFERENCE, MONGO_WRITE_CONCERN,
+    MONGO_EXECUTOR_WORKERS, USER_CACHE_SIZE, USER_CACHE_TTL, SEARCH_RANK_LIMIT
+)
+from cache import TTLCache
+from metrics import MONGO_LATENCY
+
+_client = None
+# Profiles behind the privacy and subscription checks; every write below updates it in place
+_user_cache = TTLCache("users", USER_CACHE_SIZE, USER_CACHE_TTL)
+# user id -> sequence number of the last profile write seen here; a read that overlaps a write is not cached
+_user_writes = TTLCache("user_writes", USER_CACHE_SIZE, USER_CACHE_TTL)
+_write_seq = itertools.count(1)
+# pymongo is blocking; handlers run every query here so the event loop keeps serving other users
+_executor = ThreadPoolExecutor(max_workers=MONGO_EXECUTOR_WORKERS, thread_name_prefix="mongo")
+# Called with the user id after every profile write, so other worker processes can drop their copy
+_user_listeners = []
+
+async def run_db(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    with MONGO_LATENCY.time(getattr(func, "__name__", "call")):
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+def get_client(mongo_uri):
+    # Every collection in the process shares this client and its connection pool
+    global _client
+    if _client is None:
+        _client = MongoClient(
+            mongo_uri,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            readPreference=MONGO_READ_PREFERENCE,
+            w=int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN
+        )
+    return _client
+
+def close_client():
+    global _client
+    _executor.shutdown(wait=True)
+    if _client is not None:
+        _client.close()
+        _client = None
 
 def get_db(mongo_uri):
-    client = MongoClient(mongo_uri)
-    db = client[DATABASE_NAME]
-    return db
+    return get_client(mongo_uri)[DATABASE_NAME]
 
 def get_videos_collection(mongo_uri):
     return get_db(mongo_uri)[COLLECTION_NAME]
@@ -13,35 +63,265 @@ def get_videos_collection(mongo_uri):
 def get_users_collection(mongo_uri):
     return get_db(mongo_uri)[USERS_COLLECTION_NAME]
 
+def get_checkpoints_collection(mongo_uri):
+    return get_db(mongo_uri)[CHECKPOINTS_COLLECTION_NAME]
+
+def get_tmdb_cache_collection(mongo_uri):
+    return get_db(mongo_uri)[TMDB_CACHE_COLLECTION_NAME]
+
+def get_checkouts_collection(mongo_uri):
+    return get_db(mongo_uri)[CHECKOUTS_COLLECTION_NAME]
+
 def save_video(collection, video_data):
     collection.update_one({"_id": video_data["_id"]}, {"$set": video_data}, upsert=True)
 
+def save_videos(collection, docs):
+    collection.bulk_write([UpdateOne({"_id": doc["_id"]}, {"$set": doc}, upsert=True) for doc in docs], ordered=False)
+
+def get_checkpoint(collection, name):
+    doc = collection.find_one({"_id": name})
+    return doc["last_id"] if doc else 0
+
+def save_checkpoint(collection, name, last_id, **fields):
+    collection.update_one({"_id": name}, {"$set": {"last_id": last_id, **fields}}, upsert=True)
+
+def get_video_media(collection, video_id):
+    doc = collection.find_one({"_id": video_id}, {"media": 1})
+    return doc.get("media") if doc else None
+
+def save_video_media(collection, video_id, media):
+    collection.update_one({"_id": video_id}, {"$set": {"media": media}})
+
 def delete_videos(collection, ids):
     collection.delete_many({"_id": {"$in": ids}})
 
+def on_user_change(listener):
+    _user_listeners.append(listener)
+
+def _user_written(user_id):
+    # Called before the cached profile is touched, so a read that checks afterwards sees the new number
+    _user_writes.set(user_id, next(_write_seq))
+
+def _user_changed(user_id):
+    for listener in _user_listeners:
+        listener(user_id)
+
+def forget_user(user_id):
+    # A profile written by another process; the next read fetches it again
+    _user_written(user_id)
+    _user_cache.pop(user_id)
+
+def _update_cached_user(user_id, fields):
+    # Write-through: keep a cached profile in step with the $set that was just applied
+    _user_written(user_id)
+    user = _user_cache.peek(user_id)
+    if user is not None:
+        _user_cache.set(user_id, {**user, **fields})
+    _user_changed(user_id)
+
 def add_user(collection, user_id):
     collection.update_one(
         {"_id": user_id},
         {"$set": {"privacy_policy_accepted": False}},
         upsert=True
     )
+    _update_cached_user(user_id, {"privacy_policy_accepted": False})
 
 def check_user_privacy_accepted(collection, user_id):
-    user = collection.find_one({"_id": user_id})
-    return user and user.get("privacy_policy_accepted", False)
+    return get_user(collection, user_id).get("privacy_policy_accepted", False)
 
 def accept_privacy_policy(collection, user_id):
-    collection.update_one(
+    result = collection.update_one(
         {"_id": user_id},
         {"$set": {"privacy_policy_accepted": True}}
     )
+    if result.matched_count:
+        _update_cached_user(user_id, {"privacy_policy_accepted": True})
+    else:
+        forget_user(user_id)
+        _user_changed(user_id)
+
+def _fetch_user(users_collection, user_id):
+    # Unknown users are cached as {} too, so repeated checks stay off Mongo until add_user.
+    # A write that lands while this read is in flight may not be in it: then the result is used once, not cached
+    written = _user_writes.peek(user_id)
+    user = users_collection.find_one({"_id": user_id}) or {}
+    with _user_writes._lock:
+        if _user_writes.peek(user_id) == written:
+            _user_cache.set(user_id, user)
+    return user
 
 def get_user(users_collection, user_id):
-    return users_collection.find_one({"_id": user_id}) or {}
+    user = _user_cache.get(user_id)
+    if user is None:
+        user = _fetch_user(users_collection, user_id)
+    return dict(user)
+
+async def load_user(users_collection, user_id):
+    # Cache hits are answered on the event loop; only misses go through the executor
+    user = _user_cache.get(user_id)
+    if user is None:
+        user = await run_db(_fetch_user, users_collection, user_id)
+    return dict(user)
 
 def update_user_subscription(users_collection, user_id, subscription_data):
+    if "expiry_date" in subscription_data:
+        # A new expiry date earns a new pre-expiry reminder
+        subscription_data = {**subscription_data, "expiry_reminded": False}
     users_collection.update_one(
         {"_id": user_id},
         {"$set": subscription_data},
         upsert=True
-    )
\ No newline at end of file
+    )
+    _update_cached_user(user_id, subscription_data)
+
+SUBSCRIPTION_SWEEP_PROJECTION = {"_id": 1, "expiry_date": 1, "plan_description": 1}
+EXPIRED_SUBSCRIPTION_FIELDS = {"is_paid": False, "paid_duration": 0, "plan_description": "Plan Expired"}
+
+def ensure_subscription_index(users_collection):
+    # Both sweeper queries are range scans on this index, never collection scans
+    users_collection.create_index([("is_paid", 1), ("expiry_date", 1)])
+
+def _claim_users(users_collection, query, fields, limit):
+    # Three round trips per batch: read it, claim it with one update_many under a fresh token, read back
+    # who was won. The update re-checks the query, so a user who renews (or is claimed by another sweeper
+    # or the lazy check) in between is left out, and never notified
+    batch = list(
+        users_collection.find(query, SUBSCRIPTION_SWEEP_PROJECTION).sort([("is_paid", 1), ("expiry_date", 1)]).limit(limit)
+    )
+    if not batch:
+        return []
+    ids = [user["_id"] for user in batch]
+    token = ObjectId()
+    users_collection.update_many({**query, "_id": {"$in": ids}}, {"$set": {**fields, "sweep_claim": token}})
+    claimed = {doc["_id"] for doc in users_collection.find({"_id": {"$in": ids}, "sweep_claim": token}, {"_id": 1})}
+    for user_id in claimed:
+        forget_user(user_id)
+        _user_changed(user_id)
+    return [user for user in batch if user["_id"] in claimed]
+
+def expire_subscriptions(users_collection, now, limit):
+    return _claim_users(users_collection, {"is_paid": True, "expiry_date": {"$lte": now}}, EXPIRED_SUBSCRIPTION_FIELDS, limit)
+
+def claim_expiry_reminders(users_collection, now, horizon, limit):
+    return _claim_users(
+        users_collection,
+        {"is_paid": True, "expiry_date": {"$gt": now, "$lte": horizon}, "expiry_reminded": {"$ne": True}},
+        {"expiry_reminded": True},
+        limit
+    )
+
+def expire_subscription(users_collection, user_id, now):
+    # The lazy check on a file request; returns the user only if this call, not the sweeper, expired them
+    claimed = _claim_users(users_collection, {"_id": user_id, "is_paid": True, "expiry_date": {"$lte": now}}, EXPIRED_SUBSCRIPTION_FIELDS, 1)
+    return claimed[0] if claimed else None
+
+def ensure_checkout_indexes(checkouts_collection):
+    # Mongo drops a checkout once expires_at passes; the sweeper and the per-user lookups are index scans
+    checkouts_collection.create_index("expires_at", expireAfterSeconds=0)
+    checkouts_collection.create_index([("state", 1), ("deadline", 1)])
+    checkouts_collection.create_index([("user_id", 1), ("state", 1)])
+
+def get_checkout_users(checkouts_collection, state):
+    return [doc["user_id"] for doc in checkouts_collection.find({"state": state}, {"user_id": 1})]
+
+def find_user_checkout(checkouts_collection, user_id, state):
+    return checkouts_collection.find_one({"user_id": user_id, "state": state})
+
+def create_checkout(checkouts_collection, checkout, supersede_state, superseded_state, expires_at):
+    # A user has at most one checkout in supersede_state; older ones move to superseded_state first
+    superseded = []
+    while True:
+        old = checkouts_collection.find_one_and_update(
+            {"user_id": checkout["user_id"], "state": supersede_state},
+            {"$set": {"state": superseded_state, "expires_at": expires_at}}
+        )
+        if old is None:
+            break
+        superseded.append(old)
+    checkouts_collection.insert_one(checkout)
+    return superseded
+
+def advance_checkout(checkouts_collection, checkout_id, from_state, to_state, expires_at, **fields):
+    # Conditional on the current state, so of two racing events (timeout and screenshot, two admin clicks) one wins
+    return checkouts_collection.find_one_and_update(
+        {"_id": checkout_id, "state": from_state},
+        {"$set": {"state": to_state, "expires_at": expires_at, **fields}},
+        return_document=ReturnDocument.AFTER
+    )
+
+def delete_checkout(checkouts_collection, checkout_id, user_id, state):
+    return checkouts_collection.find_one_and_delete({"_id": checkout_id, "user_id": user_id, "state": state})
+
+def expire_checkouts(checkouts_collection, state, expired_state, now, expires_at, limit):
+    due = list(
+        checkouts_collection.find({"state": state, "deadline": {"$lte": now}}, {"_id": 1})
+        .sort([("state", 1), ("deadline", 1)])
+        .limit(limit)
+    )
+    claimed = (advance_checkout(checkouts_collection, doc["_id"], state, expired_state, expires_at) for doc in due)
+    return [checkout for checkout in claimed if checkout is not None]
+
+QUALITY_LEVELS = ["2160p", "1080p", "720p", "480p"]
+CATEGORIES = ["movie", "series"]
+VIDEO_LIST_PROJECTION = {"_id": 1, "caption": 1, "file_size": 1}
+
+def _id_range(filter_query, **bounds):
+    # filter_query may already narrow _id to the search index candidates
+    return {**filter_query, "_id": {**filter_query.get("_id", {}), **{f"${op}": value for op, value in bounds.items()}}}
+
+def find_videos_below(collection, filter_query, below_id, skip=0, limit=5):
+    # The unranked tail of a search, newest first: the page after the one that ended at below_id.
+    # skip is only for a page reached without a cursor
+    cursor = collection.find(_id_range(filter_query, lt=below_id), VIDEO_LIST_PROJECTION).sort("_id", -1)
+    return list(cursor.skip(skip).limit(limit))
+
+def find_videos_above(collection, filter_query, above_id, below_id, limit=5):
+    # Paging back through the tail: the page before the one that started at above_id, still newest first
+    cursor = collection.find(_id_range(filter_query, gt=above_id, lt=below_id), VIDEO_LIST_PROJECTION).sort("_id", 1)
+    return list(cursor.limit(limit))[::-1]
+
+def get_videos_by_ids(collection, ids):
+    # Fetch one page of already-resolved ids, in the order given
+    docs = {doc["_id"]: doc for doc in collection.find({"_id": {"$in": list(ids)}}, VIDEO_LIST_PROJECTION)}
+    return [docs[video_id] for video_id in ids if video_id in docs]
+
+def search_videos(collection, search_filter, category=None, quality=None, rank=None, rank_limit=SEARCH_RANK_LIMIT):
+    # Only the facet counts go through $facet, whose output is a single document and so bound by the 16 MB
+    # limit; the total comes from them too. Quality counts ignore the quality filter and category counts
+    # ignore the category filter, so the buttons always show what switching to that facet would return.
+    # At most the newest rank_limit matches are read, and ordered by rank (from their quality and precomputed
+    # ranking features) if given. Older matches are the tail: fetched a page at a time below tail_before.
+    category_match = {"category": category} if category else {}
+    quality_match = {"quality": quality} if quality else {}
+    pipeline = [
+        {"$match": search_filter},
+        {"$project": {"_id": 0, "category": 1, "quality": 1}},
+        {"$facet": {
+            "qualities": [
+                {"$match": category_match},
+                {"$group": {"_id": "$quality", "count": {"$sum": 1}}}
+            ],
+            "categories": [
+                {"$match": quality_match},
+                {"$group": {"_id": "$category", "count": {"$sum": 1}}}
+            ]
+        }}
+    ]
+    facets = next(collection.aggregate(pipeline), {})
+    quality_counts = {group["_id"]: group["count"] for group in facets.get("qualities", [])}
+    category_counts = {group["_id"]: group["count"] for group in facets.get("categories", [])}
+    total = quality_counts.get(quality, 0) if quality else sum(quality_counts.values())
+    match = {**search_filter, **category_match, **quality_match}
+    id_projection = {"_id": 1, "quality": 1, "rank": 1} if rank else {"_id": 1}
+    docs = list(collection.find(match, id_projection).sort("_id", -1).limit(rank_limit))
+    ids = rank(docs) if rank else [doc["_id"] for doc in docs]
+    tail_before = docs[-1]["_id"] if total > len(docs) else None
+    return {
+        "ids": ids,
+        "total": total,
+        "tail_before": tail_before,
+        "filter": match if tail_before is not None else None,
+        "quality_counts": {q: quality_counts.get(q, 0) for q in QUALITY_LEVELS},
+        "category_counts": {c: category_counts.get(c, 0) for c in CATEGORIES}
+    }
\ No newline at end of file
@@ -0,0 +1,87 @@
+# expiry.py
+import asyncio
+from datetime import timedelta
+from telethon import Button
+from database import run_db, ensure_subscription_index, expire_subscriptions, claim_expiry_reminders
+from utils import get_current_datetime, logger
+from sender import sender, BULK
+from config import (
+    ADMIN_ID, BUTTON_RECHARGE, SUBSCRIPTION_EXPIRED_MESSAGE, SUBSCRIPTION_EXPIRED_ADMIN_MESSAGE,
+    SUBSCRIPTION_REMINDER_MESSAGE, SUBSCRIPTION_SWEEP_INTERVAL, SUBSCRIPTION_SWEEP_BATCH_SIZE,
+    SUBSCRIPTION_REMINDER_WINDOW
+)
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class SubscriptionSweeper:
+    def __init__(self, client, users_collection, clock=get_current_datetime, interval=SUBSCRIPTION_SWEEP_INTERVAL,
+                 batch_size=SUBSCRIPTION_SWEEP_BATCH_SIZE, reminder_window=SUBSCRIPTION_REMINDER_WINDOW):
+        self.client = client
+        self.users_collection = users_collection
+        self.clock = clock
+        self.interval = interval
+        self.batch_size = batch_size
+        self.reminder_window = timedelta(seconds=reminder_window)
+        self.expired = 0
+        self.reminded = 0
+
+    async def run(self):
+        await run_db(ensure_subscription_index, self.users_collection)
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Subscription sweep failed")
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self):
+        now = self.clock()
+        expired = await self._drain(expire_subscriptions, self._queue_expired, now)
+        reminded = await self._drain(claim_expiry_reminders, self._queue_reminder, now, now + self.reminder_window)
+        if expired or reminded:
+            logger.info("Subscription sweep: %s expired, %s reminded", expired, reminded)
+        self.expired += expired
+        self.reminded += reminded
+        return expired, reminded
+
+    async def _drain(self, claim, queue, *window):
+        # Each batch drops out of the next query once written, so this walks the index without skipping
+        total = 0
+        while True:
+            users = await run_db(claim, self.users_collection, *window, self.batch_size)
+            for user in users:
+                await queue(user)
+            total += len(users)
+            if len(users) < self.batch_size:
+                return total
+
+    async def _notify(self, chat_id, message, buttons=None):
+        # Bulk priority: interactive replies go first, and submit blocks once too many notices are pending
+        await sender.submit(chat_id, self.client.send_message, chat_id, message, buttons=buttons, parse_mode='html', priority=BULK)
+
+    async def _queue_expired(self, user):
+        expiry_date = user["expiry_date"].strftime(DATE_FORMAT)
+        await self._notify(
+            user["_id"],
+            SUBSCRIPTION_EXPIRED_MESSAGE.format(expiry_date=expiry_date),
+            [Button.inline(BUTTON_RECHARGE, data="recharge")]
+        )
+        await self._notify(
+            ADMIN_ID,
+            SUBSCRIPTION_EXPIRED_ADMIN_MESSAGE.format(
+                user_id=user["_id"],
+                expiry_date=expiry_date,
+                plan_description=user.get("plan_description", "Unknown Plan")
+            )
+        )
+
+    async def _queue_reminder(self, user):
+        await self._notify(
+            user["_id"],
+            SUBSCRIPTION_REMINDER_MESSAGE.format(
+                plan_description=user.get("plan_description", "subscription"),
+                expiry_date=user["expiry_date"].strftime(DATE_FORMAT)
+            ),
+            [Button.inline(BUTTON_RECHARGE, data="recharge")]
+        )
@@ -1 +1,17 @@
+from telethon import events
+from sender import reply
+from handlers.admin import register_admin_handlers
+from handlers.user import register_user_handlers
+from handlers.common import register_common_handlers
 
+
+def register_handlers(client, database_channel, admin_id, mongo_uri, videos_collection, users_collection):
+    # The bot process and every worker process register the same handlers in the same order
+    register_common_handlers(client, database_channel, admin_id, videos_collection, users_collection)
+    register_admin_handlers(client, database_channel, admin_id, mongo_uri, videos_collection, users_collection)
+    register_user_handlers(client, videos_collection, users_collection)
+
+    # Optional: Add /ping command to check bot is alive
+    @client.on(events.NewMessage(pattern="/ping"))
+    async def ping_handler(event):
+        await reply(event, "I'm alive! ✅")
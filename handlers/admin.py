@@ -1,16 +1,41 @@
 # handlers/admin.py
 from telethon import events, Button
-from database import delete_videos
+import asyncio
+from database import delete_videos, run_db, get_checkpoints_collection
+from backfill import backfill
+from ingestion import ingest_pipeline
+from metrics import track_handler, cache_stats, combined_stats
 from utils import generate_deep_link, check_privacy_policy, logger
+from catalog import apply_catalog_change
+from tmdb import tmdb_client
+from sender import sender, reply, delete_messages
 from config import *
 import base64
+def register_stats_handler(client, admin_id):
+    # With worker processes the bot process registers this ahead of the forwarding handler: the send queue
+    # and ingestion live there, and it holds the latest metrics every worker reported
+    @client.on(events.NewMessage(pattern=r'^/stats$'))
+    @track_handler("stats")
+    async def stats_handler(event):
+        if event.sender_id != admin_id:
+            logger.info("Non-admin %s tried /stats", event.sender_id)
+            return
+        lines = [CACHE_STATS_LINE.format(**stats) for stats in cache_stats().values()]
+        lines.append(TMDB_STATS_LINE.format(**combined_stats("tmdb", tmdb_client.stats())))
+        lines.append(INGEST_STATS_LINE.format(**ingest_pipeline.stats()))
+        lines.append(SEND_STATS_LINE.format(**sender.stats()))
+        await reply(event, STATS_MESSAGE.format(lines="\n".join(lines)), parse_mode='html')
+        raise events.StopPropagation
+
 def register_admin_handlers(client, database_channel, admin_id, mongo_uri, videos_collection, users_collection):
+    register_stats_handler(client, admin_id)
     @client.on(events.NewMessage(pattern=r'/delete (.+)'))
+    @track_handler("delete")
     async def delete_handler(event):
         async def proceed(event):
-            sender = await event.get_sender()
-            if sender.id != admin_id:
-                logger.info(f"Non-admin {sender.id} tried /delete")
+            sender_entity = await event.get_sender()
+            if sender_entity.id != admin_id:
+                logger.info("Non-admin %s tried /delete", sender_entity.id)
                 return
             ids_str = event.pattern_match.group(1).strip()
             if '-' in ids_str:
@@ -20,12 +45,13 @@ def register_admin_handlers(client, database_channel, admin_id, mongo_uri, video
                 ids = [int(i.strip()) for i in ids_str.split(',')]
             else:
                 ids = [int(ids_str)]
-            delete_videos(videos_collection, ids)
-            await client.delete_messages(database_channel, ids)
-            await event.reply(DELETE_CONFIRMATION.format(count=len(ids)), parse_mode='html')
+            await run_db(delete_videos, videos_collection, ids)
+            apply_catalog_change(removed=ids)
+            await delete_messages(client, database_channel, ids)
+            await reply(event, DELETE_CONFIRMATION.format(count=len(ids)), parse_mode='html')
 
         if event.sender_id == admin_id:
-            logger.info(f"Admin {admin_id} executing /delete")
+            logger.info("Admin %s executing /delete", admin_id)
             await proceed(event)
         else:
             accepted, msg = await check_privacy_policy(client, event, users_collection)
@@ -33,23 +59,51 @@ def register_admin_handlers(client, database_channel, admin_id, mongo_uri, video
                 await proceed(event)
 
     @client.on(events.NewMessage(pattern=r'/link(?:\s+(.+))?'))
+    @track_handler("link")
     async def link_handler(event):
-        sender = await event.get_sender()
-        logger.info(f"Sender ID: {sender.id}, Admin ID: {admin_id}")
-        if sender.id != admin_id:
-            logger.info(f"Non-admin {sender.id} tried /link")
+        sender_entity = await event.get_sender()
+        logger.debug("Sender ID: %s, Admin ID: %s", sender_entity.id, admin_id)
+        if sender_entity.id != admin_id:
+            logger.info("Non-admin %s tried /link", sender_entity.id)
             return
         movie_name = event.pattern_match.group(1).strip() if event.pattern_match.group(1) else None
         if not movie_name:
-            await event.reply(LINK_NO_MOVIE_MESSAGE, parse_mode='html')
+            await reply(event, LINK_NO_MOVIE_MESSAGE, parse_mode='html')
             return
         encoded_movie = base64.urlsafe_b64encode(movie_name.encode('utf-8')).decode('utf-8').rstrip('=')
         deep_link = generate_deep_link(BOT_USERNAME, movie_name)
         buttons = [
             [Button.inline(BUTTON_YES, data=f"post_yes:{encoded_movie}"), Button.inline(BUTTON_NO, data="post_no")]
         ]
-        await event.reply(
+        await reply(
+            event,
             LINK_PROMPT_MESSAGE.format(deep_link=deep_link),
             buttons=buttons,
             parse_mode='html'
-        )
\ No newline at end of file
+        )
+
+    backfill_task = None
+
+    @client.on(events.NewMessage(pattern=r'^/backfill(?:\s+(reset))?$'))
+    @track_handler("backfill")
+    async def backfill_handler(event):
+        nonlocal backfill_task
+        if event.sender_id != admin_id:
+            logger.info("Non-admin %s tried /backfill", event.sender_id)
+            return
+        if backfill_task is not None and not backfill_task.done():
+            await reply(event, BACKFILL_RUNNING_MESSAGE, parse_mode='html')
+            return
+        reset = bool(event.pattern_match.group(1))
+
+        async def run():
+            try:
+                stats = await backfill(client, database_channel, videos_collection, get_checkpoints_collection(mongo_uri), reset=reset)
+                await reply(event, BACKFILL_DONE_MESSAGE.format(**stats), parse_mode='html')
+            except Exception as e:
+                logger.exception("Backfill failed")
+                await reply(event, BACKFILL_FAILED_MESSAGE.format(error=e), parse_mode='html')
+
+        # Runs in the background so the bot keeps serving users during a long reindex
+        backfill_task = asyncio.create_task(run())
+        await reply(event, BACKFILL_STARTED_MESSAGE.format(mode=" from the first message" if reset else ""), parse_mode='html')
\ No newline at end of file
@@ -1,133 +1,198 @@
 from telethon import events, Button, errors
-import re
-import asyncio
-from database import save_video, update_user_subscription
-from utils import convert_file_size, normalize_query, fetch_tmdb_details, check_privacy_policy, logger
+import functools
+from database import update_user_subscription, search_videos, get_videos_by_ids, find_videos_below, find_videos_above, accept_privacy_policy, run_db
+from utils import normalize_query, fetch_tmdb_details, check_privacy_policy, logger
+from logs import log_sampled
+from search_index import search_index, build_search_filter, rank_ids
+from singleflight import SingleFlight
+from search_cache import search_cache
+from search_session import search_sessions
+from conversation import conversations, AWAITING_PRIVACY, AWAITING_POST
+from checkout import checkouts, new_checkout_id, delete_payment_message, AWAITING_SCREENSHOT, PENDING_REVIEW, CONFIRMED, REJECTED
+from media import media_cache
+from ingestion import build_video_doc, ingest_pipeline
+from sender import send_message, reply, edit, delete, BULK
+from metrics import track_handler, track_callback
+from render import render_results, send_rendered, edit_rendered
 from config import *
 from handlers.subscription import check_and_handle_subscription
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
-import os
+
+search_flight = SingleFlight("search")
+
+async def _search(videos_collection, key):
+    clean_query, category, quality = key
+    version = search_cache.version
+    rank = functools.partial(rank_ids, clean_query)
+    result = await run_db(search_videos, videos_collection, build_search_filter(clean_query), category, quality, rank)
+    search_cache.set(key, result, version)
+    return result
+
+async def resolve_search(videos_collection, clean_query, category=None, quality=None):
+    key = (clean_query, category, quality)
+    result = search_cache.get(key)
+    if result is None:
+        # Identical searches in flight at the same time (e.g. a deep-link burst) share one Mongo query
+        result = await search_flight.do(key, _search, videos_collection, key)
+    return result
+
+async def fetch_page(videos_collection, result, page=0, per_page=5, cursor=None):
+    # The ranked ids are sliced by page number. The tail past them is paged by _id: cursor "a<id>" continues
+    # below the previous page's last video, "b<id>" comes back up from the next page's first one
+    ids = result["ids"]
+    start = page * per_page
+    page_ids = ids[start:start + per_page]
+    results = await run_db(get_videos_by_ids, videos_collection, page_ids) if page_ids else []
+    tail = []
+    tail_before = result["tail_before"]
+    if len(page_ids) < per_page and tail_before is not None:
+        limit = per_page - len(page_ids)
+        if page_ids or cursor is None:
+            tail = await run_db(find_videos_below, videos_collection, result["filter"], tail_before, max(0, start - len(ids)), limit)
+        elif cursor[0] == "a":
+            tail = await run_db(find_videos_below, videos_collection, result["filter"], int(cursor[1:]), 0, limit)
+        else:
+            tail = await run_db(find_videos_above, videos_collection, result["filter"], int(cursor[1:]), tail_before, limit)
+    return {
+        **result,
+        "results": results + tail,
+        "next_cursor": f"a{tail[-1]['_id']}" if tail else None,
+        # Only when the previous page is all tail too; otherwise its page number places it
+        "prev_cursor": f"b{tail[0]['_id']}" if tail and not page_ids and start - per_page >= len(ids) else None
+    }
+
+async def session_search(videos_collection, session, category=None, quality=None, page=0, per_page=5, cursor=None):
+    # Sessions keep the resolved ids and facets; they are reused until the catalog changes
+    key = (category, quality)
+    version = search_cache.version
+    cached = session["results"].get(key)
+    if cached is None or cached[0] != version:
+        result = await resolve_search(videos_collection, session["clean_query"], category, quality)
+        session["results"][key] = (version, result)
+    else:
+        result = cached[1]
+    return await fetch_page(videos_collection, result, page, per_page, cursor)
+
+async def handle_payment_screenshot(client, event, checkout):
+    # Returns False when the checkout timed out or was canceled since it was looked up
+    user_id = event.sender_id
+    if event.photo:
+        if await checkouts.advance(checkout["_id"], AWAITING_SCREENSHOT, PENDING_REVIEW, screenshot_at=datetime.utcnow()) is None:
+            return False
+        logger.info("Screenshot received from user %s", user_id)
+        days, amount = checkout["days"], checkout["amount"]
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        admin_message_text = PAYMENT_ADMIN_REQUEST_MESSAGE.format(
+            user_id=user_id, amount=amount, days=days, timestamp=timestamp
+        )
+        await send_message(
+            client,
+            ADMIN_ID,
+            admin_message_text,
+            file=event.message.media,
+            buttons=[
+                [Button.inline("✅ Confirm", data=f"confirm_payment:{checkout['_id']}"),
+                 Button.inline("❌ Reject", data=f"reject_payment:{checkout['_id']}")]
+            ],
+            parse_mode='html'
+        )
+        await delete(event.message)
+        await delete_payment_message(client, checkout)
+        await send_message(client, user_id, PAYMENT_VERIFICATION_MESSAGE, parse_mode='html')
+    else:
+        log_sampled(logger, "Ignoring non-photo message from user %s: %s", user_id, event.message.text or 'media')
+        await delete(event.message)
+    return True
+
+async def handle_post_content(client, event, state):
+    conversations.pop(event.sender_id, AWAITING_POST)
+    buttons = [[Button.url(DEEP_LINK_BUTTON, state["deep_link"])]]
+    await send_message(
+        client,
+        MAIN_CHANNEL_ID,
+        message=event.message.text or "",
+        file=event.message.media,
+        buttons=buttons,
+        parse_mode='html'
+    )
+    await reply(event, POST_SENT_MESSAGE, parse_mode='html')
 
 async def search_handler(event, query=None, videos_collection=None):
     if event.is_private and (query or not event.message.text.startswith('/')):
         query = query or event.message.text.strip()
         clean_query = normalize_query(query)
-        regex_pattern = ".*".join(re.escape(word) for word in clean_query.split())
-        results = list(videos_collection.find({"caption": {"$regex": regex_pattern, "$options": "i"}}))
-        if not results:
-            await event.reply(NO_RESULTS_MESSAGE.format(query=query), parse_mode='html')
-            return
-        tmdb_details = fetch_tmdb_details(query)
+        sid = search_sessions.create(query, clean_query)
+        session = search_sessions.get(sid)
         page = 0
         per_page = 5
-        total_pages = (len(results) + per_page - 1) // per_page
-        start = page * per_page
-        end = start + per_page
-        buttons = []
-        for doc in results[start:end]:
-            caption = doc["caption"][:50] + "..." if len(doc["caption"]) > 50 else doc["caption"]
-            button_text = f"[{doc['file_size']}] {caption}"
-            buttons.append([Button.inline(button_text, data=f"select:{doc['_id']}")])
-        if total_pages > 1:
-            nav_buttons = []
-            if page > 0:
-                nav_buttons.append(Button.inline(BUTTON_PREV, data=f"page:{query}:{page-1}:none:none"))
-            nav_buttons.append(Button.inline(BUTTON_PAGE_INFO.format(page=page+1, total=total_pages), data="noop"))
-            if page < total_pages - 1:
-                nav_buttons.append(Button.inline(BUTTON_NEXT, data=f"page:{query}:{page+1}:none:none"))
-            buttons.append(nav_buttons)
-        quality_counts = {
-            "2160p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "2160p"}),
-            "1080p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "1080p"}),
-            "720p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "720p"}),
-            "480p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "480p"})
-        }
-        quality_buttons = []
-        for quality, count in quality_counts.items():
-            if count > 0:
-                quality_buttons.append(Button.inline(f"{quality}", data=f"quality:{query}:{quality}:none:none"))
-        if quality_buttons:
-            buttons.append(quality_buttons)
-        movie_count = videos_collection.count_documents({
-            "caption": {"$regex": regex_pattern, "$options": "i"},
-            "category": "movie"
-        })
-        series_count = videos_collection.count_documents({
-            "caption": {"$regex": regex_pattern, "$options": "i"},
-            "category": "series"
-        })
-        filter_buttons = []
-        if movie_count > 0:
-            filter_buttons.append(Button.inline(BUTTON_MOVIES, data=f"filter:{query}:movie:none:none"))
-        if series_count > 0:
-            filter_buttons.append(Button.inline(BUTTON_SERIES, data=f"filter:{query}:series:none:none"))
-        buttons.append(filter_buttons)
-        buttons.append([Button.inline(BUTTON_CLOSE, data="close")])
-        if tmdb_details:
-            # Dynamically construct the message based on available details
-            message_lines = [f"{EMOJI_TYPE} <b>{tmdb_details['type']}</b> :- <a href='{tmdb_details['poster_url']}'>{tmdb_details['name']}</a>"]
-            if tmdb_details.get('release_line'):
-                message_lines.append(f"{EMOJI_RELEASE} {tmdb_details['release_line']}")
-            if tmdb_details.get('rating_line'):
-                message_lines.append(f"{EMOJI_RATING} {tmdb_details['rating_line']}")
-            if tmdb_details.get('duration_line'):
-                message_lines.append(f"{EMOJI_DURATION} {tmdb_details['duration_line']}")
-            if tmdb_details.get('season_line'):
-                message_lines.append(f"{EMOJI_SEASON} {tmdb_details['season_line']}")
-            if tmdb_details.get('audio_line'):
-                message_lines.append(f"{EMOJI_AUDIO} {tmdb_details['audio_line']}")
-            if tmdb_details.get('genre_line'):
-                message_lines.append(f"{EMOJI_GENRE} {tmdb_details['genre_line']}")
-            if tmdb_details.get('trailer_line'):
-                message_lines.append(f"{EMOJI_TRAILER} {tmdb_details['trailer_line']}")
-            if tmdb_details.get('platforms_line'):
-                message_lines.append(f"{EMOJI_PLATFORMS} {tmdb_details['platforms_line']}")
-            message = "\n".join(message_lines)
-            await event.reply(
-                message,
-                buttons=buttons,
-                parse_mode='html'
-            )
-        else:
-            await event.reply(
-                FALLBACK_SEARCH_RESULT_MESSAGE.format(query=query),
-                buttons=buttons,
-                parse_mode='html'
-            )
+        facets = await session_search(videos_collection, session, page=page, per_page=per_page)
+        if not facets["total"]:
+            # Likely a typo: offer the closest spellings the catalog actually has
+            suggestions = search_index.did_you_mean(clean_query)
+            if suggestions:
+                session["suggestions"] = suggestions
+                buttons = [[Button.inline(BUTTON_DID_YOU_MEAN.format(query=suggestion), data=f"suggest:{sid}:{i}")]
+                           for i, suggestion in enumerate(suggestions)]
+                buttons.append([Button.inline(BUTTON_CLOSE, data="close")])
+                await reply(event, DID_YOU_MEAN_MESSAGE.format(query=query), buttons=buttons, parse_mode='html')
+                return
+            search_sessions.discard(sid)
+            await reply(event, NO_RESULTS_MESSAGE.format(query=query), parse_mode='html')
+            return
+        tmdb_details = session["details"] = await fetch_tmdb_details(query)
+        text, buttons = render_results(sid, query, tmdb_details, facets, page, per_page)
+        await send_rendered(event, text, buttons)
+
+def register_ingest_handler(client, database_channel, videos_collection):
+    # Also used on its own by the worker front end, which keeps ingestion in the bot process
+    ingest_pipeline.use(videos_collection)
 
-def register_common_handlers(client, database_channel, admin_id, videos_collection, users_collection):
     @client.on(events.NewMessage(chats=database_channel))
+    @track_handler("ingest")
     async def handle_video(event):
-        if event.video:
-            message_id = event.message.id
-            caption = event.message.message or ""
-            file_size = event.message.file.size
-            file_size_str = convert_file_size(file_size)
-            series_patterns = [r'E\d+', r'S\d+', r'S\d+E\d+']
-            category = "series" if any(re.search(pattern, caption, re.IGNORECASE) for pattern in series_patterns) else "movie"
-            quality_patterns = [r'2160[Pp]', r'1080[Pp]', r'720[Pp]', r'480[Pp]']
-            quality = next((re.search(pattern, caption, re.IGNORECASE).group().lower() for pattern in quality_patterns if re.search(pattern, caption, re.IGNORECASE)), "unknown")
-            video_data = {
-                "_id": message_id,
-                "caption": caption,
-                "file_size": file_size_str,
-                "category": category,
-                "quality": quality
-            }
-            save_video(videos_collection, video_data)
+        video_data = build_video_doc(event.message)
+        if video_data:
+            await ingest_pipeline.put(video_data)
+
+def register_common_handlers(client, database_channel, admin_id, videos_collection, users_collection):
+    media_cache.use(client, database_channel, videos_collection)
+    # Checkouts live next to the user profiles
+    checkouts.use(users_collection.database[CHECKOUTS_COLLECTION_NAME])
+
+    # Registered before the user handlers so a pending conversation step consumes the message first
+    @client.on(events.NewMessage(incoming=True))
+    @track_handler("conversation")
+    async def conversation_handler(event):
+        if not event.is_private:
+            return
+        checkout = await checkouts.awaiting_screenshot(event.sender_id, photo=bool(event.photo))
+        if checkout is not None and await handle_payment_screenshot(client, event, checkout):
+            raise events.StopPropagation
+        if event.sender_id == admin_id:
+            state = conversations.get(event.sender_id, AWAITING_POST)
+            if state is not None:
+                await handle_post_content(client, event, state)
+                raise events.StopPropagation
+
+    register_ingest_handler(client, database_channel, videos_collection)
 
     @client.on(events.CallbackQuery)
+    @track_callback
     async def callback_handler(event):
         data = event.data.decode()
         user_id = event.sender_id
-        logger.info(f"Handling callback '{data}' for user {user_id}")
+        log_sampled(logger, "Handling callback '%s' for user %s", data, user_id)
         if data.startswith("accept_privacy:"):
             if data == f"accept_privacy:{user_id}":
-                logger.info(f"User {user_id} accepting privacy policy")
-                from database import accept_privacy_policy
-                accept_privacy_policy(users_collection, user_id)
-                await event.edit(PRIVACY_ACCEPTED_MESSAGE, parse_mode='html')
+                logger.info("User %s accepting privacy policy", user_id)
+                await run_db(accept_privacy_policy, users_collection, user_id)
+                try:
+                    await edit(event, PRIVACY_ACCEPTED_MESSAGE, buttons=None, parse_mode='html')
+                except errors.MessageNotModifiedError:
+                    logger.info("Message not modified for user %s, proceeding anyway", user_id)
+                state = conversations.pop(user_id, AWAITING_PRIVACY)
+                if state and state["callback"]:
+                    await state["callback"]()
             return
 
         accepted, msg = await check_privacy_policy(client, event, users_collection)
@@ -135,13 +200,13 @@ def register_common_handlers(client, database_channel, admin_id, videos_collecti
             await process_callback(client, event, data, database_channel, admin_id, videos_collection, users_collection)
 
 async def process_callback(client, event, data, database_channel, admin_id, videos_collection, users_collection):
-    logger.info(f"Processing callback '{data}' for user {event.sender_id}")
+    log_sampled(logger, "Processing callback '%s' for user %s", data, event.sender_id)
     if data.startswith("select:"):
         msg_id = int(data.split(":")[1])
-        file_message = await client.get_messages(database_channel, ids=msg_id)
-        await check_and_handle_subscription(client, event, event.sender_id, users_collection, file_message)
+        await check_and_handle_subscription(client, event, event.sender_id, users_collection, msg_id)
     elif data == "recharge":
-        await event.edit(
+        await edit(
+            event,
             RECHARGE_PROMPT_MESSAGE,
             buttons=[
                 [Button.inline("₹40 - 1 Month", data="plan:30:40")],
@@ -155,90 +220,52 @@ async def process_callback(client, event, data, database_channel, admin_id, vide
     elif data.startswith("plan:"):
         days, amount = map(int, data.split(":")[1:])
         user_id = event.sender_id
-        await event.delete()
-        qr_message = await client.get_messages(database_channel, ids=QR_PHOTO_ID)
+        checkout_id = new_checkout_id()
+        await delete(event)
         payment_message_text = PAYMENT_REQUEST_MESSAGE.format(amount=amount, payment_id=PAYMENT_ID)
-        if not qr_message or not qr_message.photo:
-            logger.error(f"QR code message ID {QR_PHOTO_ID} not found or has no photo in database channel")
-            payment_message = await client.send_message(
-                user_id,
-                payment_message_text,
-                buttons=[[Button.inline(BUTTON_CANCEL, data=f"cancel_payment:{user_id}")]],
-                parse_mode='html'
-            )
-        else:
-            payment_message = await client.send_message(
+        # The QR isn't a catalog video, so its reference is only kept in memory
+        payment_message = await media_cache.send(
+            user_id,
+            QR_PHOTO_ID,
+            persist=False,
+            message=payment_message_text,
+            buttons=[[Button.inline(BUTTON_CANCEL, data=f"cancel_payment:{checkout_id}")]],
+            parse_mode='html'
+        )
+        if payment_message is None:
+            logger.error("QR code message ID %s not found or has no photo in database channel", QR_PHOTO_ID)
+            payment_message = await send_message(
+                client,
                 user_id,
                 payment_message_text,
-                file=qr_message.media,
-                buttons=[[Button.inline(BUTTON_CANCEL, data=f"cancel_payment:{user_id}")]],
+                buttons=[[Button.inline(BUTTON_CANCEL, data=f"cancel_payment:{checkout_id}")]],
                 parse_mode='html'
             )
-        logger.info(f"Payment request with QR sent to user {user_id}, message ID {payment_message.id}")
-
-        payment_done = asyncio.Event()
-
-        async def screenshot_handler(inner_event):
-            if inner_event.is_private and inner_event.sender_id == user_id:
-                if inner_event.photo:
-                    logger.info(f"Screenshot received from user {user_id}")
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    admin_message_text = PAYMENT_ADMIN_REQUEST_MESSAGE.format(
-                        user_id=user_id, amount=amount, days=days, timestamp=timestamp
-                    )
-                    await client.send_message(
-                        ADMIN_ID,
-                        admin_message_text,
-                        file=inner_event.message.media,
-                        buttons=[
-                            [Button.inline("✅ Confirm", data=f"confirm_payment:{user_id}:{days}:{amount}"),
-                             Button.inline("❌ Reject", data=f"reject_payment:{user_id}")]
-                        ],
-                        parse_mode='html'
-                    )
-                    await inner_event.message.delete()
-                    await payment_message.delete()
-                    await client.send_message(user_id, PAYMENT_VERIFICATION_MESSAGE, parse_mode='html')
-                    payment_done.set()
-                else:
-                    logger.info(f"Ignoring non-photo message from user {user_id}: {inner_event.message.text or 'media'}")
-                    await inner_event.message.delete()
-                raise events.StopPropagation
+        logger.info("Payment request with QR sent to user %s, message ID %s", user_id, payment_message.id)
 
-        async def cancel_payment_handler(cancel_event):
-            if cancel_event.sender_id == user_id and cancel_event.data == f"cancel_payment:{user_id}".encode():
-                logger.info(f"User {user_id} canceled payment process")
-                await payment_message.delete()
-                await client.send_message(user_id, PAYMENT_CANCELLED_MESSAGE, parse_mode='html')
-                payment_done.set()
-                raise events.StopPropagation
-
-        client.add_event_handler(screenshot_handler, events.NewMessage(incoming=True))
-        client.add_event_handler(cancel_payment_handler, events.CallbackQuery())
-
-        try:
-            await asyncio.wait_for(payment_done.wait(), timeout=300)
-        except asyncio.TimeoutError:
-            logger.info(f"Timeout reached, deleting message ID {payment_message.id} for user {user_id}")
-            await payment_message.delete()
-            await client.send_message(
-                user_id,
-                PAYMENT_TIMEOUT_MESSAGE,
-                buttons=[Button.inline("♻️Send Again♻️", data=f"plan:{days}:{amount}")],
-                parse_mode='html'
-            )
-            logger.info(f"Payment timeout for user {user_id}")
+        # Timeouts are handled by the checkout sweeper; a checkout this replaces loses its QR message
+        for superseded in await checkouts.open(user_id, days, amount, checkout_id, payment_message):
+            await delete_payment_message(client, superseded)
 
-        client.remove_event_handler(screenshot_handler)
-        client.remove_event_handler(cancel_payment_handler)
+    elif data.startswith("cancel_payment:"):
+        user_id = event.sender_id
+        checkout = await checkouts.cancel(data.split(":")[1], user_id)
+        if checkout:
+            logger.info("User %s canceled payment process", user_id)
+            await delete_payment_message(client, checkout)
+            await send_message(client, user_id, PAYMENT_CANCELLED_MESSAGE, parse_mode='html')
 
     elif data.startswith("confirm_payment:"):
-        parts = data.split(":")
-        user_id, days, amount = int(parts[1]), int(parts[2]), int(parts[3])
         if event.sender_id == admin_id:
-            logger.info(f"Admin {admin_id} confirmed payment for user {user_id}: {amount}₹ for {days} days")
+            checkout = await checkouts.advance(data.split(":")[1], PENDING_REVIEW, CONFIRMED, reviewed_at=datetime.utcnow())
+            if checkout is None:
+                await event.answer(PAYMENT_ALREADY_HANDLED_MESSAGE)
+                return
+            user_id, days, amount = checkout["user_id"], checkout["days"], checkout["amount"]
+            logger.info("Admin %s confirmed payment for user %s: %s₹ for %s days", admin_id, user_id, amount, days)
             expiry_date = datetime.now() + timedelta(days=days)
-            update_user_subscription(
+            await run_db(
+                update_user_subscription,
                 users_collection,
                 user_id,
                 {
@@ -248,366 +275,150 @@ async def process_callback(client, event, data, database_channel, admin_id, vide
                     "expiry_date": expiry_date
                 }
             )
-            logger.info(f"Updated subscription for user {user_id}: {days} days, expiry: {expiry_date}")
-            await client.send_message(user_id, PAYMENT_CONFIRMED_MESSAGE.format(amount=amount, days=days), parse_mode='html')
-            logger.info(f"Deleting admin message with screenshot for user {user_id}")
-            await event.delete()
-            await client.send_message(
+            logger.info("Updated subscription for user %s: %s days, expiry: %s", user_id, days, expiry_date)
+            await send_message(client, user_id, PAYMENT_CONFIRMED_MESSAGE.format(amount=amount, days=days), parse_mode='html')
+            logger.info("Deleting admin message with screenshot for user %s", user_id)
+            await delete(event)
+            await send_message(
+                client,
                 ADMIN_ID,
                 PAYMENT_ADMIN_CONFIRMED_MESSAGE.format(user_id=user_id, amount=amount, days=days),
-                parse_mode='html'
+                parse_mode='html',
+                priority=BULK
             )
         else:
             await event.answer(PAYMENT_ADMIN_ONLY_MESSAGE)
 
     elif data.startswith("reject_payment:"):
-        user_id = int(data.split(":")[1])
         if event.sender_id == admin_id:
-            logger.info(f"Admin {admin_id} rejected payment for user {user_id}")
-            await client.send_message(user_id, PAYMENT_REJECTED_MESSAGE, parse_mode='html')
-            logger.info(f"Deleting admin message with screenshot for user {user_id}")
-            await event.delete()
-            await client.send_message(
+            checkout = await checkouts.advance(data.split(":")[1], PENDING_REVIEW, REJECTED, reviewed_at=datetime.utcnow())
+            if checkout is None:
+                await event.answer(PAYMENT_ALREADY_HANDLED_MESSAGE)
+                return
+            user_id = checkout["user_id"]
+            logger.info("Admin %s rejected payment for user %s", admin_id, user_id)
+            await send_message(client, user_id, PAYMENT_REJECTED_MESSAGE, parse_mode='html')
+            logger.info("Deleting admin message with screenshot for user %s", user_id)
+            await delete(event)
+            await send_message(
+                client,
                 ADMIN_ID,
                 PAYMENT_ADMIN_REJECTED_MESSAGE.format(user_id=user_id),
-                parse_mode='html'
+                parse_mode='html',
+                priority=BULK
             )
         else:
             await event.answer(PAYMENT_ADMIN_ONLY_MESSAGE)
 
+    elif data.startswith("suggest:"):
+        _, sid, index = data.split(":")
+        session = search_sessions.get(sid)
+        if session is None or "suggestions" not in session:
+            await event.answer(SEARCH_EXPIRED_MESSAGE, alert=True)
+            return
+        await event.answer()
+        search_sessions.discard(sid)
+        await search_handler(event, query=session["suggestions"][int(index)], videos_collection=videos_collection)
+
     elif data.startswith("page:"):
-        query, page, category, quality = data.split(":")[1], int(data.split(":")[2]), data.split(":")[3], data.split(":")[4] if len(data.split(":")) > 4 else None
-        tmdb_details = fetch_tmdb_details(query)
-        clean_query = normalize_query(query)
-        regex_pattern = ".*".join(re.escape(word) for word in clean_query.split())
-        filter_query = {"caption": {"$regex": regex_pattern, "$options": "i"}}
-        if category and category != "none":
-            filter_query["category"] = category
-        if quality and quality != "none":
-            filter_query["quality"] = quality
-        results = list(videos_collection.find(filter_query))
+        sid, page, category, quality = data.split(":")[1], int(data.split(":")[2]), data.split(":")[3], data.split(":")[4] if len(data.split(":")) > 4 else None
+        cursor = data.split(":")[5] if len(data.split(":")) > 5 else None
+        if cursor is not None and not (cursor[:1] in ("a", "b") and cursor[1:].isdigit()):
+            cursor = None
+        session = search_sessions.get(sid)
+        if session is None:
+            await event.answer(SEARCH_EXPIRED_MESSAGE, alert=True)
+            return
+        query, tmdb_details = session["query"], session["details"]
         per_page = 5
-        total_pages = (len(results) + per_page - 1) // per_page
-        start = page * per_page
-        end = start + per_page
-        buttons = []
-        for doc in results[start:end]:
-            caption = doc["caption"][:50] + "..." if len(doc["caption"]) > 50 else doc["caption"]
-            button_text = f"[{doc['file_size']}] {caption}"
-            buttons.append([Button.inline(button_text, data=f"select:{doc['_id']}")])
-        if total_pages > 1:
-            nav_buttons = []
-            if page > 0:
-                nav_buttons.append(Button.inline(BUTTON_PREV, data=f"page:{query}:{page-1}:{category or 'none'}:{quality or 'none'}"))
-            nav_buttons.append(Button.inline(BUTTON_PAGE_INFO.format(page=page+1, total=total_pages), data="noop"))
-            if page < total_pages - 1:
-                nav_buttons.append(Button.inline(BUTTON_NEXT, data=f"page:{query}:{page+1}:{category or 'none'}:{quality or 'none'}"))
-            buttons.append(nav_buttons)
-        quality_counts = {
-            "2160p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "2160p", "category": category} if category != "none" else {"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "2160p"}),
-            "1080p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "1080p", "category": category} if category != "none" else {"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "1080p"}),
-            "720p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "720p", "category": category} if category != "none" else {"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "720p"}),
-            "480p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "480p", "category": category} if category != "none" else {"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "480p"})
-        }
-        quality_buttons = []
-        for q, count in quality_counts.items():
-            if count > 0:
-                quality_buttons.append(Button.inline(f"{q}" + (BUTTON_TICK if quality == q else ""), data=f"quality:{query}:{q}:{category or 'none'}:{quality or 'none'}"))
-        if quality_buttons:
-            buttons.append(quality_buttons)
-        movie_count = videos_collection.count_documents({
-            "caption": {"$regex": regex_pattern, "$options": "i"},
-            "category": "movie",
-            "quality": quality if quality and quality != "none" else {"$exists": True}
-        })
-        series_count = videos_collection.count_documents({
-            "caption": {"$regex": regex_pattern, "$options": "i"},
-            "category": "series",
-            "quality": quality if quality and quality != "none" else {"$exists": True}
-        })
-        filter_buttons = []
-        if movie_count > 0:
-            filter_buttons.append(Button.inline(
-                BUTTON_MOVIES + (BUTTON_TICK if category == "movie" else ""),
-                data=f"filter:{query}:movie:{quality or 'none'}:{category or 'none'}"
-            ))
-        if series_count > 0:
-            filter_buttons.append(Button.inline(
-                BUTTON_SERIES + (BUTTON_TICK if category == "series" else ""),
-                data=f"filter:{query}:series:{quality or 'none'}:{category or 'none'}"
-            ))
-        buttons.append(filter_buttons)
-        buttons.append([Button.inline(BUTTON_CLOSE, data="close")])
-        try:
-            if tmdb_details:
-                message_lines = [f"{EMOJI_TYPE} <b>{tmdb_details['type']}</b> :- <a href='{tmdb_details['poster_url']}'>{tmdb_details['name']}</a>"]
-                if tmdb_details.get('release_line'):
-                    message_lines.append(f"{EMOJI_RELEASE} {tmdb_details['release_line']}")
-                if tmdb_details.get('rating_line'):
-                    message_lines.append(f"{EMOJI_RATING} {tmdb_details['rating_line']}")
-                if tmdb_details.get('duration_line'):
-                    message_lines.append(f"{EMOJI_DURATION} {tmdb_details['duration_line']}")
-                if tmdb_details.get('season_line'):
-                    message_lines.append(f"{EMOJI_SEASON} {tmdb_details['season_line']}")
-                if tmdb_details.get('audio_line'):
-                    message_lines.append(f"{EMOJI_AUDIO} {tmdb_details['audio_line']}")
-                if tmdb_details.get('genre_line'):
-                    message_lines.append(f"{EMOJI_GENRE} {tmdb_details['genre_line']}")
-                if tmdb_details.get('trailer_line'):
-                    message_lines.append(f"{EMOJI_TRAILER} {tmdb_details['trailer_line']}")
-                if tmdb_details.get('platforms_line'):
-                    message_lines.append(f"{EMOJI_PLATFORMS} {tmdb_details['platforms_line']}")
-                message = "\n".join(message_lines)
-                await event.edit(
-                    message,
-                    buttons=buttons,
-                    parse_mode='html'
-                )
-            else:
-                await event.edit(
-                    FALLBACK_SEARCH_RESULT_MESSAGE.format(query=query),
-                    buttons=buttons,
-                    parse_mode='html'
-                )
-        except errors.MessageNotModifiedError:
-            pass
+        facets = await session_search(
+            videos_collection,
+            session,
+            category=category if category and category != "none" else None,
+            quality=quality if quality and quality != "none" else None,
+            page=page,
+            per_page=per_page,
+            cursor=cursor
+        )
+        text, buttons = render_results(
+            sid, query, tmdb_details, facets, page, per_page,
+            category=category if category and category != "none" else None,
+            quality=quality if quality and quality != "none" else None
+        )
+        await edit_rendered(event, text, buttons)
 
     elif data.startswith("filter:"):
-        query, new_category, current_quality, current_category = data.split(":")[1], data.split(":")[2], data.split(":")[3], data.split(":")[4] if len(data.split(":")) > 4 else "none"
-        tmdb_details = fetch_tmdb_details(query)
-        clean_query = normalize_query(query)
-        regex_pattern = ".*".join(re.escape(word) for word in clean_query.split())
-        filter_query = {"caption": {"$regex": regex_pattern, "$options": "i"}}
+        sid, new_category, current_quality, current_category = data.split(":")[1], data.split(":")[2], data.split(":")[3], data.split(":")[4] if len(data.split(":")) > 4 else "none"
+        session = search_sessions.get(sid)
+        if session is None:
+            await event.answer(SEARCH_EXPIRED_MESSAGE, alert=True)
+            return
+        query, tmdb_details = session["query"], session["details"]
         has_quality_filter = current_quality and current_quality != "none"
         has_category_filter = current_category and current_category != "none"
         if new_category == current_category and has_category_filter:
-            if has_quality_filter:
-                filter_query["quality"] = current_quality
-                selected_category = None
-            else:
-                selected_category = None
+            selected_category = None
         else:
             selected_category = new_category if new_category != "none" else None
-            if selected_category:
-                filter_query["category"] = selected_category
-            if has_quality_filter:
-                filter_query["quality"] = current_quality
-        results = list(videos_collection.find(filter_query))
         page = 0
         per_page = 5
-        total_pages = (len(results) + per_page - 1) // per_page
-        start = page * per_page
-        end = start + per_page
-        buttons = []
-        for doc in results[start:end]:
-            caption = doc["caption"][:50] + "..." if len(doc["caption"]) > 50 else doc["caption"]
-            button_text = f"[{doc['file_size']}] {caption}"
-            buttons.append([Button.inline(button_text, data=f"select:{doc['_id']}")])
-        if total_pages > 1:
-            nav_buttons = []
-            if page > 0:
-                nav_buttons.append(Button.inline(BUTTON_PREV, data=f"page:{query}:{page-1}:{selected_category or 'none'}:{current_quality or 'none'}"))
-            nav_buttons.append(Button.inline(BUTTON_PAGE_INFO.format(page=page+1, total=total_pages), data="noop"))
-            if page < total_pages - 1:
-                nav_buttons.append(Button.inline(BUTTON_NEXT, data=f"page:{query}:{page+1}:{selected_category or 'none'}:{current_quality or 'none'}"))
-            buttons.append(nav_buttons)
-        quality_counts = {
-            "2160p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "2160p", "category": selected_category} if selected_category else {"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "2160p"}),
-            "1080p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "1080p", "category": selected_category} if selected_category else {"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "1080p"}),
-            "720p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "720p", "category": selected_category} if selected_category else {"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "720p"}),
-            "480p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "480p", "category": selected_category} if selected_category else {"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "480p"})
-        }
-        quality_buttons = []
-        for q, count in quality_counts.items():
-            if count > 0:
-                quality_buttons.append(Button.inline(f"{q}" + (BUTTON_TICK if current_quality == q else ""), data=f"quality:{query}:{q}:{selected_category or 'none'}:{current_quality or 'none'}"))
-        if quality_buttons:
-            buttons.append(quality_buttons)
-        movie_count = videos_collection.count_documents({
-            "caption": {"$regex": regex_pattern, "$options": "i"},
-            "category": "movie",
-            "quality": current_quality if current_quality and current_quality != "none" else {"$exists": True}
-        })
-        series_count = videos_collection.count_documents({
-            "caption": {"$regex": regex_pattern, "$options": "i"},
-            "category": "series",
-            "quality": current_quality if current_quality and current_quality != "none" else {"$exists": True}
-        })
-        filter_buttons = []
-        if movie_count > 0:
-            filter_buttons.append(Button.inline(
-                BUTTON_MOVIES + (BUTTON_TICK if selected_category == "movie" else ""),
-                data=f"filter:{query}:movie:{current_quality or 'none'}:{selected_category or 'none'}"
-            ))
-        if series_count > 0:
-            filter_buttons.append(Button.inline(
-                BUTTON_SERIES + (BUTTON_TICK if selected_category == "series" else ""),
-                data=f"filter:{query}:series:{current_quality or 'none'}:{selected_category or 'none'}"
-            ))
-        buttons.append(filter_buttons)
-        buttons.append([Button.inline(BUTTON_CLOSE, data="close")])
-        try:
-            if tmdb_details:
-                message_lines = [f"{EMOJI_TYPE} <b>{tmdb_details['type']}</b> :- <a href='{tmdb_details['poster_url']}'>{tmdb_details['name']}</a>"]
-                if tmdb_details.get('release_line'):
-                    message_lines.append(f"{EMOJI_RELEASE} {tmdb_details['release_line']}")
-                if tmdb_details.get('rating_line'):
-                    message_lines.append(f"{EMOJI_RATING} {tmdb_details['rating_line']}")
-                if tmdb_details.get('duration_line'):
-                    message_lines.append(f"{EMOJI_DURATION} {tmdb_details['duration_line']}")
-                if tmdb_details.get('season_line'):
-                    message_lines.append(f"{EMOJI_SEASON} {tmdb_details['season_line']}")
-                if tmdb_details.get('audio_line'):
-                    message_lines.append(f"{EMOJI_AUDIO} {tmdb_details['audio_line']}")
-                if tmdb_details.get('genre_line'):
-                    message_lines.append(f"{EMOJI_GENRE} {tmdb_details['genre_line']}")
-                if tmdb_details.get('trailer_line'):
-                    message_lines.append(f"{EMOJI_TRAILER} {tmdb_details['trailer_line']}")
-                if tmdb_details.get('platforms_line'):
-                    message_lines.append(f"{EMOJI_PLATFORMS} {tmdb_details['platforms_line']}")
-                message = "\n".join(message_lines)
-                await event.edit(
-                    message,
-                    buttons=buttons,
-                    parse_mode='html'
-                )
-            else:
-                await event.edit(
-                    FALLBACK_SEARCH_RESULT_MESSAGE.format(query=query),
-                    buttons=buttons,
-                    parse_mode='html'
-                )
-        except errors.MessageNotModifiedError:
-            pass
+        facets = await session_search(
+            videos_collection,
+            session,
+            category=selected_category,
+            quality=current_quality if has_quality_filter else None,
+            page=page,
+            per_page=per_page
+        )
+        text, buttons = render_results(
+            sid, query, tmdb_details, facets, page, per_page,
+            category=selected_category,
+            quality=current_quality if has_quality_filter else None
+        )
+        await edit_rendered(event, text, buttons)
 
     elif data.startswith("quality:"):
-        query, new_quality, current_category, current_quality = data.split(":")[1], data.split(":")[2], data.split(":")[3], data.split(":")[4] if len(data.split(":")) > 4 else None
-        tmdb_details = fetch_tmdb_details(query)
-        clean_query = normalize_query(query)
-        regex_pattern = ".*".join(re.escape(word) for word in clean_query.split())
-        filter_query = {"caption": {"$regex": regex_pattern, "$options": "i"}}
-        if current_category and current_category != "none":
-            filter_query["category"] = current_category
+        sid, new_quality, current_category, current_quality = data.split(":")[1], data.split(":")[2], data.split(":")[3], data.split(":")[4] if len(data.split(":")) > 4 else None
+        session = search_sessions.get(sid)
+        if session is None:
+            await event.answer(SEARCH_EXPIRED_MESSAGE, alert=True)
+            return
+        query, tmdb_details = session["query"], session["details"]
         if new_quality == current_quality:
             selected_quality = None
         else:
-            filter_query["quality"] = new_quality
             selected_quality = new_quality
-        results = list(videos_collection.find(filter_query))
         page = 0
         per_page = 5
-        total_pages = (len(results) + per_page - 1) // per_page
-        start = page * per_page
-        end = start + per_page
-        buttons = []
-        for doc in results[start:end]:
-            caption = doc["caption"][:50] + "..." if len(doc["caption"]) > 50 else doc["caption"]
-            button_text = f"[{doc['file_size']}] {caption}"
-            buttons.append([Button.inline(button_text, data=f"select:{doc['_id']}")])
-        if total_pages > 1:
-            nav_buttons = []
-            if page > 0:
-                nav_buttons.append(Button.inline(BUTTON_PREV, data=f"page:{query}:{page-1}:{current_category or 'none'}:{selected_quality or 'none'}"))
-            nav_buttons.append(Button.inline(BUTTON_PAGE_INFO.format(page=page+1, total=total_pages), data="noop"))
-            if page < total_pages - 1:
-                nav_buttons.append(Button.inline(BUTTON_NEXT, data=f"page:{query}:{page+1}:{current_category or 'none'}:{selected_quality or 'none'}"))
-            buttons.append(nav_buttons)
-        quality_counts = {
-            "2160p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "2160p", "category": current_category} if current_category != "none" else {"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "2160p"}),
-            "1080p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "1080p", "category": current_category} if current_category != "none" else {"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "1080p"}),
-            "720p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "720p", "category": current_category} if current_category != "none" else {"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "720p"}),
-            "480p": videos_collection.count_documents({"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "480p", "category": current_category} if current_category != "none" else {"caption": {"$regex": regex_pattern, "$options": "i"}, "quality": "480p"})
-        }
-        quality_buttons = []
-        for q, count in quality_counts.items():
-            if count > 0:
-                quality_buttons.append(Button.inline(f"{q}" + (BUTTON_TICK if selected_quality == q else ""), data=f"quality:{query}:{q}:{current_category or 'none'}:{selected_quality or 'none'}"))
-        if quality_buttons:
-            buttons.append(quality_buttons)
-        movie_count = videos_collection.count_documents({
-            "caption": {"$regex": regex_pattern, "$options": "i"},
-            "category": "movie",
-            "quality": selected_quality if selected_quality and selected_quality != "none" else {"$exists": True}
-        })
-        series_count = videos_collection.count_documents({
-            "caption": {"$regex": regex_pattern, "$options": "i"},
-            "category": "series",
-            "quality": selected_quality if selected_quality and selected_quality != "none" else {"$exists": True}
-        })
-        filter_buttons = []
-        if movie_count > 0:
-            filter_buttons.append(Button.inline(
-                BUTTON_MOVIES + (BUTTON_TICK if current_category == "movie" else ""),
-                data=f"filter:{query}:movie:{selected_quality or 'none'}:{current_category or 'none'}"
-            ))
-        if series_count > 0:
-            filter_buttons.append(Button.inline(
-                BUTTON_SERIES + (BUTTON_TICK if current_category == "series" else ""),
-                data=f"filter:{query}:series:{selected_quality or 'none'}:{current_category or 'none'}"
-            ))
-        buttons.append(filter_buttons)
-        buttons.append([Button.inline(BUTTON_CLOSE, data="close")])
-        try:
-            if tmdb_details:
-                message_lines = [f"{EMOJI_TYPE} <b>{tmdb_details['type']}</b> :- <a href='{tmdb_details['poster_url']}'>{tmdb_details['name']}</a>"]
-                if tmdb_details.get('release_line'):
-                    message_lines.append(f"{EMOJI_RELEASE} {tmdb_details['release_line']}")
-                if tmdb_details.get('rating_line'):
-                    message_lines.append(f"{EMOJI_RATING} {tmdb_details['rating_line']}")
-                if tmdb_details.get('duration_line'):
-                    message_lines.append(f"{EMOJI_DURATION} {tmdb_details['duration_line']}")
-                if tmdb_details.get('season_line'):
-                    message_lines.append(f"{EMOJI_SEASON} {tmdb_details['season_line']}")
-                if tmdb_details.get('audio_line'):
-                    message_lines.append(f"{EMOJI_AUDIO} {tmdb_details['audio_line']}")
-                if tmdb_details.get('genre_line'):
-                    message_lines.append(f"{EMOJI_GENRE} {tmdb_details['genre_line']}")
-                if tmdb_details.get('trailer_line'):
-                    message_lines.append(f"{EMOJI_TRAILER} {tmdb_details['trailer_line']}")
-                if tmdb_details.get('platforms_line'):
-                    message_lines.append(f"{EMOJI_PLATFORMS} {tmdb_details['platforms_line']}")
-                message = "\n".join(message_lines)
-                await event.edit(
-                    message,
-                    buttons=buttons,
-                    parse_mode='html'
-                )
-            else:
-                await event.edit(
-                    FALLBACK_SEARCH_RESULT_MESSAGE.format(query=query),
-                    buttons=buttons,
-                    parse_mode='html'
-                )
-        except errors.MessageNotModifiedError:
-            pass
+        facets = await session_search(
+            videos_collection,
+            session,
+            category=current_category if current_category and current_category != "none" else None,
+            quality=selected_quality,
+            page=page,
+            per_page=per_page
+        )
+        text, buttons = render_results(
+            sid, query, tmdb_details, facets, page, per_page,
+            category=current_category if current_category and current_category != "none" else None,
+            quality=selected_quality
+        )
+        await edit_rendered(event, text, buttons)
 
     elif data.startswith("post_yes:"):
         encoded_movie = data.split(":", 1)[1]
-        sender = await event.get_sender()
-        if sender.id != admin_id:
+        sender_entity = await event.get_sender()
+        if sender_entity.id != admin_id:
             return
         deep_link = f"https://t.me/{BOT_USERNAME}?start={encoded_movie}"
-        await event.edit(POST_CONTENT_PROMPT_MESSAGE, parse_mode='html')
-        
-        @client.on(events.NewMessage(from_users=admin_id))
-        async def handle_post_content(post_event):
-            if post_event.is_private:
-                buttons = [[Button.url(DEEP_LINK_BUTTON, deep_link)]]
-                await client.send_message(
-                    MAIN_CHANNEL_ID,
-                    message=post_event.message.text or "",
-                    file=post_event.message.media,
-                    buttons=buttons,
-                    parse_mode='html'
-                )
-                await post_event.reply(POST_SENT_MESSAGE, parse_mode='html')
-                client.remove_event_handler(handle_post_content)
+        await edit(event, POST_CONTENT_PROMPT_MESSAGE, parse_mode='html')
+        conversations.set(admin_id, AWAITING_POST, deep_link=deep_link)
 
     elif data == "post_no":
-        await event.edit(POST_CANCELLED_MESSAGE, parse_mode='html')
+        await edit(event, POST_CANCELLED_MESSAGE, parse_mode='html')
 
     elif data == "close":
-        await event.edit(CLOSED_MESSAGE, parse_mode='html')
+        await edit(event, CLOSED_MESSAGE, parse_mode='html')
 
     elif data == "noop":
         await event.answer()
\ No newline at end of file
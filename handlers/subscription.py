@@ -1,17 +1,24 @@
 from datetime import datetime, timedelta
 from telethon import TelegramClient, Button
-from database import get_user, update_user_subscription
+from database import load_user, update_user_subscription, expire_subscription, run_db
 from utils import get_current_datetime, logger
+from media import media_cache
+from sender import send_message, BULK
 from config import TRIAL_ACTIVATED_MESSAGE, SUBSCRIPTION_INACTIVE_MESSAGE, SUBSCRIPTION_EXPIRED_MESSAGE, BUTTON_RECHARGE, SUBSCRIPTION_EXPIRED_ADMIN_MESSAGE, ADMIN_ID
 
-async def check_and_handle_subscription(client: TelegramClient, event, user_id: int, users_collection, file_message):
-    user = get_user(users_collection, user_id)
+async def deliver_file(client: TelegramClient, user_id: int, message_id: int):
+    if await media_cache.send(user_id, message_id) is None:
+        logger.error("File message %s not found or has no media in database channel", message_id)
+
+async def check_and_handle_subscription(client: TelegramClient, event, user_id: int, users_collection, message_id):
+    user = await load_user(users_collection, user_id)
     current_datetime = get_current_datetime()
 
     if "is_paid" not in user:
-        logger.info(f"Activating 7-day free trial for user {user_id}")
+        logger.info("Activating 7-day free trial for user %s", user_id)
         expiry_date = current_datetime + timedelta(days=7)
-        update_user_subscription(
+        await run_db(
+            update_user_subscription,
             users_collection,
             user_id,
             {
@@ -21,16 +28,13 @@ async def check_and_handle_subscription(client: TelegramClient, event, user_id:
                 "expiry_date": expiry_date
             }
         )
-        await client.send_message(user_id, TRIAL_ACTIVATED_MESSAGE, parse_mode='html')
-        await client.send_message(
-            user_id,
-            message=file_message.text or "",
-            file=file_message.media
-        )
+        await send_message(client, user_id, TRIAL_ACTIVATED_MESSAGE, parse_mode='html')
+        await deliver_file(client, user_id, message_id)
     else:
         if not user["is_paid"]:
-            logger.info(f"User {user_id} has inactive subscription")
-            await client.send_message(
+            logger.info("User %s has inactive subscription", user_id)
+            await send_message(
+                client,
                 user_id,
                 SUBSCRIPTION_INACTIVE_MESSAGE,
                 buttons=[Button.inline(BUTTON_RECHARGE, data="recharge")],
@@ -39,39 +43,39 @@ async def check_and_handle_subscription(client: TelegramClient, event, user_id:
         else:
             expiry_date = user["expiry_date"]
             if current_datetime <= expiry_date:
-                logger.info(f"User {user_id} has active subscription, sending file")
-                await client.send_message(
-                    user_id,
-                    message=file_message.text or "",
-                    file=file_message.media
-                )
+                logger.info("User %s has active subscription, sending file", user_id)
+                await deliver_file(client, user_id, message_id)
             else:
-                logger.info(f"User {user_id} subscription expired on {expiry_date}")
-                # Capture the plan description before updating it
-                expired_plan = user.get("plan_description", "Unknown Plan")
-                update_user_subscription(
-                    users_collection,
-                    user_id,
-                    {
-                        "is_paid": False,
-                        "paid_duration": 0,
-                        "plan_description": "Plan Expired"
-                    }
-                )
+                logger.info("User %s subscription expired on %s", user_id, expiry_date)
+                # Same claim as the expiry sweeper, so only whichever gets there first sends the notices
+                expired = await run_db(expire_subscription, users_collection, user_id, current_datetime)
+                if expired is None:
+                    await send_message(
+                        client,
+                        user_id,
+                        SUBSCRIPTION_INACTIVE_MESSAGE,
+                        buttons=[Button.inline(BUTTON_RECHARGE, data="recharge")],
+                        parse_mode='html'
+                    )
+                    return
+                expired_plan = expired.get("plan_description", "Unknown Plan")
                 # Notify user
-                await client.send_message(
+                await send_message(
+                    client,
                     user_id,
                     SUBSCRIPTION_EXPIRED_MESSAGE.format(expiry_date=expiry_date.strftime("%Y-%m-%d %H:%M:%S")),
                     buttons=[Button.inline(BUTTON_RECHARGE, data="recharge")],
                     parse_mode='html'
                 )
                 # Notify admin instantly with plan details
-                await client.send_message(
+                await send_message(
+                    client,
                     ADMIN_ID,
                     SUBSCRIPTION_EXPIRED_ADMIN_MESSAGE.format(
                         user_id=user_id,
                         expiry_date=expiry_date.strftime("%Y-%m-%d %H:%M:%S"),
                         plan_description=expired_plan
                     ),
-                    parse_mode='html'
+                    parse_mode='html',
+                    priority=BULK
                 )
\ No newline at end of file
@@ -0,0 +1,124 @@
+# ingestion.py
+import asyncio
+import re
+import time
+from database import run_db, save_videos
+from utils import convert_file_size, logger
+from search_index import caption_tokens, rank_features
+from catalog import apply_catalog_change
+from media import media_reference
+from config import INGEST_BATCH_SIZE, INGEST_FLUSH_INTERVAL, INGEST_QUEUE_SIZE
+
+# Compiled once; S\d+E\d+ is already covered by S\d+
+SERIES_PATTERN = re.compile(r'S\d+|E\d+', re.IGNORECASE)
+QUALITY_PATTERN = re.compile(r'(2160|1080|720|480)p', re.IGNORECASE)
+# When a caption names several qualities the highest one wins, as before
+QUALITY_ORDER = ("2160", "1080", "720", "480")
+
+
+def classify_caption(caption):
+    category = "series" if SERIES_PATTERN.search(caption) else "movie"
+    found = set(QUALITY_PATTERN.findall(caption))
+    quality = next((f"{q}p" for q in QUALITY_ORDER if q in found), "unknown")
+    return category, quality
+
+def build_video_doc(message):
+    # Shared by live ingestion and the backfill so both classify a caption the same way
+    if not message.video:
+        return None
+    caption = message.message or ""
+    category, quality = classify_caption(caption)
+    return {
+        "_id": message.id,
+        "caption": caption,
+        "file_size": convert_file_size(message.file.size),
+        "category": category,
+        "quality": quality,
+        "tokens": caption_tokens(caption),
+        "rank": rank_features(caption),
+        "media": media_reference(message)
+    }
+
+
+class IngestionPipeline:
+    def __init__(self, batch_size=INGEST_BATCH_SIZE, flush_interval=INGEST_FLUSH_INTERVAL, maxsize=INGEST_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.maxsize = maxsize
+        self.collection = None
+        self._queue = None
+        self._task = None
+        self.batches = 0
+        self.videos = 0
+        self.failed = 0
+
+    def use(self, collection):
+        self.collection = collection
+
+    def _ensure_started(self):
+        if self._task is None:
+            # Bounded: during a huge upload the channel handler waits here instead of buffering without limit
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, doc):
+        self._ensure_started()
+        await self._queue.put(doc)
+
+    async def _run(self):
+        # Flushes when a batch fills up or flush_interval after its first video, whichever comes first
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            doc = await self._queue.get()
+            if doc is None:
+                return
+            batch = [doc]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    doc = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if doc is None:
+                    closing = True
+                    break
+                batch.append(doc)
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        # A re-posted id within one window keeps only its latest version
+        docs = list({doc["_id"]: doc for doc in batch}.values())
+        started = time.perf_counter()
+        try:
+            await run_db(save_videos, self.collection, docs)
+        except Exception:
+            self.failed += len(docs)
+            logger.exception("Failed to ingest batch of %s videos", len(docs))
+            return
+        apply_catalog_change(added=docs)
+        self.batches += 1
+        self.videos += len(docs)
+        logger.info("Ingested %s videos in %.0fms", len(docs), (time.perf_counter() - started) * 1000)
+
+    async def close(self):
+        # The sentinel queues behind everything already buffered, so all of it is flushed first
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "videos": self.videos,
+            "failed": self.failed
+        }
+
+
+ingest_pipeline = IngestionPipeline()
@@ -0,0 +1,81 @@
+# logs.py
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE
+
+# (handler name, user id) of the update being handled, stamped onto every record logged while handling it
+log_context = contextvars.ContextVar("log_context", default=None)
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener = None
+
+
+class ContextFilter(logging.Filter):
+    # Runs inside the logging call, where log_context still belongs to the handler that logged
+    def filter(self, record):
+        context = log_context.get()
+        if context is not None:
+            record.handler, record.user_id = context
+        return True
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() formats the message here; the listener thread formats it instead
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    FIELDS = ("handler", "user_id", "latency_ms", "sample_rate")
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def log_sampled(logger, msg, *args, **fields):
+    # For chatty per-update records: the sampling decision comes before the record is even built
+    if LOG_SAMPLE_RATE < 1 and random.random() >= LOG_SAMPLE_RATE:
+        return
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(msg, *args, extra={"sample_rate": LOG_SAMPLE_RATE, **fields}, stacklevel=2)
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    # Once per process; forked workers call it again, since the listener thread does not survive a fork
+    global _listener
+    records = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(records)
+    queue_handler.addFilter(ContextFilter())
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    # Flushes whatever is still queued
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
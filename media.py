@@ -0,0 +1,87 @@
+# media.py
+from telethon import types
+from telethon.errors import FileReferenceExpiredError
+from cache import TTLCache
+from sender import sender
+from database import run_db, get_video_media, save_video_media
+from config import MEDIA_CACHE_SIZE, MEDIA_CACHE_TTL
+
+
+def media_reference(message):
+    # Just enough to rebuild an InputMedia without asking Telegram for the message again
+    if message.document is not None:
+        media, kind = message.document, "document"
+    elif message.photo is not None:
+        media, kind = message.photo, "photo"
+    else:
+        return None
+    return {
+        "kind": kind,
+        "id": media.id,
+        "access_hash": media.access_hash,
+        "file_reference": bytes(media.file_reference),
+        "text": message.text or ""
+    }
+
+def input_media(ref):
+    if ref["kind"] == "photo":
+        return types.InputMediaPhoto(types.InputPhoto(ref["id"], ref["access_hash"], ref["file_reference"]))
+    return types.InputMediaDocument(types.InputDocument(ref["id"], ref["access_hash"], ref["file_reference"]))
+
+
+class MediaCache:
+    def __init__(self, maxsize=MEDIA_CACHE_SIZE, ttl=MEDIA_CACHE_TTL):
+        self.cache = TTLCache("media", maxsize, ttl)
+        self.client = None
+        self.channel = None
+        self.collection = None
+        self.refreshes = 0
+
+    def use(self, client, channel, collection):
+        self.client = client
+        self.channel = channel
+        self.collection = collection
+
+    def forget(self, message_id):
+        # A deleted video must not keep sending from its cached reference
+        self.cache.pop(message_id)
+
+    async def refresh(self, message_id, persist=True):
+        # The only path that still calls get_messages: expired references and videos ingested before refs were stored
+        self.refreshes += 1
+        message = await self.client.get_messages(self.channel, ids=message_id)
+        ref = media_reference(message) if message else None
+        if ref is None:
+            self.cache.pop(message_id)
+            return None
+        self.cache.set(message_id, ref)
+        if persist:
+            await run_db(save_video_media, self.collection, message_id, ref)
+        return ref
+
+    async def get(self, message_id, persist=True):
+        ref = self.cache.get(message_id)
+        if ref is None and persist:
+            ref = await run_db(get_video_media, self.collection, message_id)
+            if ref is not None:
+                self.cache.set(message_id, ref)
+        if ref is None:
+            ref = await self.refresh(message_id, persist)
+        return ref
+
+    async def send(self, chat_id, message_id, persist=True, **kwargs):
+        # Returns None when the channel message is gone or has no media
+        ref = await self.get(message_id, persist)
+        if ref is None:
+            return None
+        text = kwargs.pop("message", ref["text"])
+        try:
+            return await sender.call(chat_id, self.client.send_message, chat_id, message=text, file=input_media(ref), **kwargs)
+        except FileReferenceExpiredError:
+            ref = await self.refresh(message_id, persist)
+            if ref is None:
+                return None
+            return await sender.call(chat_id, self.client.send_message, chat_id, message=text, file=input_media(ref), **kwargs)
+
+
+media_cache = MediaCache()
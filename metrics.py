@@ -0,0 +1,256 @@
+# metrics.py
+import asyncio
+import functools
+import logging
+import time
+from bisect import bisect_left
+from aiohttp import web
+from cache import CACHE_REGISTRY
+from logs import log_context, log_sampled
+from config import LOOP_LAG_INTERVAL, METRICS_PUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans a cached reply (sub-millisecond) up to a slow TMDB lookup
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICS = []
+GAUGES = []
+# Worker index -> the latest snapshot() that worker sent; merged into everything this process reports
+_remote = {}
+CACHE_FIELDS = (
+    ("size", "bot_cache_size", "gauge"),
+    ("hits", "bot_cache_hits_total", "counter"),
+    ("misses", "bot_cache_misses_total", "counter"),
+    ("evictions", "bot_cache_evictions_total", "counter"),
+    ("expirations", "bot_cache_expirations_total", "counter")
+)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "key", "started")
+
+    def __init__(self, histogram, key):
+        self.histogram = histogram
+        self.key = key
+
+    def __enter__(self):
+        self.histogram.inflight[self.key] = self.histogram.inflight.get(self.key, 0) + 1
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.inflight[self.key] -= 1
+        self.histogram.observe_key(self.key, time.perf_counter() - self.started)
+        return False
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self.series = {}
+        self.inflight = {}
+        METRICS.append(self)
+
+    def observe_key(self, key, value):
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def observe(self, value, *label_values):
+        self.observe_key(label_values, value)
+
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+    def merged(self):
+        # This process's series plus every worker's, bucket by bucket
+        series = {key: list(values) for key, values in self.series.items()}
+        inflight = dict(self.inflight)
+        for snapshot in _remote.values():
+            remote_series, remote_inflight = snapshot["histograms"].get(self.name, ({}, {}))
+            for key, values in remote_series.items():
+                mine = series.get(key)
+                series[key] = list(values) if mine is None else [a + b for a, b in zip(mine, values)]
+            for key, count in remote_inflight.items():
+                inflight[key] = inflight.get(key, 0) + count
+        return series, inflight
+
+    def render(self):
+        lines = [f"# HELP {self.name}_seconds {self.help_text}", f"# TYPE {self.name}_seconds histogram"]
+        all_series, all_inflight = self.merged()
+        for key, series in all_series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f"{self.name}_seconds_bucket{_labels(self.label_names + ('le',), key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_seconds_sum{_labels(self.label_names, key)} {series[-1]}")
+            lines.append(f"{self.name}_seconds_count{_labels(self.label_names, key)} {cumulative}")
+        if all_inflight:
+            lines.append(f"# TYPE {self.name}_in_flight gauge")
+            lines.extend(f"{self.name}_in_flight{_labels(self.label_names, key)} {count}" for key, count in all_inflight.items())
+        return lines
+
+
+def register_gauge(name, help_text, func, label_name=None):
+    # func returns a number, or a {label value: number} dict when label_name is given
+    GAUGES.append((name, help_text, func, label_name))
+
+
+HANDLER_LATENCY = Histogram("bot_handler", "Telegram event handler latency", ("handler",))
+CALLBACK_LATENCY = Histogram("bot_callback", "Callback query latency by callback type", ("type",))
+MONGO_LATENCY = Histogram("bot_mongo", "Mongo call latency including executor queueing", ("op",))
+TMDB_LATENCY = Histogram("bot_tmdb", "TMDB HTTP request latency", ("endpoint",))
+LOOP_LAG = Histogram("bot_event_loop_lag", "How late the event loop woke a periodic timer", buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+
+
+def track_handler(name):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(event):
+            # StopPropagation still propagates; the handler is timed either way
+            token = log_context.set((name, event.sender_id))
+            timer = HANDLER_LATENCY.time(name)
+            try:
+                with timer:
+                    return await func(event)
+            finally:
+                _log_handled(timer)
+                log_context.reset(token)
+        return wrapper
+    return decorator
+
+
+# Callback data is client-supplied: anything not on this list is counted as "other", so a crafted
+# payload can't add label values
+CALLBACK_TYPES = frozenset({
+    "accept_privacy", "select", "recharge", "plan", "cancel_payment", "confirm_payment", "reject_payment",
+    "suggest", "page", "filter", "quality", "post_yes", "post_no", "close", "noop"
+})
+
+
+def callback_type(data):
+    kind = data.split(b":", 1)[0].decode(errors="replace")
+    return kind if kind in CALLBACK_TYPES else "other"
+
+
+def track_callback(func):
+    @functools.wraps(func)
+    async def wrapper(event):
+        # Labelled by the callback type (select, page, plan, ...), never the per-user payload after it
+        kind = callback_type(event.data)
+        token = log_context.set((f"callback:{kind}", event.sender_id))
+        timer = CALLBACK_LATENCY.time(kind)
+        try:
+            with timer:
+                return await func(event)
+        finally:
+            _log_handled(timer)
+            log_context.reset(token)
+    return wrapper
+
+
+def _log_handled(timer):
+    latency_ms = round((time.perf_counter() - timer.started) * 1000, 2)
+    log_sampled(logger, "handled in %sms", latency_ms, latency_ms=latency_ms)
+
+
+async def monitor_loop_lag(interval=LOOP_LAG_INTERVAL):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+
+def snapshot(**stats):
+    # What a worker process reports to the bot process: its histograms, caches and any stats() dicts passed in.
+    # Copied, since the queue pickles it on another thread while the event loop keeps updating the originals
+    return {
+        "histograms": {
+            metric.name: ({key: list(values) for key, values in metric.series.items()}, dict(metric.inflight))
+            for metric in METRICS
+        },
+        "caches": {name: cache.stats() for name, cache in CACHE_REGISTRY.items()},
+        "stats": stats
+    }
+
+
+def record_snapshot(index, snapshot):
+    _remote[index] = snapshot
+
+
+def _add_stats(total, stats):
+    for field, value in stats.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[field] = total.get(field, 0) + value
+    return total
+
+
+def combined_stats(name, local):
+    # A stats() dict summed over this process and the workers that reported one under name
+    total = dict(local)
+    for snapshot in _remote.values():
+        if name in snapshot["stats"]:
+            _add_stats(total, snapshot["stats"][name])
+    return total
+
+
+def cache_stats():
+    # Every named cache summed over this process and the workers
+    totals = {name: cache.stats() for name, cache in CACHE_REGISTRY.items()}
+    for snapshot in _remote.values():
+        for name, stats in snapshot["caches"].items():
+            if name in totals:
+                _add_stats(totals[name], stats)
+            else:
+                totals[name] = dict(stats)
+    for stats in totals.values():
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return totals
+
+
+async def push_snapshots(send, interval=METRICS_PUSH_INTERVAL, **sources):
+    # In a worker: send(snapshot) every interval seconds; sources are objects with a stats() method
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            send(snapshot(**{name: source.stats() for name, source in sources.items()}))
+        except Exception:
+            logger.exception("Metrics snapshot failed")
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    all_cache_stats = cache_stats()
+    for field, metric, kind in CACHE_FIELDS:
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(f'{metric}{{cache="{name}"}} {stats[field]}' for name, stats in all_cache_stats.items())
+    for name, help_text, func, label_name in GAUGES:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        value = func()
+        if label_name is None:
+            lines.append(f"{name} {value}")
+        else:
+            lines.extend(f'{name}{{{label_name}="{label}"}} {number}' for label, number in value.items())
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_handler(request):
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
@@ -0,0 +1,86 @@
+# render.py
+from telethon import Button, errors
+from cache import TTLCache
+from sender import reply, edit
+from utils import format_tmdb_message
+from config import (
+    BUTTON_PREV, BUTTON_NEXT, BUTTON_PAGE_INFO, BUTTON_TICK, BUTTON_MOVIES, BUTTON_SERIES, BUTTON_CLOSE,
+    FALLBACK_SEARCH_RESULT_MESSAGE, RENDER_HEADER_CACHE_SIZE, TMDB_CACHE_TTL, RENDERED_MESSAGE_CACHE_SIZE,
+    SEARCH_SESSION_TTL
+)
+
+# Keyed on the TMDB entry, so every result page and facet of one title shares its header text
+_headers = TTLCache("render_headers", RENDER_HEADER_CACHE_SIZE, TMDB_CACHE_TTL)
+# (chat id, message id) -> hash of the text and buttons last sent there
+_last_rendered = TTLCache("rendered_messages", RENDERED_MESSAGE_CACHE_SIZE, SEARCH_SESSION_TTL)
+
+
+def render_header(details, query):
+    if not details:
+        return FALLBACK_SEARCH_RESULT_MESSAGE.format(query=query)
+    key = (details["type"], details["name"], details["poster_url"])
+    header = _headers.get(key)
+    if header is None:
+        header = format_tmdb_message(details)
+        _headers.set(key, header)
+    return header
+
+def render_results(sid, query, details, facets, page=0, per_page=5, category=None, quality=None):
+    # Text and buttons for one page of a search; category and quality are the active facets (or None)
+    category_data = category or "none"
+    quality_data = quality or "none"
+    total_pages = (facets["total"] + per_page - 1) // per_page
+    buttons = []
+    for doc in facets["results"]:
+        caption = doc["caption"][:50] + "..." if len(doc["caption"]) > 50 else doc["caption"]
+        buttons.append([Button.inline(f"[{doc['file_size']}] {caption}", data=f"select:{doc['_id']}")])
+    if total_pages > 1:
+        nav_buttons = []
+        # Pages past the ranked results carry an _id cursor (see fetch_page)
+        if page > 0:
+            cursor = f":{facets['prev_cursor']}" if facets.get("prev_cursor") else ""
+            nav_buttons.append(Button.inline(BUTTON_PREV, data=f"page:{sid}:{page-1}:{category_data}:{quality_data}{cursor}"))
+        nav_buttons.append(Button.inline(BUTTON_PAGE_INFO.format(page=page+1, total=total_pages), data="noop"))
+        if page < total_pages - 1:
+            cursor = f":{facets['next_cursor']}" if facets.get("next_cursor") else ""
+            nav_buttons.append(Button.inline(BUTTON_NEXT, data=f"page:{sid}:{page+1}:{category_data}:{quality_data}{cursor}"))
+        buttons.append(nav_buttons)
+    quality_buttons = [
+        Button.inline(q + (BUTTON_TICK if quality == q else ""), data=f"quality:{sid}:{q}:{category_data}:{quality_data}")
+        for q, count in facets["quality_counts"].items() if count > 0
+    ]
+    if quality_buttons:
+        buttons.append(quality_buttons)
+    filter_buttons = []
+    for name, label in (("movie", BUTTON_MOVIES), ("series", BUTTON_SERIES)):
+        if facets["category_counts"][name] > 0:
+            filter_buttons.append(Button.inline(
+                label + (BUTTON_TICK if category == name else ""),
+                data=f"filter:{sid}:{name}:{quality_data}:{category_data}"
+            ))
+    buttons.append(filter_buttons)
+    buttons.append([Button.inline(BUTTON_CLOSE, data="close")])
+    return render_header(details, query), buttons
+
+def _digest(text, buttons):
+    # The serialized TL bytes cover label, callback data and anything else Telegram would show
+    return hash((text, tuple(tuple(bytes(button) for button in row) for row in buttons)))
+
+async def send_rendered(event, text, buttons):
+    message = await reply(event, text, buttons=buttons, parse_mode='html')
+    if message is not None:
+        _last_rendered.set((message.chat_id, message.id), _digest(text, buttons))
+    return message
+
+async def edit_rendered(event, text, buttons):
+    # Returns False when the message already shows exactly this, without a round trip to Telegram
+    key = (event.chat_id, event.message_id)
+    digest = _digest(text, buttons)
+    if _last_rendered.get(key) == digest:
+        return False
+    try:
+        await edit(event, text, buttons=buttons, parse_mode='html')
+    except errors.MessageNotModifiedError:
+        pass
+    _last_rendered.set(key, digest)
+    return True
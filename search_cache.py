@@ -0,0 +1,97 @@
+# search_cache.py
+import bisect
+import re
+from functools import lru_cache
+from cache import TTLCache
+from search_index import build_regex_pattern, tokenize
+from config import SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL
+
+
+@lru_cache(maxsize=4096)
+def _compiled_query(clean_query):
+    return re.compile(build_regex_pattern(clean_query), re.IGNORECASE)
+
+def _docs_containing(term, tokens, starts):
+    # Indexes of the docs with a token containing term; tokens holds every doc's tokens in one string,
+    # doc i starting at starts[i], so each lookup is a C-level find rather than a loop over tokens
+    found = set()
+    position = tokens.find(term)
+    while position != -1:
+        index = bisect.bisect_right(starts, position) - 1
+        found.add(index)
+        if index + 1 == len(starts):
+            break
+        position = tokens.find(term, starts[index + 1])
+    return found
+
+
+class SearchResultCache:
+    def __init__(self, maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL):
+        # Keyed on (normalized query, category, quality); values hold the matched ids and facet counts
+        self.cache = TTLCache("search_results", maxsize, ttl)
+        # Bumped on every catalog change so a search that raced with one is not cached
+        self.version = 0
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, result, version):
+        if version == self.version:
+            self.cache.set(key, result)
+
+    def invalidate_docs(self, docs):
+        # A new or changed video only affects queries whose ordered regex matches its caption;
+        # every category/quality variant of such a query is dropped since its facet counts change too.
+        # Query terms are looked up in the docs' tokens first, so the regex only runs on captions holding all of them
+        self.version += 1
+        starts = []
+        parts = []
+        length = 0
+        for doc in docs:
+            starts.append(length)
+            part = " ".join(doc["tokens"]) + "\n"
+            parts.append(part)
+            length += len(part)
+        tokens = "".join(parts)
+        containing = {}
+        affected = {}
+        for key in self.cache.keys():
+            clean_query = key[0]
+            if clean_query not in affected:
+                possible = None
+                for term in set(tokenize(clean_query)):
+                    if term not in containing:
+                        containing[term] = _docs_containing(term, tokens, starts)
+                    possible = containing[term] if possible is None else possible & containing[term]
+                    if not possible:
+                        break
+                if possible is None:
+                    possible = range(len(docs))
+                if possible:
+                    regex = _compiled_query(clean_query)
+                    affected[clean_query] = any(regex.search(docs[index]["caption"]) for index in possible)
+                else:
+                    affected[clean_query] = False
+            if affected[clean_query]:
+                self.cache.pop(key)
+
+    def invalidate_all(self):
+        # Bulk catalog rewrites (backfill) touch too many captions to invalidate one by one
+        self.version += 1
+        self.cache.clear()
+
+    def invalidate_ids(self, ids):
+        # The unranked tail is read from Mongo page by page, but its total would still count the id
+        self.version += 1
+        ids = set(ids)
+        lowest = min(ids)
+        for key in self.cache.keys():
+            result = self.cache.peek(key)
+            if result is None:
+                continue
+            in_tail = result.get("tail_before") is not None and lowest < result["tail_before"]
+            if in_tail or not ids.isdisjoint(result["ids"]):
+                self.cache.pop(key)
+
+
+search_cache = SearchResultCache()
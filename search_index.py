@@ -0,0 +1,279 @@
+# search_index.py
+import heapq
+import itertools
+import math
+import re
+import time
+from array import array
+from collections import Counter
+from pymongo import UpdateOne
+from utils import normalize_query, logger
+from config import FUZZY_SUGGESTIONS, FUZZY_MIN_SIMILARITY, FUZZY_SEARCH_BUDGET, SEARCH_INDEX_MAX_CANDIDATES
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+# Caption words that end a title: episode markers, qualities and years
+MARKER_PATTERN = re.compile(r's\d+(?:e\d+)?|e\d+|\d{3,4}p|(?:19|20)\d\d')
+EPISODE_PATTERN = re.compile(r's(\d+)(?:e(\d+))?|e(\d+)')
+QUALITY_RANKS = {"2160p": 4, "1080p": 3, "720p": 2, "480p": 1}
+RANK_WORDS = 32
+EXPANSION_CACHE_SIZE = 10000
+LOAD_BATCH_SIZE = 1000
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+def caption_tokens(caption):
+    # Index both the raw and the normalized spelling so "Season 1" is found by "season" and "s01"
+    return sorted(set(tokenize(caption)) | set(tokenize(normalize_query(caption))))
+
+def rank_features(caption):
+    # Static ranking features, computed once at ingestion; quality and recency (_id) are already on the doc
+    words = tokenize(normalize_query(caption))[:RANK_WORDS]
+    title = []
+    for word in words:
+        if MARKER_PATTERN.fullmatch(word):
+            break
+        title.append(word)
+    season = episode = 0
+    for word in words:
+        match = EPISODE_PATTERN.fullmatch(word)
+        if match:
+            season = season or int(match.group(1) or 0)
+            episode = episode or int(match.group(2) or match.group(3) or 0)
+    return {"title": " ".join(title), "season": season, "episode": episode, "words": words}
+
+def _proximity(terms, words):
+    # 2 when the query terms sit next to each other in the caption, 1 when close, 0 otherwise;
+    # terms match inside words, like the caption regex
+    best = None
+    for start, word in enumerate(words):
+        if terms[0] not in word:
+            continue
+        position = start
+        for term in terms[1:]:
+            position = next((i for i in range(position + 1, len(words)) if term in words[i]), None)
+            if position is None:
+                break
+        if position is None:
+            break
+        span = position - start + 1
+        best = span if best is None else min(best, span)
+    if best is None:
+        return 0
+    return 2 if best <= len(terms) else 1 if best <= len(terms) + 2 else 0
+
+def rank_ids(clean_query, docs):
+    # Text relevance first (exact title, then term proximity); within it episodes in order,
+    # the best quality, and the newest upload of a file that was posted more than once
+    terms = tokenize(clean_query)
+    title = " ".join(term for term in terms if not MARKER_PATTERN.fullmatch(term))
+
+    def key(doc):
+        features = doc.get("rank") or {}
+        relevance = (4 if title and features.get("title") == title else 0) + (_proximity(terms, features.get("words", ())) if terms else 0)
+        return (-relevance, features.get("season", 0), features.get("episode", 0), -QUALITY_RANKS.get(doc.get("quality"), 0), -doc["_id"])
+
+    return [doc["_id"] for doc in sorted(docs, key=key)]
+
+def _narrows(term):
+    # Shorter or all-digit terms are inside too many tokens to be worth looking up; the caption regex checks them
+    return len(term) >= 3 and not term.isdigit()
+
+def trigrams(token):
+    # Padded like pg_trgm, so word starts weigh more and short words still get trigrams
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def build_regex_pattern(clean_query):
+    return ".*".join(re.escape(word) for word in clean_query.split())
+
+
+class SearchIndex:
+    def __init__(self):
+        self.postings = {}
+        self.doc_tokens = {}
+        self._expansions = {}
+        # Fuzzy fallback over the vocabulary rather than the videos: token number -> token (None once no video
+        # uses it), and trigram -> array of token numbers at 4 bytes each
+        self.vocabulary = []
+        self.token_numbers = {}
+        self.trigrams = {}
+        self.trigram_counts = array("H")
+
+    def __len__(self):
+        return len(self.doc_tokens)
+
+    def add(self, video_id, tokens):
+        self.remove(video_id)
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = set()
+                self._forget_expansions(token)
+                self._add_vocabulary(token)
+            posting.add(video_id)
+        self.doc_tokens[video_id] = tuple(tokens)
+
+    def remove(self, video_id):
+        for token in self.doc_tokens.pop(video_id, ()):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            posting.discard(video_id)
+            if not posting:
+                del self.postings[token]
+                self._forget_expansions(token)
+                number = self.token_numbers.get(token)
+                if number is not None:
+                    self.vocabulary[number] = None
+
+    def _add_vocabulary(self, token):
+        # Numbers (years, episode ids, upload counters) are left out: they are most of a large
+        # catalog's vocabulary and never worth a spelling suggestion
+        if token.isdigit():
+            return
+        number = self.token_numbers.get(token)
+        if number is not None:
+            self.vocabulary[number] = token
+            return
+        number = self.token_numbers[token] = len(self.vocabulary)
+        self.vocabulary.append(token)
+        grams = trigrams(token)
+        self.trigram_counts.append(min(len(grams), 0xFFFF))
+        for gram in grams:
+            posting = self.trigrams.get(gram)
+            if posting is None:
+                posting = self.trigrams[gram] = array("I")
+            posting.append(number)
+
+    def _forget_expansions(self, token):
+        # Only the cached terms found inside this token gain or lose it; upload counters and other
+        # all-digit tokens contain no term that is ever expanded
+        if token.isdigit():
+            return
+        for start in range(len(token) - 2):
+            for end in range(start + 3, len(token) + 1):
+                self._expansions.pop(token[start:end], None)
+
+    def expand(self, term):
+        # Query words match anywhere inside a caption word, so a term maps to every token containing it
+        tokens = self._expansions.get(term)
+        if tokens is None:
+            if len(self._expansions) >= EXPANSION_CACHE_SIZE:
+                self._expansions.clear()
+            tokens = self._expansions[term] = self._containing(term)
+        return tokens
+
+    def _containing(self, term):
+        # Only called for terms that _narrows: a token containing a term that isn't all digits isn't all digits
+        # either, so it is in the fuzzy vocabulary, and the rarest of the term's trigrams narrows the check
+        # to a handful of tokens
+        posting = min((self.trigrams.get(term[i:i + 3], ()) for i in range(len(term) - 2)), key=len)
+        return [token for token in map(self.vocabulary.__getitem__, posting) if token is not None and term in token]
+
+    def candidates(self, clean_query):
+        # Returns a superset of the ids matching the ordered regex, or None if no query term narrows it
+        terms = {term for term in tokenize(clean_query) if _narrows(term)}
+        if not terms:
+            return None
+        result = None
+        for term in sorted(terms, key=len, reverse=True):
+            ids = set()
+            for token in self.expand(term):
+                ids |= self.postings[token]
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        return result
+
+    def suggest(self, term, limit=FUZZY_SUGGESTIONS, min_similarity=FUZZY_MIN_SIMILARITY, deadline=None):
+        # Vocabulary tokens by trigram similarity (shared / union) to the term, best first
+        grams = trigrams(term)
+        shared = Counter()
+        # Rarest trigrams first, so running out of time still leaves the most telling overlaps counted
+        for gram in sorted(grams, key=lambda gram: len(self.trigrams.get(gram, ()))):
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            shared.update(self.trigrams.get(gram, ()))
+        scored = []
+        for number, count in shared.items():
+            token = self.vocabulary[number]
+            if token is None:
+                continue
+            similarity = count / (len(grams) + self.trigram_counts[number] - count)
+            if similarity >= min_similarity:
+                scored.append((similarity, len(self.postings[token]), token))
+        return [(token, similarity) for similarity, _, token in heapq.nlargest(limit, scored)]
+
+    def did_you_mean(self, clean_query, limit=FUZZY_SUGGESTIONS, budget=FUZZY_SEARCH_BUDGET):
+        # Rewrites of a query without hits: every word no caption token contains is swapped for close tokens.
+        # Only rewrites that still have candidate videos are returned, best first, within budget seconds
+        deadline = time.perf_counter() + budget
+        options = []
+        corrected = False
+        for word in clean_query.split():
+            choices = [(word, 1.0)]
+            for token in tokenize(word):
+                if not _narrows(token) or self.expand(token):
+                    continue
+                suggestions = self.suggest(token, limit, deadline=deadline)
+                if not suggestions:
+                    return []
+                corrected = True
+                choices = heapq.nlargest(limit, (
+                    (choice.replace(token, suggestion, 1), score * similarity)
+                    for choice, score in choices for suggestion, similarity in suggestions
+                ), key=lambda choice: choice[1])
+            options.append(choices)
+        if not corrected:
+            return []
+        combinations = sorted(itertools.product(*options), key=lambda words: -math.prod(score for _, score in words))
+        results = []
+        for words in combinations:
+            if len(results) >= limit or time.perf_counter() > deadline:
+                break
+            query = " ".join(word for word, _ in words)
+            if self.candidates(query):
+                results.append(query)
+        return results
+
+    def load(self, collection):
+        self.postings.clear()
+        self.doc_tokens.clear()
+        self._expansions.clear()
+        self.vocabulary.clear()
+        self.token_numbers.clear()
+        self.trigrams.clear()
+        self.trigram_counts = array("H")
+        missing = []
+        for doc in collection.find({}, {"caption": 1, "tokens": 1, "rank.title": 1}):
+            fields = {}
+            tokens = doc.get("tokens")
+            if tokens is None:
+                tokens = fields["tokens"] = caption_tokens(doc.get("caption") or "")
+            if "rank" not in doc:
+                fields["rank"] = rank_features(doc.get("caption") or "")
+            if fields:
+                missing.append((doc["_id"], fields))
+            self.add(doc["_id"], tokens)
+        # Backfill postings and ranking features for videos ingested before they existed
+        for i in range(0, len(missing), LOAD_BATCH_SIZE):
+            collection.bulk_write(
+                [UpdateOne({"_id": video_id}, {"$set": fields}) for video_id, fields in missing[i:i + LOAD_BATCH_SIZE]],
+                ordered=False
+            )
+        logger.info("Search index loaded %s videos, %s tokens, %s trigrams (%s backfilled)",
+                    len(self), len(self.postings), len(self.trigrams), len(missing))
+
+
+search_index = SearchIndex()
+
+def build_search_filter(clean_query, max_candidates=SEARCH_INDEX_MAX_CANDIDATES):
+    # The caption regex still decides the match; the postings only narrow which documents it runs on.
+    # Broad queries fall back to the plain regex, so the event loop never sorts and encodes a huge $in list
+    search_filter = {"caption": {"$regex": build_regex_pattern(clean_query), "$options": "i"}}
+    ids = search_index.candidates(clean_query)
+    if ids is not None and len(ids) <= max_candidates:
+        search_filter["_id"] = {"$in": sorted(ids)}
+    return search_filter
@@ -0,0 +1,24 @@
+# search_session.py
+import secrets
+from cache import TTLCache
+from config import SEARCH_SESSION_SIZE, SEARCH_SESSION_TTL
+
+
+class SearchSessionStore:
+    def __init__(self, maxsize=SEARCH_SESSION_SIZE, ttl=SEARCH_SESSION_TTL):
+        self.sessions = TTLCache("search_sessions", maxsize, ttl)
+
+    def create(self, query, clean_query):
+        # 8 url-safe characters: callback data stays far below Telegram's 64-byte limit and never contains ':'
+        sid = secrets.token_urlsafe(6)
+        self.sessions.set(sid, {"query": query, "clean_query": clean_query, "details": None, "results": {}})
+        return sid
+
+    def get(self, sid):
+        return self.sessions.get(sid)
+
+    def discard(self, sid):
+        self.sessions.pop(sid)
+
+
+search_sessions = SearchSessionStore()
@@ -0,0 +1,187 @@
+# sender.py
+import asyncio
+import contextvars
+import itertools
+import logging
+import time
+from telethon.errors import FloodWaitError
+from config import SEND_GLOBAL_RATE, SEND_PER_CHAT_INTERVAL, SEND_WORKERS, SEND_MAX_RETRIES, SEND_MAX_FLOOD_WAIT, SEND_BULK_PENDING
+
+# Lower runs first: a user waiting on a button beats an admin notice or a reminder
+INTERACTIVE = 0
+BULK = 1
+
+# Set while a worker process forwards a scheduled call, so the bot process can queue it at the same priority
+SEND_PRIORITY = contextvars.ContextVar("send_priority", default=None)
+
+logger = logging.getLogger(__name__)
+
+
+class SendScheduler:
+    def __init__(self, rate=SEND_GLOBAL_RATE, per_chat_interval=SEND_PER_CHAT_INTERVAL, workers=SEND_WORKERS,
+                 max_retries=SEND_MAX_RETRIES, max_flood_wait=SEND_MAX_FLOOD_WAIT, bulk_pending=SEND_BULK_PENDING,
+                 clock=time.monotonic):
+        self.rate = rate
+        self.per_chat_interval = per_chat_interval
+        self.workers = workers
+        self.max_retries = max_retries
+        self.max_flood_wait = max_flood_wait
+        self.bulk_pending = bulk_pending
+        self.clock = clock
+        self.remote = False
+        self._queue = None
+        self._bulk_slots = None
+        self._tasks = []
+        self._seq = itertools.count()
+        # Earliest time each chat may be sent to again (per-chat budget and FloodWait penalties)
+        self._chat_ready = {}
+        self._tokens = float(rate)
+        self._refilled_at = clock()
+        self._delayed = 0
+        self.sent = 0
+        self.failed = 0
+        self.flood_waits = 0
+        self.retries = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _ensure_started(self):
+        # Workers are created lazily inside the running loop, like the TMDB session
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._bulk_slots = asyncio.Semaphore(self.bulk_pending)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def use_remote(self):
+        # Worker processes: pacing and retries happen once, in the bot process that owns the client
+        self.remote = True
+
+    async def submit(self, chat_id, func, *args, priority=INTERACTIVE, **kwargs):
+        # Returns a future for the call's result; bulk senders block here once too much is pending
+        if self.remote:
+            token = SEND_PRIORITY.set(priority)
+            try:
+                return asyncio.ensure_future(func(*args, **kwargs))
+            finally:
+                SEND_PRIORITY.reset(token)
+        self._ensure_started()
+        if priority == BULK:
+            await self._bulk_slots.acquire()
+        future = asyncio.get_running_loop().create_future()
+        if priority == BULK:
+            future.add_done_callback(self._bulk_done)
+        self._queue.put_nowait((priority, next(self._seq), chat_id, func, args, kwargs, future, self.clock(), 0))
+        return future
+
+    async def call(self, chat_id, func, *args, priority=INTERACTIVE, **kwargs):
+        return await (await self.submit(chat_id, func, *args, priority=priority, **kwargs))
+
+    def _bulk_done(self, future):
+        self._bulk_slots.release()
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("Bulk send failed: %r", future.exception())
+
+    def _requeue(self, item, delay):
+        # Parked with call_later so one slow chat never holds a worker
+        self._delayed += 1
+
+        def put():
+            self._delayed -= 1
+            self._queue.put_nowait(item)
+
+        asyncio.get_running_loop().call_later(delay, put)
+
+    async def _take_token(self):
+        while True:
+            now = self.clock()
+            self._tokens = min(self.rate, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            priority, seq, chat_id, func, args, kwargs, future, queued_at, attempts = item
+            if future.done():
+                continue
+            wait = self._chat_ready.get(chat_id, 0) - self.clock()
+            if wait > 0:
+                self._requeue(item, wait)
+                continue
+            await self._take_token()
+            self._chat_ready[chat_id] = self.clock() + self.per_chat_interval
+            waited = self.clock() - queued_at
+            try:
+                result = await func(*args, **kwargs)
+            except FloodWaitError as e:
+                self.flood_waits += 1
+                self._chat_ready[chat_id] = self.clock() + e.seconds
+                if attempts >= self.max_retries or e.seconds > self.max_flood_wait:
+                    self.failed += 1
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    logger.warning("FloodWait %ss for chat %s, retrying", e.seconds, chat_id)
+                    self.retries += 1
+                    self._requeue((priority, seq, chat_id, func, args, kwargs, future, queued_at, attempts + 1), e.seconds)
+                continue
+            except Exception as e:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            finally:
+                self._prune_chats()
+            self.sent += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            if not future.done():
+                future.set_result(result)
+
+    def _prune_chats(self):
+        if len(self._chat_ready) > 10000:
+            now = self.clock()
+            self._chat_ready = {chat: ready for chat, ready in self._chat_ready.items() if ready > now}
+
+    def depth(self):
+        return (self._queue.qsize() if self._queue is not None else 0) + self._delayed
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "flood_waits": self.flood_waits,
+            "retries": self.retries,
+            "avg_wait": self.total_wait / self.sent if self.sent else 0.0,
+            "max_wait": self.max_wait
+        }
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+
+sender = SendScheduler()
+
+async def send_message(client, chat_id, *args, priority=INTERACTIVE, **kwargs):
+    return await sender.call(chat_id, client.send_message, chat_id, *args, priority=priority, **kwargs)
+
+async def reply(event, *args, **kwargs):
+    return await sender.call(event.chat_id, event.reply, *args, **kwargs)
+
+async def edit(event, *args, **kwargs):
+    return await sender.call(event.chat_id, event.edit, *args, **kwargs)
+
+async def delete(message):
+    return await sender.call(message.chat_id, message.delete)
+
+async def delete_messages(client, chat_id, message_ids, priority=INTERACTIVE):
+    # For messages known only by id, e.g. ones sent before a restart
+    return await sender.call(chat_id, client.delete_messages, chat_id, message_ids, priority=priority)
@@ -0,0 +1,25 @@
+# singleflight.py
+import asyncio
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        # Concurrent callers with the same key await one shared task instead of repeating the work
+        task = self._calls.get(key)
+        if task is None:
+            self.executed += 1
+            task = self._calls[key] = asyncio.ensure_future(func(*args, **kwargs))
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.shared += 1
+        # Shielded so one cancelled caller doesn't cancel the lookup for everyone else
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {"name": self.name, "in_flight": len(self._calls), "executed": self.executed, "shared": self.shared}
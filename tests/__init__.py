@@ -0,0 +1,13 @@
+# tests/__init__.py
+# Placeholder settings so config imports without a .env; tests never reach Telegram or these services.
+# Install requirements-dev.txt, then run with: python -m pytest tests  (or python -m unittest discover -s tests -t .)
+import os
+
+for name, value in {
+    "API_ID": "1", "API_HASH": "test", "BOT_TOKEN": "test", "DATABASE_CHANNEL_ID": "-100", "ADMIN_ID": "42",
+    "MONGO_URI": "mongodb://localhost:27017", "BOT_USERNAME": "test_bot", "MAIN_CHANNEL_ID": "-200",
+    "TMDB_API_KEY": "test", "PAYMENT_ID": "test@upi", "QR_PHOTO_ID": "1",
+    # Same as benchmarks/fakes.py: TMDB is the local stub and sends aren't paced
+    "TMDB_BASE_URL": "http://127.0.0.1:8765/3", "SEND_GLOBAL_RATE": "1000000", "SEND_PER_CHAT_INTERVAL": "0"
+}.items():
+    os.environ.setdefault(name, value)
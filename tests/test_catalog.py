@@ -0,0 +1,44 @@
+# tests/test_catalog.py
+import unittest
+from catalog import apply_catalog_change
+from search_cache import search_cache
+from search_index import search_index, caption_tokens
+
+
+def doc(video_id, caption):
+    return {"_id": video_id, "caption": caption, "tokens": caption_tokens(caption)}
+
+
+class CatalogChangeTest(unittest.TestCase):
+    def setUp(self):
+        search_cache.invalidate_all()
+        apply_catalog_change(added=[doc(1, "Mirzapur S01E01 1080p"), doc(2, "Panchayat S01E01 720p")], publish=False)
+        search_cache.set(("mirzapur", None, None), {"ids": [1]}, search_cache.version)
+        search_cache.set(("panchayat", None, None), {"ids": [2]}, search_cache.version)
+
+    def tearDown(self):
+        for video_id in (1, 2, 3, 4):
+            search_index.remove(video_id)
+        search_cache.invalidate_all()
+
+    def test_new_video_only_drops_matching_captions(self):
+        apply_catalog_change(added=[doc(3, "Mirzapur S01E02 1080p")], publish=False)
+        self.assertIsNone(search_cache.get(("mirzapur", None, None)))
+        self.assertIsNotNone(search_cache.get(("panchayat", None, None)))
+
+    def test_terms_split_across_new_videos_keep_the_query(self):
+        search_cache.set(("mirzapur 720p", None, None), {"ids": [1]}, search_cache.version)
+        apply_catalog_change(added=[doc(3, "Mirzapur S01E02 1080p"), doc(4, "Gullak S01E01 720p")], publish=False)
+        self.assertIsNotNone(search_cache.get(("mirzapur 720p", None, None)))
+        self.assertIsNone(search_cache.get(("mirzapur", None, None)))
+
+    def test_reingested_video_drops_results_holding_it(self):
+        # Re-captioned so the old query no longer matches; the cached result still lists the id
+        apply_catalog_change(added=[doc(2, "Gullak S01E01 720p")], publish=False)
+        self.assertIsNone(search_cache.get(("panchayat", None, None)))
+        self.assertIsNotNone(search_cache.get(("mirzapur", None, None)))
+
+    def test_removed_video_drops_results_holding_it(self):
+        apply_catalog_change(removed=[1], publish=False)
+        self.assertIsNone(search_cache.get(("mirzapur", None, None)))
+        self.assertIsNotNone(search_cache.get(("panchayat", None, None)))
@@ -0,0 +1,19 @@
+# tests/test_checkout.py
+import unittest
+from types import SimpleNamespace
+import mongomock
+from checkout import CheckoutStore
+
+
+class CheckoutStoreTest(unittest.IsolatedAsyncioTestCase):
+    async def test_screenshot_reaches_another_worker(self):
+        collection = mongomock.MongoClient().db.checkouts
+        opened_here, rerouted_to = CheckoutStore(), CheckoutStore()
+        opened_here.use(collection)
+        rerouted_to.use(collection)
+        await opened_here.open(7, 30, 99, "abc", SimpleNamespace(chat_id=7, id=1))
+        # The other worker's set doesn't know the checkout: text skips Mongo, a photo finds it
+        self.assertIsNone(await rerouted_to.awaiting_screenshot(7))
+        self.assertEqual((await rerouted_to.awaiting_screenshot(7, photo=True))["_id"], "abc")
+        self.assertIn(7, rerouted_to.awaiting)
+        self.assertIsNone(await rerouted_to.awaiting_screenshot(8, photo=True))
@@ -0,0 +1,17 @@
+# tests/test_deep_link_burst.py
+import unittest
+from benchmarks.bench_deep_link_burst import run_burst
+from sender import sender
+
+
+class DeepLinkBurstTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncTearDown(self):
+        await sender.close()
+
+    async def test_identical_deep_links_share_one_search_and_lookup(self):
+        stats = await run_burst(500)
+        self.assertEqual(stats["answered"], 500)
+        self.assertEqual(stats["searches"], 1)
+        self.assertEqual(stats["shared_searches"], 499)
+        self.assertEqual(stats["lookups"], 1)
+        self.assertEqual(stats["http_requests"], 3)
@@ -0,0 +1,99 @@
+# tests/test_expiry.py
+import unittest
+from datetime import datetime, timedelta
+import mongomock
+from database import update_user_subscription, expire_subscription
+from expiry import SubscriptionSweeper
+from config import ADMIN_ID
+
+START = datetime(2026, 1, 1, 12, 0, 0)
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **delta):
+        self.now += timedelta(**delta)
+
+
+class RecordingSweeper(SubscriptionSweeper):
+    # Notices are recorded instead of going through the sender
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.notices = []
+
+    async def _notify(self, chat_id, message, buttons=None):
+        self.notices.append((chat_id, message))
+
+
+class SubscriptionSweeperTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.users = mongomock.MongoClient().db.users
+        self.clock = Clock(START)
+        self.sweeper = RecordingSweeper(None, self.users, clock=self.clock, batch_size=2, reminder_window=24 * 60 * 60)
+
+    def subscribe(self, user_id, days):
+        update_user_subscription(self.users, user_id, {
+            "is_paid": True, "expiry_date": self.clock() + timedelta(days=days), "plan_description": f"{days} Days Plan"
+        })
+
+    def notices_for(self, chat_id):
+        return [message for sent_to, message in self.sweeper.notices if sent_to == chat_id]
+
+    async def test_expiry_flips_subscription_once(self):
+        for user_id in (1, 2, 3):
+            self.subscribe(user_id, 3)
+        self.subscribe(4, 30)
+        self.assertEqual(await self.sweeper.sweep(), (0, 0))
+        self.clock.advance(days=3, seconds=1)
+        # Three users expire across two batches of two
+        self.assertEqual((await self.sweeper.sweep())[0], 3)
+        for user_id in (1, 2, 3):
+            user = self.users.find_one({"_id": user_id})
+            self.assertFalse(user["is_paid"])
+            self.assertEqual(user["plan_description"], "Plan Expired")
+            self.assertEqual(len(self.notices_for(user_id)), 1)
+        self.assertTrue(self.users.find_one({"_id": 4})["is_paid"])
+        self.assertEqual(len(self.notices_for(ADMIN_ID)), 3)
+        self.assertIn("3 Days Plan", self.notices_for(ADMIN_ID)[0])
+        self.assertEqual(await self.sweeper.sweep(), (0, 0))
+
+    async def test_single_reminder_before_expiry(self):
+        self.subscribe(1, 3)
+        self.clock.advance(days=1)
+        self.assertEqual(await self.sweeper.sweep(), (0, 0))
+        self.clock.advance(days=1, hours=1)
+        self.assertEqual(await self.sweeper.sweep(), (0, 1))
+        self.clock.advance(hours=12)
+        self.assertEqual(await self.sweeper.sweep(), (0, 0))
+        self.assertEqual(len(self.notices_for(1)), 1)
+        self.assertTrue(self.users.find_one({"_id": 1})["is_paid"])
+
+    async def test_renewal_resets_reminder(self):
+        self.subscribe(1, 3)
+        self.clock.advance(days=2, hours=1)
+        self.assertEqual(await self.sweeper.sweep(), (0, 1))
+        self.subscribe(1, 30)
+        self.assertFalse(self.users.find_one({"_id": 1})["expiry_reminded"])
+        # The old expiry date passes without effect; the new one earns its own reminder
+        self.clock.advance(days=1)
+        self.assertEqual(await self.sweeper.sweep(), (0, 0))
+        self.clock.advance(days=28, hours=12)
+        self.assertEqual(await self.sweeper.sweep(), (0, 1))
+        self.assertEqual(len(self.notices_for(1)), 2)
+
+    async def test_lazy_expiry_and_sweep_claim_once(self):
+        self.subscribe(1, 3)
+        self.subscribe(2, 3)
+        self.clock.advance(days=3, seconds=1)
+        # A file request expires user 1 first; the sweep only gets user 2, and user 1 has nothing left to claim
+        self.assertEqual(expire_subscription(self.users, 1, self.clock())["plan_description"], "3 Days Plan")
+        self.assertEqual(await self.sweeper.sweep(), (1, 0))
+        self.assertEqual(self.notices_for(1), [])
+        self.assertEqual(len(self.notices_for(2)), 1)
+        self.assertIsNone(expire_subscription(self.users, 2, self.clock()))
+        self.assertFalse(self.users.find_one({"_id": 1})["is_paid"])
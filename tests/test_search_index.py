@@ -0,0 +1,25 @@
+# tests/test_search_index.py
+import unittest
+from search_index import SearchIndex, caption_tokens
+
+
+class CandidatesTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.add(1, caption_tokens("Dark S01E01 1080p #101"))
+        self.index.add(2, caption_tokens("Darkness Falls 720p #102"))
+        self.index.add(3, caption_tokens("Mirzapur S02E01 1080p #103"))
+
+    def test_short_and_numeric_terms_are_left_to_the_regex(self):
+        self.assertEqual(self.index.candidates("dark 2"), {1, 2})
+        self.assertIsNone(self.index.candidates("2 10"))
+
+    def test_expansions_follow_token_changes(self):
+        self.assertEqual(self.index.candidates("dark"), {1, 2})
+        self.index.add(4, caption_tokens("Gullak 480p #104"))
+        self.assertIn("dark", self.index._expansions)
+        self.index.add(5, caption_tokens("Darkest Hour 480p #105"))
+        self.assertEqual(self.index.candidates("dark"), {1, 2, 5})
+        self.index.remove(2)
+        self.assertEqual(self.index.candidates("darkness"), set())
+        self.assertEqual(self.index.candidates("dark"), {1, 5})
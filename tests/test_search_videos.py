@@ -0,0 +1,160 @@
+# tests/test_search_videos.py
+import os
+import functools
+import unittest
+import mongomock
+from pymongo import MongoClient
+from database import search_videos, get_videos_by_ids, find_videos_below
+from search_index import build_regex_pattern, caption_tokens, rank_features, rank_ids
+
+QUALITIES = ["2160p", "1080p", "720p", "480p"]
+
+
+def video(video_id, caption, category, quality):
+    return {
+        "_id": video_id, "caption": caption, "category": category, "quality": quality,
+        "tokens": caption_tokens(caption), "rank": rank_features(caption)
+    }
+
+
+def caption_filter(clean_query):
+    return {"caption": {"$regex": build_regex_pattern(clean_query), "$options": "i"}}
+
+
+def count_documents_facets(collection, search_filter, category, quality):
+    # The per-render count_documents calls search_videos replaced: quality counts under the active
+    # category, category counts under the active quality
+    category_match = {"category": category} if category else {}
+    quality_match = quality if quality else {"$exists": True}
+    return {
+        "total": collection.count_documents({**search_filter, **category_match, **({"quality": quality} if quality else {})}),
+        "quality_counts": {q: collection.count_documents({**search_filter, "quality": q, **category_match}) for q in QUALITIES},
+        "category_counts": {
+            c: collection.count_documents({**search_filter, "category": c, "quality": quality_match}) for c in ("movie", "series")
+        }
+    }
+
+
+class SearchVideosTest(unittest.TestCase):
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db.videos
+        docs = []
+        for i in range(1, 41):
+            quality = QUALITIES[i % 4]
+            if i % 3:
+                docs.append(video(i, f"Mirzapur S01E{i:02d} {quality} Hindi", "series", quality))
+            else:
+                docs.append(video(i, f"Mirzapur Movie {2000 + i} {quality}", "movie", quality))
+        docs.append(video(41, "Panchayat S02E01 1080p Hindi", "series", "1080p"))
+        docs.append(video(42, "Mirzapur The Making 480p", "movie", "480p"))
+        self.collection.insert_many(docs)
+
+    def test_facet_counts_match_count_documents(self):
+        # search renders with no facet; page, filter and quality renders with every combination
+        for query in ("mirzapur", "1080p hindi", "panchayat", "nothing"):
+            search_filter = caption_filter(query)
+            for category in (None, "movie", "series"):
+                for quality in [None] + QUALITIES:
+                    with self.subTest(query=query, category=category, quality=quality):
+                        result = search_videos(self.collection, search_filter, category, quality)
+                        expected = count_documents_facets(self.collection, search_filter, category, quality)
+                        self.assertEqual(result["total"], expected["total"])
+                        self.assertEqual(result["quality_counts"], expected["quality_counts"])
+                        self.assertEqual(result["category_counts"], expected["category_counts"])
+
+    def test_ranked_ids_match_unranked(self):
+        search_filter = caption_filter("mirzapur")
+        rank = functools.partial(rank_ids, "mirzapur")
+        plain = search_videos(self.collection, search_filter)
+        ranked = search_videos(self.collection, search_filter, rank=rank)
+        self.assertEqual(plain["ids"], sorted(plain["ids"], reverse=True))
+        self.assertCountEqual(ranked["ids"], plain["ids"])
+        self.assertEqual(ranked["total"], self.collection.count_documents(search_filter))
+        self.assertIsNone(ranked["tail_before"])
+
+    def test_only_newest_matches_are_ranked(self):
+        search_filter = caption_filter("mirzapur")
+        result = search_videos(self.collection, search_filter, "series", rank=functools.partial(rank_ids, "mirzapur"), rank_limit=7)
+        newest = [doc["_id"] for doc in self.collection.find({**search_filter, "category": "series"}).sort("_id", -1)]
+        self.assertEqual(result["total"], len(newest))
+        self.assertCountEqual(result["ids"], newest[:7])
+        self.assertEqual(result["tail_before"], newest[6])
+        # The ranked head, then the tail page by page, covers every match once
+        seen = [doc["_id"] for doc in get_videos_by_ids(self.collection, result["ids"])]
+        while len(seen) < result["total"]:
+            page = find_videos_below(self.collection, result["filter"], result["tail_before"], len(seen) - 7, 5)
+            self.assertTrue(page)
+            seen += [doc["_id"] for doc in page]
+        self.assertEqual(seen[7:], newest[7:])
+        self.assertCountEqual(seen, newest)
+
+
+class TailPagingTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db.videos
+        self.collection.insert_many([
+            {**video(i, f"Dark S01E{i:02d} 1080p", "series", "1080p"), "file_size": "1 GB"} for i in range(1, 24)
+        ])
+
+    async def test_cursors_page_forward_and_back(self):
+        from handlers.common import fetch_page
+        search_filter = caption_filter("dark")
+        result = search_videos(self.collection, search_filter, rank=functools.partial(rank_ids, "dark"), rank_limit=7)
+        pages = []
+        cursor = None
+        for page in range(5):
+            facets = await fetch_page(self.collection, result, page, 5, cursor)
+            pages.append([doc["_id"] for doc in facets["results"]])
+            cursor = facets["next_cursor"]
+        self.assertEqual(sum(pages, [])[:7], result["ids"])
+        self.assertEqual(sum(pages, [])[7:], list(range(16, 0, -1)))
+        # Back from the last page, each Prev cursor lands on the same page as going forward
+        for page in range(4, 0, -1):
+            cursor = facets["prev_cursor"]
+            facets = await fetch_page(self.collection, result, page - 1, 5, cursor)
+            self.assertEqual([doc["_id"] for doc in facets["results"]], pages[page - 1])
+        # Without a cursor (an old button) the page number still finds the page
+        facets = await fetch_page(self.collection, result, 3, 5)
+        self.assertEqual([doc["_id"] for doc in facets["results"]], pages[3])
+
+
+@unittest.skipUnless(os.getenv("TEST_MONGO_URI"), "set TEST_MONGO_URI to a disposable mongod")
+class SearchVideosMongodTest(unittest.TestCase):
+    # mongomock has no document size limit; this needs enough matches that ids plus rank features
+    # would pass 16 MB if they went through $facet
+    MATCHES = 60000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = MongoClient(os.environ["TEST_MONGO_URI"])
+        cls.collection = cls.client.search_videos_test.videos
+        cls.collection.drop()
+        batch = []
+        for i in range(1, cls.MATCHES + 1):
+            quality = QUALITIES[i % 4]
+            caption = (f"Some Long Running Series Title Number {i % 500} S01E{i % 99 + 1:02d} {quality} Hindi English "
+                       f"Dual Audio WEB-DL x264 AAC Extended Directors Cut Remastered Edition Part {i}")
+            batch.append(video(i, caption, "series" if i % 3 else "movie", quality))
+            if len(batch) == 5000:
+                cls.collection.insert_many(batch)
+                batch = []
+        if batch:
+            cls.collection.insert_many(batch)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.collection.drop()
+        cls.client.close()
+
+    def test_broad_ranked_search(self):
+        search_filter = caption_filter("s01")
+        result = search_videos(self.collection, search_filter, rank=functools.partial(rank_ids, "s01"), rank_limit=500)
+        self.assertEqual(result["total"], self.MATCHES)
+        self.assertEqual(len(set(result["ids"])), 500)
+        self.assertEqual(result["tail_before"], self.MATCHES - 499)
+        self.assertEqual(sum(result["quality_counts"].values()), self.MATCHES)
+
+    def test_broad_ranked_search_with_facets(self):
+        search_filter = caption_filter("hindi")
+        result = search_videos(self.collection, search_filter, "series", "1080p", functools.partial(rank_ids, "hindi"))
+        self.assertEqual(result["total"], self.collection.count_documents({**search_filter, "category": "series", "quality": "1080p"}))
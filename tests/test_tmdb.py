@@ -0,0 +1,34 @@
+# tests/test_tmdb.py
+import unittest
+from aiohttp import web
+from tmdb import TMDBClient
+
+
+class TMDBClientGetTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        async def handle(request):
+            if request.path.endswith("/html"):
+                return web.Response(text="<html>Bad gateway</html>", content_type="text/html")
+            if request.path.endswith("/truncated"):
+                return web.Response(text='{"results": [', content_type="application/json")
+            return web.json_response({"results": []})
+
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.client = TMDBClient(api_key="test", base_url=f"http://127.0.0.1:{port}/3")
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.runner.cleanup()
+
+    async def test_unparseable_bodies_count_as_failures(self):
+        self.assertEqual(await self.client.get("/search/multi"), {"results": []})
+        with self.assertLogs("tmdb", "WARNING"):
+            self.assertIsNone(await self.client.get("/search/html"))
+        with self.assertLogs("tmdb", "WARNING"):
+            self.assertIsNone(await self.client.get("/search/truncated"))
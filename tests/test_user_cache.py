@@ -0,0 +1,37 @@
+# tests/test_user_cache.py
+import unittest
+import mongomock
+from database import get_user, update_user_subscription, forget_user
+
+
+class RacingUsers:
+    # find_one returns what it read, but a subscription write lands before the read is done
+    def __init__(self, collection, user_id, fields):
+        self.collection = collection
+        self.user_id = user_id
+        self.fields = fields
+
+    def find_one(self, query):
+        user = self.collection.find_one(query)
+        update_user_subscription(self.collection, self.user_id, self.fields)
+        return user
+
+
+class UserCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.users = mongomock.MongoClient().db.users
+        self.users.insert_one({"_id": 7, "privacy_policy_accepted": True, "is_paid": False})
+        forget_user(7)
+
+    def tearDown(self):
+        forget_user(7)
+
+    def test_read_overlapping_a_write_is_not_cached(self):
+        stale = get_user(RacingUsers(self.users, 7, {"is_paid": True}), 7)
+        self.assertFalse(stale["is_paid"])
+        self.assertTrue(get_user(self.users, 7)["is_paid"])
+
+    def test_write_through(self):
+        self.assertFalse(get_user(self.users, 7)["is_paid"])
+        update_user_subscription(self.users, 7, {"is_paid": True})
+        self.assertTrue(get_user(None, 7)["is_paid"])
@@ -0,0 +1,229 @@
+# tmdb.py
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta
+import aiohttp
+from cache import TTLCache
+from singleflight import SingleFlight
+from database import run_db
+from metrics import TMDB_LATENCY
+from config import (
+    TMDB_API_KEY, TMDB_BASE_URL, TMDB_REQUEST_TIMEOUT, TMDB_MAX_CONNECTIONS,
+    TMDB_CACHE_SIZE, TMDB_CACHE_TTL, TMDB_NEGATIVE_CACHE_TTL, TMDB_STORE_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+TMDB_IMAGE_BASE_URL = "https://image.tmdb.org/t/p/original"
+
+LANGUAGE_MAP = {
+    "hi": "Hindi", "en": "English", "es": "Spanish", "fr": "French", "de": "German",
+    "ja": "Japanese", "ko": "Korean", "zh": "Chinese", "ta": "Tamil", "te": "Telugu",
+    "mr": "Marathi", "bn": "Bengali", "pa": "Punjabi", "ml": "Malayalam", "gu": "Gujarati",
+    "kn": "Kannada", "or": "Odia", "ur": "Urdu", "sa": "Sanskrit", "fa": "Persian",
+    "ru": "Russian", "it": "Italian", "pt": "Portuguese", "tr": "Turkish", "ar": "Arabic"
+}
+
+
+def parse_tmdb_query(query):
+    query = re.sub(r'\s+', ' ', query).strip().lower()
+
+    # Extract year if present in the query (e.g., "movie title 2022")
+    year_match = re.search(r'\b(19\d{2}|20\d{2})\b', query)
+    year = year_match.group(1) if year_match else None
+
+    # Remove year from base title if found
+    base_title = query
+    if year:
+        base_title = re.sub(r'\b' + year + r'\b', '', base_title).strip()
+
+    # Extract season/episode info
+    season_match = re.search(r'(?:season\s+|s)(\d{1,2})\b', base_title)
+    episode_match = re.search(r'(?:episode\s+|e)(\d{1,2})\b', base_title)
+    season_num = int(season_match.group(1)) if season_match else None
+    episode_num = int(episode_match.group(1)) if episode_match else None
+    base_title = re.sub(r'(season\s+\d+|s\d{2}|episode\s+\d+|e\d{2}|s\d{2}e\d{2})', '', base_title).strip()
+    return base_title, year, season_num, episode_num
+
+
+class TMDBClient:
+    def __init__(self, api_key=TMDB_API_KEY, base_url=TMDB_BASE_URL, timeout=TMDB_REQUEST_TIMEOUT):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = None
+        # Keyed on the parsed (base_title, year, season, episode) so spelling variants of a query share an entry
+        self.cache = TTLCache("tmdb", TMDB_CACHE_SIZE, TMDB_CACHE_TTL)
+        self.store = None
+        self.store_hits = 0
+        self.fetches = 0
+        self.flight = SingleFlight("tmdb")
+
+    def use_store(self, collection):
+        # Optional Mongo tier so a restart doesn't start from a cold cache; Mongo reaps expired entries
+        collection.create_index("expires_at", expireAfterSeconds=0)
+        self.store = collection
+
+    def stats(self):
+        return {**self.cache.stats(), "store_hits": self.store_hits, "fetches": self.fetches, "shared": self.flight.shared}
+
+    def _get_session(self):
+        # One keep-alive session for the whole process, created lazily inside the running loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=TMDB_MAX_CONNECTIONS, keepalive_timeout=60)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def get(self, path, **params):
+        # "/tv/1399/season/2" -> "tv_season": one label per endpoint, not per title
+        parts = path.strip("/").split("/")
+        endpoint = "_".join(parts) if parts[0] == "search" else "_".join(parts[::2])
+        try:
+            with TMDB_LATENCY.time(endpoint):
+                async with self._get_session().get(f"{self.base_url}{path}", params={"api_key": self.api_key, **params}) as response:
+                    if response.status != 200:
+                        return None
+                    # An HTML error page raises ContentTypeError (a ClientError), a truncated body ValueError
+                    return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning("TMDB request %s failed: %r", path, e)
+            return None
+
+    async def fetch_details(self, query):
+        key = parse_tmdb_query(query)
+        details = self.cache.get(key, _MISSING)
+        if details is not _MISSING:
+            return details
+        return await self.flight.do(key, self._load_details, key)
+
+    async def _load_details(self, key):
+        store_key = "|".join(str(part) for part in key)
+        if self.store is not None:
+            doc = await run_db(self.store.find_one, {"_id": store_key, "expires_at": {"$gt": datetime.utcnow()}})
+            if doc:
+                self.store_hits += 1
+                self.cache.set(key, doc["details"])
+                return doc["details"]
+        self.fetches += 1
+        details = await self.fetch_parsed_details(*key)
+        # Misses may be transient TMDB failures, so they are only remembered briefly and never persisted
+        self.cache.set(key, details, ttl=None if details else TMDB_NEGATIVE_CACHE_TTL)
+        if details and self.store is not None:
+            await run_db(
+                self.store.update_one,
+                {"_id": store_key},
+                {"$set": {"details": details, "expires_at": datetime.utcnow() + timedelta(seconds=TMDB_STORE_TTL)}},
+                upsert=True
+            )
+        return details
+
+    async def fetch_parsed_details(self, base_title, year, season_num, episode_num):
+        # Multi-search without year parameter first
+        search = await self.get("/search/multi", query=base_title, region="IN", include_adult="true")
+        if not search or not search.get("results"):
+            # Try without region constraint
+            search = await self.get("/search/multi", query=base_title, include_adult="true")
+            if not search or not search.get("results"):
+                return None
+
+        results = search["results"]
+
+        # If year is specified, filter results by that year
+        if year:
+            year_filtered_results = []
+            for item in results:
+                release_date = item.get("release_date") or item.get("first_air_date", "")
+                if release_date.startswith(year):
+                    year_filtered_results.append(item)
+
+            # If we have year-filtered results, use those instead
+            if year_filtered_results:
+                results = year_filtered_results
+
+        # Get the first relevant result
+        result = next((item for item in results if item.get("media_type") in ["movie", "tv"]), None)
+
+        if not result:
+            return None
+
+        media_type = result["media_type"]
+        name = result.get("title") or result.get("name", base_title)
+        poster_path = result.get("poster_path")
+        poster_url = f"{TMDB_IMAGE_BASE_URL}{poster_path}" if poster_path else "https://via.placeholder.com/150"
+        details = {"type": "Movie" if media_type == "movie" else "Series", "name": name, "poster_url": poster_url}
+
+        release_date = result.get("release_date") or result.get("first_air_date")
+        if release_date:
+            details["release_line"] = f"Release Date :- {release_date} IN"
+        vote_average = result.get("vote_average")
+        if vote_average:
+            details["rating_line"] = f"Rating :- {round(vote_average, 1)}"
+
+        # Details, genres, videos and providers come back in one request; the season runs alongside it
+        append = "videos,watch/providers,release_dates" if media_type == "movie" else "videos,watch/providers"
+        calls = [self.get(f"/{media_type}/{result['id']}", append_to_response=append)]
+        if media_type == "tv" and season_num:
+            calls.append(self.get(f"/tv/{result['id']}/season/{season_num}"))
+        responses = await asyncio.gather(*calls)
+        media_details = responses[0] or {}
+        season_data = responses[1] if len(responses) > 1 else None
+
+        if media_type == "movie":
+            runtime = media_details.get("runtime")
+            if runtime:
+                hours, minutes = divmod(runtime, 60)
+                details["duration_line"] = f"Duration :- {hours}h {minutes}m"
+        elif media_type == "tv":
+            seasons = media_details.get("number_of_seasons")
+            if seasons:
+                details["season_line"] = f"Total Season :- {seasons}"
+            episode_run_time = media_details.get("episode_run_time")
+            if episode_run_time and episode_run_time[0]:
+                details["duration_line"] = f"Avg Episode Duration :- {episode_run_time[0]}m"
+
+            if season_data is not None:
+                details["type"] = f"Series - Season {season_num}"
+                details["season_line"] = f"Season {season_num} Episodes :- {len(season_data.get('episodes', []))}"
+                if season_data.get("poster_path"):
+                    details["poster_url"] = f"{TMDB_IMAGE_BASE_URL}{season_data['poster_path']}"
+                if episode_num:
+                    episode = next((ep for ep in season_data.get("episodes", []) if ep["episode_number"] == episode_num), None)
+                    if episode:
+                        details["type"] = f"Series - Season {season_num} Episode {episode_num}"
+                        details["name"] = f"{name} - {episode['name']}"
+                        details["release_line"] = f"Air Date :- {episode.get('air_date', '')} IN" if episode.get("air_date") else ""
+                        details["duration_line"] = f"Duration :- {episode.get('runtime', episode_run_time[0] if episode_run_time else 0)}m"
+                        if episode.get("vote_average"):
+                            details["rating_line"] = f"Rating :- {round(episode['vote_average'], 1)}"
+
+        language = result.get("original_language")
+        if language:
+            details["audio_line"] = f"Original Audio :- {LANGUAGE_MAP.get(language, language.upper())}"
+        genres = [g["name"] for g in media_details.get("genres", [])]
+        if genres:
+            details["genre_line"] = f"Genre :- {' '.join(f'#{g.lower()}' for g in genres)}"
+        trailer_key = next((v["key"] for v in media_details.get("videos", {}).get("results", []) if v["type"] == "Trailer" and v["site"] == "YouTube"), None)
+        if trailer_key:
+            details["trailer_line"] = f"Trailer :- <a href='https://www.youtube.com/watch?v={trailer_key}'>Click Here</a>"
+        providers = media_details.get("watch/providers", {}).get("results", {}).get("IN", {}).get("flatrate", [])
+        if providers:
+            provider_names = ", ".join(p["provider_name"] for p in providers)
+            details["platforms_line"] = f"Platforms :- {provider_names}"
+
+        # Only set default for keys that might be accessed, don't add empty strings
+        for key in ["release_line", "rating_line", "duration_line", "season_line", "audio_line", "genre_line", "trailer_line", "platforms_line"]:
+            details.setdefault(key, "")
+
+        return details
+
+
+tmdb_client = TMDBClient()
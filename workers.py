@@ -0,0 +1,459 @@
+# workers.py
+# Spreads the handlers over WORKER_PROCESSES processes. The bot process keeps the Telegram client, the send
+# scheduler, ingestion and the subscription sweeper; every other update goes to the worker that owns its user,
+# and whatever a handler sends comes back here to go out through the one client.
+import asyncio
+import functools
+import inspect
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import pickle
+import threading
+from collections import Counter
+from types import SimpleNamespace
+from telethon import events
+from telethon.extensions import BinaryReader, markdown
+from telethon.tl.custom import Message
+from catalog import apply_catalog_change, on_catalog_change
+from database import (
+    on_user_change, forget_user, get_videos_collection, get_users_collection, get_tmdb_cache_collection, close_client
+)
+from search_index import search_index
+from tmdb import tmdb_client
+from sender import sender, SEND_PRIORITY
+from metrics import HANDLER_LATENCY, record_snapshot, push_snapshots
+from utils import logger
+from logs import setup_logging
+from config import TMDB_PERSISTENT_CACHE
+
+# What a worker may call on the bot's client, and on the update it is handling
+CLIENT_METHODS = {"send_message", "delete_messages", "get_messages", "is_bot"}
+EVENT_METHODS = {"reply", "edit", "answer", "delete"}
+
+
+def _portable(exc):
+    # Errors go back to the worker pickled; Telethon's RPC errors survive that, anything else is wrapped
+    try:
+        pickle.loads(pickle.dumps(exc))
+        return exc
+    except Exception:
+        return RuntimeError(repr(exc))
+
+def _encode_result(method, result):
+    # Fetched messages travel as raw TL bytes; sent ones only as (id, chat) so the worker can delete them later
+    if method == "get_messages":
+        if isinstance(result, list):
+            return [bytes(message) if message is not None else None for message in result]
+        return bytes(result) if result is not None else None
+    if hasattr(result, "id") and hasattr(result, "chat_id"):
+        return ("message", result.id, result.chat_id)
+    return result if isinstance(result, (bool, int, type(None))) else None
+
+def decode_message(client, raw):
+    message = BinaryReader(raw).tgread_object()
+    if isinstance(message, Message):
+        message._finish_init(client, {}, None)
+    return message
+
+
+class WorkerPool:
+    def __init__(self, processes, database_channel, admin_id, mongo_uri, open_collections=None):
+        self.processes = processes
+        self.database_channel = database_channel
+        self.admin_id = admin_id
+        self.mongo_uri = mongo_uri
+        # Benchmarks pass a factory for in-memory collections instead of connecting to mongo_uri
+        self.open_collections = open_collections
+        self.context = multiprocessing.get_context("fork")
+        self.outbox = self.context.Queue()
+        self.inboxes = []
+        self.workers = []
+        self.client = None
+        self.loop = None
+        self.pending = {}
+        self.dead = set()
+        self.closing = False
+        self._ids = itertools.count(1)
+        self._tasks = set()
+
+    def start(self):
+        # Forked before the bot process starts any thread or opens its Telegram session or Mongo pool; a lock
+        # some thread held at fork time would stay held in the child. Each worker opens its own
+        for index in range(self.processes):
+            inbox = self.context.Queue()
+            process = self.context.Process(
+                target=_worker_main,
+                args=(index, inbox, self.outbox, self.database_channel, self.admin_id, self.mongo_uri, self.open_collections),
+                name=f"worker-{index}",
+                daemon=True
+            )
+            process.start()
+            self.inboxes.append(inbox)
+            self.workers.append(process)
+
+    def register(self, client):
+        # The bot process's own handlers: everything outside the database channel is forwarded
+        self.client = client
+        on_catalog_change(lambda *change: self._broadcast(("catalog", change)))
+        on_user_change(lambda user_id: self._broadcast(("user", user_id)))
+
+        @client.on(events.NewMessage(chats=self.database_channel, blacklist_chats=True))
+        async def forward_message(event):
+            await self.dispatch(event, {"kind": "message", "message": bytes(event.message)})
+
+        @client.on(events.CallbackQuery)
+        async def forward_callback(event):
+            await self.dispatch(event, {
+                "kind": "callback",
+                "data": event.data,
+                "chat_instance": event.query.chat_instance,
+                "message_id": event.message_id
+            })
+
+    def _ensure_listening(self):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            threading.Thread(target=self._read, name="worker-outbox", daemon=True).start()
+            threading.Thread(target=self._watch, name="worker-watch", daemon=True).start()
+
+    def _route(self, key):
+        # A dead worker's users move to the next live one; their conversation state died with it
+        index = key % self.processes
+        for offset in range(self.processes):
+            candidate = (index + offset) % self.processes
+            if candidate not in self.dead:
+                return candidate
+        raise RuntimeError("Every worker process has exited")
+
+    async def dispatch(self, event, envelope):
+        self._ensure_listening()
+        envelope.update(sender_id=event.sender_id, chat_id=event.chat_id, is_private=event.is_private)
+        # One user's updates always go to the same worker, in arrival order; their conversation state lives there
+        index = self._route(event.sender_id or event.chat_id or 0)
+        event_id = next(self._ids)
+        done = self.loop.create_future()
+        self.pending[event_id] = (event, index, done)
+        with HANDLER_LATENCY.time("worker"):
+            self.inboxes[index].put(("event", event_id, envelope))
+            await done
+
+    def _read(self):
+        # Blocking queue reads stay on this thread; everything else runs on the event loop
+        while True:
+            item = self.outbox.get()
+            if item is None:
+                return
+            try:
+                self.loop.call_soon_threadsafe(self._receive, item)
+            except RuntimeError:
+                return
+
+    def _watch(self):
+        # Blocks on the process sentinels; a worker that exits outside close() would otherwise leave
+        # every update dispatched to it waiting forever
+        alive = {process.sentinel: index for index, process in enumerate(self.workers)}
+        while alive:
+            for sentinel in multiprocessing.connection.wait(list(alive)):
+                index = alive.pop(sentinel)
+                # Reaps it, so exitcode is set
+                self.workers[index].join(timeout=1)
+                try:
+                    self.loop.call_soon_threadsafe(self._worker_exited, index)
+                except RuntimeError:
+                    return
+
+    def _worker_exited(self, index):
+        if self.closing:
+            return
+        self.dead.add(index)
+        logger.error("Worker %s exited with code %s; its users move to another worker", index, self.workers[index].exitcode)
+        for event_id, (_, worker, done) in list(self.pending.items()):
+            if worker == index:
+                del self.pending[event_id]
+                if not done.done():
+                    done.set_exception(RuntimeError(f"worker-{index} exited while handling the update"))
+
+    def _receive(self, item):
+        kind = item[0]
+        if kind == "call":
+            task = asyncio.create_task(self._call(*item[1:]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        elif kind == "done":
+            entry = self.pending.pop(item[1], None)
+            if entry is not None and not entry[2].done():
+                entry[2].set_result(None)
+        elif kind == "catalog":
+            _, origin, change = item
+            apply_catalog_change(*change, publish=False)
+            self._broadcast(("catalog", change), skip=origin)
+        elif kind == "user":
+            _, origin, user_id = item
+            forget_user(user_id)
+            self._broadcast(("user", user_id), skip=origin)
+        elif kind == "metrics":
+            record_snapshot(item[1], item[2])
+
+    def _broadcast(self, message, skip=None):
+        for index, inbox in enumerate(self.inboxes):
+            if index != skip and index not in self.dead:
+                inbox.put(message)
+
+    async def _call(self, index, call_id, target, method, args, kwargs, priority):
+        try:
+            if target is None:
+                if method not in CLIENT_METHODS:
+                    raise ValueError(f"Workers can't call client.{method}")
+                func = getattr(self.client, method)
+                chat_id = args[0] if args else None
+            else:
+                if method not in EVENT_METHODS:
+                    raise ValueError(f"Workers can't call event.{method}")
+                event = self.pending[target][0]
+                func = getattr(event, method)
+                chat_id = event.chat_id
+            # Calls the worker made through the send scheduler are queued here at the same priority
+            if priority is None:
+                result = await func(*args, **kwargs)
+            else:
+                result = await sender.call(chat_id, func, *args, priority=priority, **kwargs)
+            reply = ("result", call_id, True, _encode_result(method, result))
+        except Exception as e:
+            reply = ("result", call_id, False, _portable(e))
+        self.inboxes[index].put(reply)
+
+    def pending_counts(self):
+        counts = Counter(index for _, index, _ in self.pending.values())
+        return {index: counts[index] for index in range(self.processes)}
+
+    async def close(self):
+        self.closing = True
+        for inbox in self.inboxes:
+            inbox.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._join)
+        self.outbox.put(None)
+
+    def _join(self):
+        for process in self.workers:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+
+class RemoteMessage:
+    # A message the bot process sent for a worker
+    def __init__(self, client, id, chat_id):
+        self._client = client
+        self.id = id
+        self.chat_id = chat_id
+
+    async def delete(self):
+        return await self._client.delete_messages(self.chat_id, [self.id])
+
+
+class WorkerEvent:
+    # The parts of a Telethon event the handlers use; replies and edits run on the real event in the bot process
+    def __init__(self, client, event_id, envelope):
+        self.client = client
+        self.event_id = event_id
+        self.sender_id = envelope["sender_id"]
+        self.chat_id = envelope["chat_id"]
+        self.is_private = envelope["is_private"]
+        self.pattern_match = None
+        self.released = False
+        if envelope["kind"] == "message":
+            self.message = decode_message(client, envelope["message"])
+        else:
+            self.data = envelope["data"]
+            self.data_match = None
+            self.message_id = envelope["message_id"]
+            self.query = SimpleNamespace(data=envelope["data"], chat_instance=envelope["chat_instance"])
+
+    def __getattr__(self, name):
+        # Like NewMessage.Event, anything else is read from the message
+        message = self.__dict__.get("message")
+        if message is None:
+            raise AttributeError(name)
+        return getattr(message, name)
+
+    async def get_sender(self):
+        # Handlers only compare the sender's id
+        return SimpleNamespace(id=self.sender_id)
+
+    async def reply(self, *args, **kwargs):
+        if self.released:
+            # A background task (the /backfill report) outlived the update; send a plain message instead
+            return await self.client.send_message(self.chat_id, *args, **kwargs)
+        return await self.client.call(self.event_id, "reply", args, kwargs)
+
+    async def edit(self, *args, **kwargs):
+        return await self.client.call(self.event_id, "edit", args, kwargs)
+
+    async def answer(self, *args, **kwargs):
+        return await self.client.call(self.event_id, "answer", args, kwargs)
+
+    async def delete(self, *args, **kwargs):
+        return await self.client.call(self.event_id, "delete", args, kwargs)
+
+
+class ProxyClient:
+    # Stands in for TelegramClient inside a worker: handlers register on it as usual,
+    # and every call they make on it is run by the bot process
+    parse_mode = markdown
+
+    def __init__(self, index, inbox, outbox):
+        self.index = index
+        self.inbox = inbox
+        self.outbox = outbox
+        self.handlers = []
+        self.loop = None
+        self._calls = {}
+        self._ids = itertools.count(1)
+        self._tasks = set()
+        # sender (or chat) id -> that user's latest update task; each update waits for the one before it
+        self._user_tasks = {}
+        self._is_bot = None
+        # Read by Message._finish_init
+        self._self_id = None
+        self._mb_entity_cache = {}
+
+    def on(self, event_builder):
+        if isinstance(event_builder, type):
+            event_builder = event_builder()
+
+        def decorator(func):
+            self.handlers.append((event_builder, func))
+            return func
+        return decorator
+
+    async def call(self, target, method, args=(), kwargs=None):
+        call_id = next(self._ids)
+        future = self.loop.create_future()
+        self._calls[call_id] = future
+        self.outbox.put(("call", self.index, call_id, target, method, args, kwargs or {}, SEND_PRIORITY.get()))
+        result = await future
+        if isinstance(result, tuple) and result[0] == "message":
+            return RemoteMessage(self, result[1], result[2])
+        return result
+
+    async def send_message(self, *args, **kwargs):
+        return await self.call(None, "send_message", args, kwargs)
+
+    async def delete_messages(self, *args, **kwargs):
+        return await self.call(None, "delete_messages", args, kwargs)
+
+    async def get_messages(self, *args, **kwargs):
+        result = await self.call(None, "get_messages", args, kwargs)
+        if isinstance(result, list):
+            return [decode_message(self, raw) if raw is not None else None for raw in result]
+        return decode_message(self, result) if result is not None else None
+
+    async def is_bot(self):
+        if self._is_bot is None:
+            self._is_bot = await self.call(None, "is_bot")
+        return self._is_bot
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        stopped = self.loop.create_future()
+        threading.Thread(target=self._read, args=(stopped,), name="worker-inbox", daemon=True).start()
+        await stopped
+
+    def _read(self, stopped):
+        while True:
+            item = self.inbox.get()
+            if item is None:
+                self.loop.call_soon_threadsafe(stopped.set_result, None)
+                return
+            self.loop.call_soon_threadsafe(self._receive, item)
+
+    def _receive(self, item):
+        kind = item[0]
+        if kind == "event":
+            envelope = item[2]
+            key = envelope["sender_id"] or envelope["chat_id"]
+            task = asyncio.create_task(self._dispatch(item[1], envelope, self._user_tasks.get(key)))
+            self._tasks.add(task)
+            self._user_tasks[key] = task
+            task.add_done_callback(functools.partial(self._dispatched, key))
+        elif kind == "result":
+            _, call_id, ok, value = item
+            future = self._calls.pop(call_id, None)
+            if future is not None and not future.done():
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+        elif kind == "catalog":
+            apply_catalog_change(*item[1], publish=False)
+        elif kind == "user":
+            forget_user(item[1])
+
+    def _dispatched(self, key, task):
+        self._tasks.discard(task)
+        if self._user_tasks.get(key) is task:
+            del self._user_tasks[key]
+
+    async def _dispatch(self, event_id, envelope, previous=None):
+        # Same rules as Telethon's own dispatch: builders in registration order, their filters, StopPropagation.
+        # Different users' updates run concurrently; one user's run one at a time, in arrival order
+        if previous is not None:
+            await asyncio.wait([previous])
+        event = WorkerEvent(self, event_id, envelope)
+        kind = events.NewMessage if envelope["kind"] == "message" else events.CallbackQuery
+        try:
+            for builder, callback in self.handlers:
+                if not isinstance(builder, kind):
+                    continue
+                if not builder.resolved:
+                    await builder.resolve(self)
+                passed = builder.filter(event)
+                if inspect.isawaitable(passed):
+                    passed = await passed
+                if not passed:
+                    continue
+                try:
+                    await callback(event)
+                except events.StopPropagation:
+                    break
+                except Exception:
+                    logger.exception("Unhandled exception in %s", callback.__name__)
+        finally:
+            event.released = True
+            self.outbox.put(("done", event_id))
+
+
+def _worker_main(index, inbox, outbox, database_channel, admin_id, mongo_uri, open_collections):
+    from handlers import register_handlers
+
+    setup_logging()
+    if open_collections is not None:
+        videos_collection, users_collection = open_collections()
+    else:
+        videos_collection = get_videos_collection(mongo_uri)
+        users_collection = get_users_collection(mongo_uri)
+        if TMDB_PERSISTENT_CACHE:
+            tmdb_client.use_store(get_tmdb_cache_collection(mongo_uri))
+    search_index.load(videos_collection)
+
+    # Catalog and profile changes made here are replayed in every other process
+    on_catalog_change(lambda *change: outbox.put(("catalog", index, change)))
+    on_user_change(lambda user_id: outbox.put(("user", index, user_id)))
+    sender.use_remote()
+    client = ProxyClient(index, inbox, outbox)
+    register_handlers(client, database_channel, admin_id, mongo_uri, videos_collection, users_collection)
+
+    async def run():
+        # Handlers, Mongo, TMDB and the caches run here; the bot process serves /metrics and /stats for all of them
+        metrics_task = asyncio.create_task(push_snapshots(lambda snapshot: outbox.put(("metrics", index, snapshot)), tmdb=tmdb_client))
+        try:
+            await client.serve()
+        finally:
+            metrics_task.cancel()
+            await tmdb_client.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        close_client()